@@ -0,0 +1,144 @@
+"""Announce cycle throughput of the connector against a local stand-in FDM Monster, over real sockets.
+
+Usage: python -m benchmarks.connector_benchmark [--ticks 500] [--latency-ms 0] [--error-rate 0] [--busy-rate 0]
+                                               [--output result.json] [--compare baseline.json]
+
+A tick is one announce cycle as the engine runs it. ``heartbeat`` ticks reuse the token and send heartbeats,
+``announce`` ticks send full announcements to a server without heartbeat support and ``token`` ticks drop the
+token first so every tick also requests a new one.
+"""
+import argparse
+import gc
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.harness import create_plugin, environment, peak_rss_mb, percentile
+from benchmarks.stub_server import StubFdmMonster
+
+scenarios = ("heartbeat", "announce", "token")
+
+
+def tick(plugin, scenario):
+    if scenario == "token":
+        plugin._token_manager.invalidate()
+    try:
+        plugin._check_fdmmonster()
+        return True
+    except Exception:
+        # Injected failures surface as exceptions, the engine logs and swallows them the same way
+        return False
+
+
+def run(stub, scenario, ticks, memory_ticks):
+    stub.heartbeat = scenario != "announce"
+    folder = tempfile.mkdtemp(prefix=f"fdm-connector-benchmark-{scenario}-")
+    plugin = create_plugin(stub.url, folder)
+    try:
+        # First tick fetches the token and sends the first full announcement
+        tick(plugin, scenario)
+        stub.reset_counters()
+
+        durations = []
+        failures = 0
+        started = time.perf_counter()
+        for _ in range(ticks):
+            tick_started = time.perf_counter()
+            failures += not tick(plugin, scenario)
+            durations.append(time.perf_counter() - tick_started)
+        elapsed = time.perf_counter() - started
+        server_stats = stub.stats()
+
+        # Separate pass, tracing allocations slows the ticks down
+        gc.collect()
+        tracemalloc.start()
+        try:
+            retained_before = tracemalloc.get_traced_memory()[0]
+            for _ in range(memory_ticks):
+                tick(plugin, scenario)
+            gc.collect()
+            retained_after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        client_stats = plugin._http_client.stats()
+        return dict(
+            scenario=scenario,
+            ticks=ticks,
+            failures=failures,
+            ticks_per_second=round(ticks / elapsed, 1),
+            p50_ms=round(percentile(durations, 0.5) * 1000, 3),
+            p99_ms=round(percentile(durations, 0.99) * 1000, 3),
+            max_ms=round(max(durations) * 1000, 3),
+            connections_opened=server_stats["connections"],
+            client_connections_opened=client_stats["connections_opened"],
+            requests=server_stats["requests"],
+            statuses=server_stats["statuses"],
+            retained_bytes_per_tick=round((retained_after - retained_before) / max(memory_ticks, 1), 1),
+            peak_traced_kb=round((peak - retained_before) / 1024, 1),
+            final_state=plugin._state,
+        )
+    finally:
+        plugin.on_shutdown()
+        shutil.rmtree(folder)
+
+
+def compare(results, baseline):
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    lines = [f"compared to {baseline['environment']['plugin_version']} "
+             f"({time.strftime('%Y-%m-%d %H:%M', time.localtime(baseline['environment']['timestamp']))})"]
+    for result in results:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        changes = []
+        for key in ("ticks_per_second", "p50_ms", "p99_ms", "retained_bytes_per_tick"):
+            if before[key]:
+                changes.append(f"{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%")
+        lines.append(f"{result['scenario']:>9}: " + ", ".join(changes))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--memory-ticks", type=int, default=100)
+    parser.add_argument("--scenario", choices=scenarios, action="append", help="default runs all scenarios")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--busy-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    stub = StubFdmMonster(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                          busy_rate=args.busy_rate, drop_rate=args.drop_rate, seed=args.seed)
+    with stub:
+        results = [run(stub, scenario, args.ticks, args.memory_ticks) for scenario in args.scenario or scenarios]
+
+    report = dict(environment=environment(), parameters=vars(args), peak_rss_mb=round(peak_rss_mb(), 1),
+                  results=results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for result in results:
+            print(f"{result['scenario']:>9}: {result['ticks_per_second']:.1f} ticks/s, p50 {result['p50_ms']:.2f} ms, "
+                  f"p99 {result['p99_ms']:.2f} ms, {result['connections_opened']} connections, "
+                  f"{result['retained_bytes_per_tick']:.0f} B retained/tick, {result['failures']} failed")
+        print(f"peak RSS {report['peak_rss_mb']:.1f} MB")
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(results, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
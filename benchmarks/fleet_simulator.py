@@ -0,0 +1,221 @@
+"""Boot a fleet of in-process connector instances at once against one stand-in FDM Monster, like after a power cut.
+
+Usage: python -m benchmarks.fleet_simulator [--printers 2000] [--workers 200] [--time-scale 1]
+                                           [--max-inflight 0] [--no-splay] [--output fleet.json]
+
+Every instance has its own settings, data folder, token and connection pool, limited to one connection per host.
+The token request and the announcements share that connection, a run without injected errors fails when
+``connections_per_printer`` in the report is above one. Instances are ticked the way the engine ticks them, at the
+delays their BackoffScheduler asks for: splayed after boot, backing off after 503s and failures. Delays are
+multiplied by ``time_scale`` to shorten runs, reported times are scaled back to simulated seconds. An instance stops
+ticking once it reached ``State.SLEEP``, its next tick would only be due a ping interval later.
+
+All instances share one interpreter, so the fleet can't tick faster than ``ticks_per_second`` in the report. A herd
+peak close to that rate was capped by the simulator rather than shaped by the splay and backoff. Time spent ticking
+isn't scaled, keep ``time_scale`` at 1 when the ticks themselves take a noticeable part of the run.
+"""
+import argparse
+import heapq
+import json
+import os
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import create_plugin, environment, peak_rss_mb, percentile, quiet_logger
+from benchmarks.stub_server import StubFdmMonster
+from fdm_connector.constants import State
+
+_spark_blocks = " ▁▂▃▄▅▆▇█"
+
+
+class SimulatedPrinter(object):
+    def __init__(self, index, plugin):
+        self.index = index
+        self.plugin = plugin
+        self.ticks = 0
+        self.converged_at = None
+
+    def tick(self):
+        self.ticks += 1
+        try:
+            self.plugin._check_fdmmonster()
+        except Exception:
+            # The engine logs and swallows failed ticks, the scheduler backs off on the state left behind
+            pass
+        return self
+
+
+def raise_open_file_limit(needed):
+    """Each instance and its server side connection take a file descriptor"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        wanted = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        return wanted
+    return soft
+
+
+def boot_fleet(stub, folder, printers, splay):
+    logger = quiet_logger("benchmarks.fdm_connector.fleet")
+    fleet = []
+    for index in range(printers):
+        plugin = create_plugin(stub.url, os.path.join(folder, f"printer-{index:05d}"), octoprint_port=5000 + index,
+                               logger=logger, http_max_connections_per_host=1)
+        if not splay:
+            plugin._scheduler.startup_splay = 0
+        fleet.append(SimulatedPrinter(index, plugin))
+    return fleet
+
+
+def simulate(fleet, workers, time_scale, timeout):
+    """Ticks every printer until all of them reached SLEEP, returns the wall clock seconds it took"""
+    started = time.monotonic()
+    due = []
+    for printer in fleet:
+        heapq.heappush(due, (started + printer.plugin._scheduler.next_delay() * time_scale, printer.index))
+
+    completed = queue.Queue()
+    pending = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while (due or pending) and time.monotonic() - started < timeout:
+            now = time.monotonic()
+            while due and due[0][0] <= now:
+                _, index = heapq.heappop(due)
+                pending += 1
+                executor.submit(fleet[index].tick).add_done_callback(lambda f: completed.put(f.result()))
+
+            wait = min(due[0][0] - now, 0.05) if due else 0.05
+            try:
+                printer = completed.get(timeout=max(wait, 0))
+            except queue.Empty:
+                continue
+            while printer is not None:
+                pending -= 1
+                if printer.plugin._state == State.SLEEP:
+                    printer.converged_at = time.monotonic() - started
+                else:
+                    delay = printer.plugin._scheduler.next_delay() * time_scale
+                    heapq.heappush(due, (time.monotonic() + delay, printer.index))
+                try:
+                    printer = completed.get_nowait()
+                except queue.Empty:
+                    printer = None
+    return time.monotonic() - started
+
+
+def request_rate(request_times, time_scale, bin_secs):
+    """Requests per simulated second, in bins of ``bin_secs`` simulated seconds"""
+    if not request_times:
+        return []
+    bins = [0] * (int(max(request_times) / time_scale / bin_secs) + 1)
+    for request_time in request_times:
+        bins[int(request_time / time_scale / bin_secs)] += 1
+    return [round(count / bin_secs, 1) for count in bins]
+
+
+def sparkline(values, width=72):
+    if not values:
+        return ""
+    step = max(1, -(-len(values) // width))
+    grouped = [max(values[i:i + step]) for i in range(0, len(values), step)]
+    peak = max(grouped) or 1
+    return "".join(_spark_blocks[int(value / peak * (len(_spark_blocks) - 1))] for value in grouped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=200, help="instances ticking at the same time")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="wall clock seconds per simulated second")
+    parser.add_argument("--timeout", type=float, default=600, help="simulated seconds before giving up")
+    parser.add_argument("--bin-secs", type=float, default=1.0, help="simulated seconds per request rate bin")
+    parser.add_argument("--no-splay", action="store_true", help="boot without the startup splay, as a worst case")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--max-inflight", type=int, default=0, help="server capacity, 0 is unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    open_files = raise_open_file_limit(2 * args.printers + 256)
+    stub = StubFdmMonster(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                          max_inflight=args.max_inflight, seed=args.seed)
+    folder = tempfile.mkdtemp(prefix="fdm-connector-fleet-")
+    fleet = []
+    try:
+        with stub:
+            boot_started = time.perf_counter()
+            fleet = boot_fleet(stub, folder, args.printers, not args.no_splay)
+            boot_seconds = time.perf_counter() - boot_started
+
+            stub.reset_counters()
+            wall_seconds = simulate(fleet, args.workers, args.time_scale, args.timeout * args.time_scale)
+            server_stats = stub.stats()
+            request_times = list(stub.request_times)
+            client_connections = sum(printer.plugin._http_client.stats()["connections_opened"] for printer in fleet)
+    finally:
+        for printer in fleet:
+            printer.plugin.on_shutdown()
+        shutil.rmtree(folder)
+
+    converged = [printer.converged_at / args.time_scale for printer in fleet if printer.converged_at is not None]
+    rate = request_rate(request_times, args.time_scale, args.bin_secs)
+    ticks = [printer.ticks for printer in fleet]
+    report = dict(
+        environment=environment(),
+        parameters=vars(args),
+        open_file_limit=open_files,
+        boot_seconds=round(boot_seconds, 2),
+        wall_seconds=round(wall_seconds, 2),
+        converged=len(converged),
+        not_converged=len(fleet) - len(converged),
+        convergence_secs=round(max(converged), 2) if converged else None,
+        convergence_p50_secs=round(percentile(converged, 0.5), 2) if converged else None,
+        convergence_p99_secs=round(percentile(converged, 0.99), 2) if converged else None,
+        ticks_total=sum(ticks),
+        ticks_max=max(ticks) if ticks else 0,
+        ticks_per_second=round(sum(ticks) / wall_seconds, 1) if wall_seconds else None,
+        peak_requests_per_second=max(rate) if rate else 0,
+        peak_inflight=server_stats["peak_inflight"],
+        requests=server_stats["requests"],
+        statuses=server_stats["statuses"],
+        connections=server_stats["connections"],
+        connections_per_printer=round(client_connections / len(fleet), 2) if fleet else None,
+        peak_rss_mb=round(peak_rss_mb(), 1),
+        request_rate=rate,
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(args, report, rate)
+    # Failed requests may drop their connection, only a clean run must keep a single one
+    if not args.error_rate and report["connections_per_printer"] is not None and report["connections_per_printer"] > 1:
+        sys.exit(f"Instances opened {report['connections_per_printer']} connections each, expected a single one")
+
+
+def print_report(args, report, rate):
+    print(f"{args.printers} printers booted in {report['boot_seconds']:.1f}s, "
+          f"{report['converged']} reached sleep within {report['convergence_secs']} simulated seconds "
+          f"(p50 {report['convergence_p50_secs']}s, p99 {report['convergence_p99_secs']}s)")
+    print(f"herd peak {report['peak_requests_per_second']:.0f} requests/s, {report['peak_inflight']} in flight, "
+          f"{report['ticks_total']} ticks ({report['ticks_per_second']:.0f}/s), at most {report['ticks_max']} for one "
+          f"printer")
+    print(f"requests {report['requests']}")
+    print(f"statuses {report['statuses']}, {report['connections']} connections "
+          f"({report['connections_per_printer']} per printer), peak RSS {report['peak_rss_mb']:.1f} MB")
+    print(f"requests/s |{sparkline(rate)}|")
+
+
+if __name__ == "__main__":
+    main()
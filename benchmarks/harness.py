@@ -0,0 +1,89 @@
+"""Plugin instances wired to plain in-memory settings, for driving the connector outside of OctoPrint"""
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+
+from fdm_connector import FdmConnectorPlugin, __plugin_version__
+
+
+class FakeSettings(object):
+    """The part of OctoPrint's PluginSettings the connector uses, backed by dicts"""
+
+    def __init__(self, values, global_values=None):
+        self.values = dict(values)
+        self.global_values = dict(global_values or {})
+        self.saves = 0
+        # Read as settings.settings.last_modified
+        self.settings = self
+        self.last_modified = time.time()
+
+    def get(self, path):
+        return self.values.get(path[0])
+
+    def get_int(self, path):
+        value = self.values.get(path[0])
+        return None if value is None else int(value)
+
+    def set(self, path, value):
+        self.values[path[0]] = value
+
+    def save(self):
+        self.saves += 1
+
+    def global_get(self, path):
+        return self.global_values.get(tuple(path))
+
+    def global_get_int(self, path):
+        value = self.global_values.get(tuple(path))
+        return None if value is None else int(value)
+
+
+def quiet_logger(name, verbose=False):
+    logger = logging.getLogger(name)
+    logger.propagate = verbose
+    if not verbose:
+        logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.CRITICAL)
+    return logger
+
+
+def create_plugin(base_url, data_folder, octoprint_port=5000, logger=None, **settings):
+    """Plugin announcing to ``base_url`` with its persisted data in ``data_folder``, initialized like OctoPrint
+    does before startup and with the settings applied to its HTTP client, as on_after_startup would"""
+    scheme_host, _, port = base_url.rpartition(":")
+    plugin = FdmConnectorPlugin()
+    values = plugin.get_settings_defaults()
+    values.update(fdm_host=scheme_host, fdm_port=int(port), oidc_client_id="benchmark",
+                  oidc_client_secret="benchmark-secret")
+    values.update(settings)
+    plugin._settings = FakeSettings(values, {("server", "host"): "127.0.0.1", ("server", "port"): octoprint_port})
+    plugin._logger = logger or quiet_logger("benchmarks.fdm_connector")
+    plugin._data_folder = data_folder
+    plugin._plugin_version = __plugin_version__
+    plugin.initialize()
+    # Connection limits, timeouts and the wire encoding, without starting the engine
+    plugin._configure_http_client()
+    return plugin
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def environment():
+    """Identifies a result file, so runs of different versions can be compared"""
+    return dict(plugin_version=__plugin_version__, python=platform.python_version(),
+                implementation=platform.python_implementation(), platform=platform.platform(),
+                cpus=os.cpu_count(), timestamp=int(time.time()))
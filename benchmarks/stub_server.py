@@ -0,0 +1,253 @@
+"""Local stand-in for the FDM Monster routes the connector calls, with injectable latency and errors.
+
+Usage: python -m benchmarks.stub_server [--port 4000] [--latency-ms 0] [--error-rate 0] [--busy-rate 0]
+                                        [--max-inflight 0] [--wire-encoding gzip]
+
+The token route accepts any client credentials. ``error_rate`` answers 500, ``busy_rate`` answers 503 with a
+``Retry-After`` header and ``drop_rate`` closes the connection without answering, each drawn per request. With
+``max_inflight`` set, requests beyond that many concurrent ones are answered 503 like an overloaded server would.
+``wire_encodings`` are listed in the version response, bodies in any other encoding are answered 415.
+"""
+import argparse
+import gzip
+import json
+import random
+import string
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fdm_connector.wire import WireEncoding, compact_content_type, unpack_compact
+
+token_route = "/api/plugins/oidc/token"
+version_route = "/api/version"
+announce_route = "/api/plugins/octoprint/announce"
+announce_batch_route = "/api/plugins/octoprint/announce-batch"
+heartbeat_route = "/api/plugins/octoprint/heartbeat"
+telemetry_route = "/api/plugins/octoprint/telemetry"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FdmMonsterStub/1"
+    # Headers and body are separate writes, with Nagle each response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        stub.record_received(len(self.raw_requestline) + len(str(self.headers)) + length)
+        status, payload, headers = stub.respond(self.command, self.path.split("?")[0], body,
+                                                self.headers.get("Content-Type"), self.headers.get("Content-Encoding"))
+        if status is None:
+            # Injected drop, the client sees a reset connection
+            self.close_connection = True
+            return
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubHttpServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, stub, address):
+        self.stub = stub
+        super().__init__(address, _StubHandler)
+
+    def process_request(self, request, client_address):
+        self.stub.record_connection()
+        super().process_request(request, client_address)
+
+
+class StubFdmMonster(object):
+    """Threaded HTTP server answering the token, announce, heartbeat, telemetry and version routes"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, busy_rate=0.0,
+                 drop_rate=0.0, max_inflight=0, heartbeat=True, token_lifetime=3600, wire_encodings=(), seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.busy_rate = busy_rate
+        self.drop_rate = drop_rate
+        self.max_inflight = max_inflight
+        # Without heartbeat support the connector falls back to full announcements every tick
+        self.heartbeat = heartbeat
+        self.token_lifetime = token_lifetime
+        self.wire_encodings = tuple(wire_encodings)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._clock = time.monotonic
+        self._started_at = None
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.connections = 0
+        # Request line, headers and body as received, the bytes on the wire before TLS
+        self.received_bytes = 0
+        # Last decoded request body per path
+        self.payloads = {}
+        self.inflight = 0
+        self.peak_inflight = 0
+        # Monotonic request times, the fleet simulator bins them into a request rate
+        self.request_times = []
+        self._server = _StubHttpServer(self, (host, port))
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._started_at = self._clock()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fdm-monster-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_received(self, size):
+        with self._lock:
+            self.received_bytes += size
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+            self.statuses.clear()
+            self.connections = 0
+            self.received_bytes = 0
+            self.peak_inflight = self.inflight
+            self.request_times = []
+            self._started_at = self._clock()
+
+    def stats(self):
+        with self._lock:
+            return dict(requests=dict(self.requests), statuses={str(k): v for k, v in self.statuses.items()},
+                        connections=self.connections, peak_inflight=self.peak_inflight,
+                        received_bytes=self.received_bytes)
+
+    def decode(self, body, content_type, content_encoding):
+        """Request body as sent by the connector, None when it used an encoding which wasn't offered"""
+        if not body:
+            return None
+        if content_type == compact_content_type:
+            return unpack_compact(body) if WireEncoding.COMPACT in self.wire_encodings else None
+        if content_encoding in (WireEncoding.GZIP, WireEncoding.DEFLATE):
+            if content_encoding not in self.wire_encodings:
+                return None
+            body = gzip.decompress(body) if content_encoding == WireEncoding.GZIP else zlib.decompress(body)
+        return json.loads(body)
+
+    def respond(self, method, path, body, content_type=None, content_encoding=None):
+        """Status, JSON payload and extra headers of a request, a None status drops the connection"""
+        with self._lock:
+            self.requests[path] += 1
+            self.request_times.append(self._clock() - self._started_at)
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+            overloaded = 0 < self.max_inflight < self.inflight
+            draw = self._random.random()
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0.0)
+        try:
+            if overloaded:
+                status, payload, headers = 503, {"error": "overloaded"}, (("Retry-After", "1"),)
+            else:
+                if delay:
+                    time.sleep(delay)
+                status, payload, headers = self._route(method, path, draw)
+                if status == 200 and method == "POST" and path != token_route:
+                    decoded = self.decode(body, content_type, content_encoding)
+                    if decoded is None and body:
+                        status, payload, headers = 415, {"error": "unsupported encoding"}, ()
+                    with self._lock:
+                        self.payloads[path] = decoded
+        finally:
+            with self._lock:
+                self.inflight -= 1
+        with self._lock:
+            self.statuses[status or "dropped"] += 1
+        return status, payload, headers
+
+    def _route(self, method, path, draw):
+        if draw < self.drop_rate:
+            return None, None, ()
+        draw -= self.drop_rate
+        if draw < self.error_rate:
+            return 500, {"error": "injected failure"}, ()
+        draw -= self.error_rate
+        if draw < self.busy_rate:
+            return 503, {"error": "injected overload"}, (("Retry-After", "1"),)
+
+        if method == "GET" and path == version_route:
+            return 200, {"version": "stub", "isDockerContainer": False,
+                         "wireEncodings": list(self.wire_encodings)}, ()
+        if method == "POST" and path == token_route:
+            token = "".join(self._random.choice(string.ascii_letters) for _ in range(43))
+            return 200, {"access_token": token, "expires_in": self.token_lifetime, "token_type": "Bearer",
+                         "scope": "openid"}, ()
+        if method == "POST" and path == heartbeat_route and not self.heartbeat:
+            return 404, {"error": "not found"}, ()
+        if method == "POST" and path in (announce_route, announce_batch_route, heartbeat_route, telemetry_route):
+            return 200, {}, ()
+        return 404, {"error": "not found"}, ()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--busy-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--max-inflight", type=int, default=0, help="concurrent requests before answering 503")
+    parser.add_argument("--wire-encoding", action="append", help="offered encodings",
+                        choices=(WireEncoding.GZIP, WireEncoding.DEFLATE, WireEncoding.COMPACT))
+    args = parser.parse_args()
+
+    stub = StubFdmMonster(args.host, args.port, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                          error_rate=args.error_rate, busy_rate=args.busy_rate, drop_rate=args.drop_rate,
+                          max_inflight=args.max_inflight, wire_encodings=args.wire_encoding or ())
+    with stub:
+        print(f"FDM Monster stub listening on {stub.url}, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    print(json.dumps(stub.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Temperature capture cost and downsampling throughput of the connector, next to a list-of-dicts baseline.
+
+Usage: python -m benchmarks.temperature_benchmark [--heaters 3] [--samples 600] [--bucket-secs 10]
+                                                 [--output temperatures.json]
+
+Fills the capture like OctoPrint's temperature reports would, one report per second with every heater in it, then
+downsamples the full history to min/max/last buckets. The baseline keeps a list of sample dicts per heater and
+reduces it in a plain Python loop, the way the capture would look without the typed arrays.
+"""
+import argparse
+import gc
+import json
+import math
+import random
+import time
+import tracemalloc
+
+from benchmarks.harness import environment
+from fdm_connector.temperatures import TemperatureCapture
+
+
+def reports(heaters, samples, rng):
+    """Parsed temperature reports as the temperatures.received hook gets them"""
+    names = [f"T{index}" for index in range(heaters - 1)] + ["B"]
+    return [{name: (round(rng.uniform(195, 215), 2), 210.0) for name in names} for _ in range(samples)]
+
+
+def fill_capture(parsed_reports, bucket_secs):
+    clock = [0.0]
+    capture = TemperatureCapture(capacity=len(parsed_reports), bucket_secs=bucket_secs, max_heaters=64,
+                                 clock=lambda: clock[0])
+    for parsed in parsed_reports:
+        capture.on_temperatures_received(None, parsed)
+        clock[0] += 1.0
+    return capture, clock[0]
+
+
+def baseline_downsample(history, bucket_secs):
+    buckets = []
+    for heater, samples in history.items():
+        current = None
+        for sample in samples:
+            bucket = math.floor(sample["t"] / bucket_secs)
+            if current is None or current[0] != bucket:
+                current = [bucket, sample["t"], sample["actual"], sample["actual"], sample["actual"], sample["target"]]
+                buckets.append((heater, current))
+            else:
+                current[1] = sample["t"]
+                current[2] = min(current[2], sample["actual"])
+                current[3] = max(current[3], sample["actual"])
+                current[4] = sample["actual"]
+                current[5] = sample["target"]
+    return buckets
+
+
+def fill_baseline(parsed_reports):
+    history = {}
+    for second, parsed in enumerate(parsed_reports):
+        for heater, (actual, target) in parsed.items():
+            history.setdefault(heater, []).append(dict(t=float(second), actual=actual, target=target))
+    return history
+
+
+def cpu_per_run(func, min_cpu_seconds):
+    repeats = 0
+    started = time.process_time()
+    while True:
+        func()
+        repeats += 1
+        elapsed = time.process_time() - started
+        if elapsed >= min_cpu_seconds and repeats >= 3:
+            return elapsed / repeats
+
+
+def traced_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--heaters", type=int, default=3)
+    parser.add_argument("--samples", type=int, default=600, help="reports per heater, the capture's capacity")
+    parser.add_argument("--bucket-secs", type=float, default=10)
+    parser.add_argument("--min-cpu-ms", type=float, default=500, help="CPU time spent per measurement")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    parsed_reports = reports(args.heaters, args.samples, random.Random(args.seed))
+    total_samples = args.heaters * args.samples
+    min_cpu = args.min_cpu_ms / 1000
+
+    capture, end = fill_capture(parsed_reports, args.bucket_secs)
+    buckets = len(capture.collect(now=end + args.bucket_secs))
+    hook_seconds = cpu_per_run(lambda: fill_capture(parsed_reports, args.bucket_secs), min_cpu) / args.samples
+
+    def downsample_full():
+        filled, filled_end = fill_capture(parsed_reports, args.bucket_secs)
+        started = time.process_time()
+        filled.collect(now=filled_end + args.bucket_secs)
+        return time.process_time() - started
+
+    # The fill is excluded, only the collect is timed
+    timings = []
+    cpu_per_run(lambda: timings.append(downsample_full()), min_cpu)
+    downsample_seconds = min(timings)
+
+    history = fill_baseline(parsed_reports)
+    baseline_buckets = len(baseline_downsample(history, args.bucket_secs))
+    baseline_seconds = cpu_per_run(lambda: baseline_downsample(history, args.bucket_secs), min_cpu)
+
+    report = dict(
+        environment=environment(),
+        parameters=vars(args),
+        samples=total_samples,
+        buckets=buckets,
+        hook_us_per_report=round(hook_seconds * 1e6, 2),
+        downsample_ms=round(downsample_seconds * 1000, 3),
+        downsample_samples_per_second=round(total_samples / downsample_seconds),
+        baseline_downsample_ms=round(baseline_seconds * 1000, 3),
+        baseline_samples_per_second=round(total_samples / baseline_seconds),
+        bytes_per_heater=round(traced_bytes(lambda: fill_capture(parsed_reports, args.bucket_secs)) / args.heaters),
+        baseline_bytes_per_heater=round(traced_bytes(lambda: fill_baseline(parsed_reports)) / args.heaters),
+    )
+    assert baseline_buckets == buckets, (baseline_buckets, buckets)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{total_samples} samples of {args.heaters} heaters into {buckets} buckets of {args.bucket_secs:g}s")
+    print(f"capture:   {report['hook_us_per_report']:.2f} us per report, {report['bytes_per_heater']} B per heater")
+    print(f"downsample {report['downsample_ms']:.3f} ms ({report['downsample_samples_per_second']:,} samples/s), "
+          f"baseline {report['baseline_downsample_ms']:.3f} ms "
+          f"({report['baseline_samples_per_second']:,} samples/s, {report['baseline_bytes_per_heater']} B per heater)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Throughput and peak memory of the resumable G-code upload route, served like OctoPrint serves it.
+
+Usage: python -m benchmarks.transfer_benchmark [--size-mb 256] [--chunk-mb 4] [--json]
+
+The upload route runs behind OctoPrint's Tornado server, its UploadStorageFallbackHandler and WSGI container, with the
+request size limits of the plugin's bodysize hook. ``raw`` sends the chunks as request body, which OctoPrint holds in
+memory before the route runs, ``multipart`` as ``file`` field, which OctoPrint spools to a temp file first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import flask
+import requests
+
+from benchmarks.harness import create_plugin, peak_rss_mb
+from fdm_connector.constants import Config
+
+_block = bytes(range(256)) * 256
+
+
+class FakeFileManager(object):
+    """The part of OctoPrint's file manager the upload route uses, keeping the completed file in ``folder``"""
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def sanitize_name(self, destination, name):
+        return name
+
+    def add_file(self, destination, path, file_object, allow_overwrite=False):
+        file_object.save(os.path.join(self.folder, path))
+        return path
+
+
+class UploadServer(object):
+    """The plugin's upload route behind OctoPrint's request path, on its own thread and event loop"""
+
+    def __init__(self, plugin, folder):
+        self.plugin = plugin
+        self.folder = folder
+        self.port = None
+        self._loop = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="transfer-benchmark-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+        return f"http://127.0.0.1:{self.port}/plugin/fdm_connector"
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self):
+        import tornado.ioloop
+        import tornado.netutil
+        import tornado.web
+        from octoprint.server.util.tornado import CustomHTTPServer, UploadStorageFallbackHandler, WsgiInputContainer
+
+        app = flask.Flask(__name__)
+        app.add_url_rule("/plugin/fdm_connector/files/upload/<upload_id>", view_func=self.plugin.upload_file_chunk,
+                         methods=["POST"])
+
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self._loop = asyncio.get_event_loop()
+        tornado.ioloop.IOLoop.current()
+        handlers = [(r".*", UploadStorageFallbackHandler, dict(
+            fallback=WsgiInputContainer(app.wsgi_app, executor=ThreadPoolExecutor(thread_name_prefix="WsgiRequestHandler")),
+            file_prefix="octoprint-file-upload-", file_suffix=".tmp", path=self.folder,
+            suffixes=dict(name="name", path="path")
+        ))]
+        # Registered like OctoPrint registers the entries of the octoprint.server.http.bodysize hook
+        max_body_sizes = [(method, f"/plugin/fdm_connector/{route.lstrip('/')}", size)
+                          for method, route, size in self.plugin.increase_upload_bodysize_hook([])]
+        server = CustomHTTPServer(tornado.web.Application(handlers), max_body_sizes=max_body_sizes,
+                                  default_max_body_size=100 * 1024)
+        sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+        self.port = sockets[0].getsockname()[1]
+        server.add_sockets(sockets)
+        self._started.set()
+        self._loop.run_forever()
+        server.stop()
+
+
+def chunk_body(length):
+    remaining = length
+    while remaining:
+        count = min(remaining, len(_block))
+        yield _block[:count]
+        remaining -= count
+
+
+def run(mode, session, base_url, size, chunk):
+    upload_id = f"benchmark-{mode}"
+    filename = f"benchmark-{mode}.gcode"
+    offset = 0
+    started = time.perf_counter()
+    while offset < size:
+        length = min(chunk, size - offset)
+        url = f"{base_url}/files/upload/{upload_id}?filename={filename}&size={size}"
+        headers = {"Content-Range": f"bytes {offset}-{offset + length - 1}/{size}"}
+        if mode == "multipart":
+            response = session.post(url, headers=headers, files=dict(file=(filename, b"".join(chunk_body(length)))))
+        else:
+            response = session.post(url, headers=headers, data=b"".join(chunk_body(length)))
+        response.raise_for_status()
+        offset = response.json()["offset"]
+    elapsed = time.perf_counter() - started
+    return dict(mode=mode, size_mb=size / 1024 / 1024, chunk_mb=chunk / 1024 / 1024, seconds=round(elapsed, 3),
+                mb_per_second=round(size / 1024 / 1024 / elapsed, 1), peak_rss_mb=round(peak_rss_mb(), 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--chunk-mb", type=int, default=Config.transfer_max_chunk_bytes // 1024 // 1024,
+                        help="request size, larger than the route accepts is answered with 413")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="fdm-transfer-benchmark-")
+    # The plugin manager isn't running, which OctoPrint's file type check relies on
+    valid_file_type = mock.patch("octoprint.filemanager.valid_file_type",
+                                 lambda filename, type=None: filename.endswith(".gcode"))
+    valid_file_type.start()
+    try:
+        plugin = create_plugin("http://127.0.0.1:4000", folder)
+        plugin._settings.global_values.update({("server", "uploads", "nameSuffix"): "name",
+                                               ("server", "uploads", "pathSuffix"): "path"})
+        plugin._reload_settings()
+        plugin._file_manager = FakeFileManager(folder)
+        server = UploadServer(plugin, folder)
+        base_url = server.start()
+        try:
+            baseline = peak_rss_mb()
+            with requests.Session() as session:
+                results = [run(mode, session, base_url, args.size_mb * 1024 * 1024, args.chunk_mb * 1024 * 1024)
+                           for mode in ("raw", "multipart")]
+        finally:
+            server.stop()
+    finally:
+        valid_file_type.stop()
+        shutil.rmtree(folder)
+
+    if args.json:
+        print(json.dumps(dict(baseline_rss_mb=round(baseline, 1), results=results)))
+        return
+    print(f"baseline peak RSS {baseline:.1f} MB")
+    for result in results:
+        print(f"{result['mode']:>9}: {result['size_mb']:.0f} MB in {result['chunk_mb']:.0f} MB chunks in "
+              f"{result['seconds']:.2f}s, {result['mb_per_second']:.1f} MB/s, peak RSS {result['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Bytes on the wire and encode CPU time of telemetry batches per wire encoding and batch size.
+
+Usage: python -m benchmarks.wire_benchmark [--batch-sizes 1,10,50,200,1000] [--output wire.json]
+
+Each batch is encoded in-process to measure the encode CPU time, then sent by a connector instance to a local
+stand-in FDM Monster which offers every encoding. The stand-in counts the request line, headers and body it
+receives, so the wire bytes include the HTTP overhead. Bodies below the connector's minimum encode size go out as
+plain JSON whatever was negotiated, like they do in production.
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.harness import create_plugin, environment
+from benchmarks.stub_server import StubFdmMonster, telemetry_route
+from fdm_connector.wire import WireEncoder, WireEncoding, wire_preference
+
+encodings = (WireEncoding.JSON,) + wire_preference
+
+
+def telemetry_batch(size, rng):
+    """Samples like the connector collects them: heater temperatures and filament used per tool"""
+    started = time.time()
+    samples = []
+    for index in range(size):
+        if index % 4 == 3:
+            samples.append(dict(t=started + index * 0.5, kind="filament", key=index % 2,
+                                value=round(rng.uniform(0, 5000), 2)))
+        else:
+            samples.append(dict(t=started + index * 0.5, kind="temperature", key=("tool0", "tool1", "bed")[index % 3],
+                                value=round(rng.uniform(20, 260), 1)))
+    return {"deviceUuid": "9b1deb4d-3b7d-4bad-9bdd-2b0d7b3dcb6d", "samples": samples}
+
+
+def encode_cpu_seconds(encoding, payload, min_cpu_seconds):
+    """Process CPU time of one encode, averaged over as many encodes as fit ``min_cpu_seconds``"""
+    encoder = WireEncoder(preferred=encoding, min_bytes=0)
+    body, _ = encoder.encode(payload, negotiate=lambda: list(encodings))
+    repeats = 0
+    started = time.process_time()
+    while True:
+        encoder.encode(payload)
+        repeats += 1
+        elapsed = time.process_time() - started
+        if elapsed >= min_cpu_seconds and repeats >= 3:
+            return len(body), elapsed / repeats
+
+
+def wire_bytes(stub, encoding, batches, sends):
+    """Average bytes the stand-in received per telemetry request, checking it decoded the batch as sent"""
+    folder = tempfile.mkdtemp(prefix="fdm-connector-wire-")
+    plugin = create_plugin(stub.url, folder, wire_encoding=encoding, telemetry_enabled=False)
+    try:
+        # Fetches the token and negotiates with the largest batch
+        assert plugin._send_telemetry_batch(batches[-1]["samples"])
+        result = {}
+        for batch in batches:
+            stub.reset_counters()
+            for _ in range(sends):
+                assert plugin._send_telemetry_batch(batch["samples"])
+            assert stub.payloads[telemetry_route]["samples"] == batch["samples"]
+            result[len(batch["samples"])] = stub.stats()["received_bytes"] / sends
+        return result, plugin._wire.status()["encoding"]
+    finally:
+        plugin.on_shutdown()
+        shutil.rmtree(folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-sizes", default="1,10,50,200,1000", help="samples per batch, comma separated")
+    parser.add_argument("--min-cpu-ms", type=float, default=200, help="CPU time spent encoding each batch")
+    parser.add_argument("--sends", type=int, default=20, help="requests per batch over the socket")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes = sorted(int(size) for size in args.batch_sizes.split(","))
+    batches = [telemetry_batch(size, rng) for size in sizes]
+
+    results = []
+    with StubFdmMonster(wire_encodings=wire_preference) as stub:
+        for encoding in encodings:
+            sent, negotiated = wire_bytes(stub, encoding, batches, args.sends)
+            for size, batch in zip(sizes, batches):
+                body_bytes, cpu_seconds = encode_cpu_seconds(encoding, batch, args.min_cpu_ms / 1000)
+                results.append(dict(encoding=encoding, negotiated=negotiated, batch_size=size, body_bytes=body_bytes,
+                                    wire_bytes=round(sent[size]), encode_us=round(cpu_seconds * 1e6, 1)))
+
+    plain = {result["batch_size"]: result for result in results if result["encoding"] == WireEncoding.JSON}
+    for result in results:
+        result["wire_ratio"] = round(result["wire_bytes"] / plain[result["batch_size"]]["wire_bytes"], 3)
+
+    report = dict(environment=environment(), parameters=vars(args), results=results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{'samples':>8} {'encoding':>10} {'body B':>9} {'wire B':>9} {'vs json':>8} {'encode us':>10}")
+    for result in sorted(results, key=lambda r: (r["batch_size"], encodings.index(r["encoding"]))):
+        print(f"{result['batch_size']:>8} {result['encoding']:>10} {result['body_bytes']:>9} "
+              f"{result['wire_bytes']:>9} {result['wire_ratio']:>8.3f} {result['encode_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,48 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
-import io
+import asyncio
 import json
+import math
 import os
+import threading
+import time
 import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from urllib.parse import urljoin
+from functools import partial
+from urllib.parse import urljoin, urlparse
 
 import flask
 import octoprint.plugin
 import requests
 from flask import request
-from octoprint.util import RepeatedTimer
 
+from fdm_connector.announcement import AnnouncementTracker, AnnounceMode, payload_hash
+from fdm_connector.breaker import CircuitBreaker
 from fdm_connector.constants import Errors, State, Config, Keys
-
-
-def is_docker():
-    path = '/proc/self/cgroup'
-    return (
-            os.path.exists('/.dockerenv') or
-            os.path.isfile(path) and any('docker' in line for line in open(path))
-    )
+from fdm_connector.engine import ConnectorEngine
+from fdm_connector.environment import EnvironmentProbe, is_docker  # noqa: F401
+from fdm_connector.http_client import FdmHttpClient
+from fdm_connector.metrics import ConnectorMetrics
+from fdm_connector.pedometer import FilamentPedometer
+from fdm_connector.persistence import PersistedDataStore, LoadResult
+from fdm_connector.scheduler import BackoffScheduler
+from fdm_connector.settings import SettingsSnapshot
+from fdm_connector.status import StatusPusher, fields_for_event, status_events
+from fdm_connector.temperatures import TemperatureCapture
+from fdm_connector.token_manager import TokenManager
+from fdm_connector.transfer import TransferError, UploadTransfers
+from fdm_connector.wire import WireEncoder, WireEncoding
 
 
 fdm_announce_route = 'api/plugins/octoprint/announce'
+fdm_heartbeat_route = 'api/plugins/octoprint/heartbeat'
+fdm_announce_batch_route = 'api/plugins/octoprint/announce-batch'
+fdm_telemetry_route = 'api/plugins/octoprint/telemetry'
+fdm_status_route = 'api/plugins/octoprint/status'
+fdm_snapshot_route = 'api/plugins/octoprint/snapshot'
+fdm_tunnel_route = 'api/plugins/octoprint/tunnel'
 fdm_access_token_route = 'api/plugins/oidc/token'
 fdm_version_route = 'api/version'
 requested_scopes = 'openid'
@@ -38,33 +55,228 @@ class FdmConnectorPlugin(
     octoprint.plugin.BlueprintPlugin,
     octoprint.plugin.SettingsPlugin,
     octoprint.plugin.AssetPlugin,
+    octoprint.plugin.EventHandlerPlugin,
 ):
     def __init__(self):
         self._ping_worker = None
-        # device UUID and OIDC opaque access_token + metadata
-        self._persisted_data = dict()
+        # Immutable copy of the settings, replaced as a whole on every settings save
+        self._settings_snapshot = None
+        # Background asyncio loop running every periodic connector task
+        self._engine = ConnectorEngine()
+        # Next tick delay: regular ping interval, startup splay or jittered backoff depending on the state
+        self._scheduler = BackoffScheduler(lambda: self._state, Config.default_ping_secs)
+        # device UUID and OIDC opaque access_token + metadata, cached in memory and written atomically
+        self._persistence = PersistedDataStore()
+        self._persisted_data = self._persistence.data
+        self._persisted_data_loaded = threading.Event()
+        self._load_lock = threading.Lock()
         self._excluded_persistence_datapath = None
         self._state = State.BOOT
+        self._state_lock = threading.Lock()
+        # Latency histograms and outcome counters, served by the metrics route
+        self._metrics = ConnectorMetrics()
+        # Pooled keep-alive client used for every FDM Monster call
+        self._http_client = FdmHttpClient(metrics=self._metrics)
+        # One circuit breaker per FDM Monster endpoint, calls fail fast while an endpoint keeps failing
+        self._breakers = {endpoint: CircuitBreaker(endpoint) for endpoint in Config.breaker_endpoints}
+        # Request body encoding negotiated with FDM Monster, plain JSON until a large body needs it
+        self._wire = WireEncoder()
+        # In-memory OIDC access_token, refreshed ahead of expiry
+        self._token_manager = TokenManager(self._refresh_access_token, run_in_background=self._run_in_background)
+        # Announced host, port and container facts, recomputed on settings changes
+        self._environment = EnvironmentProbe(self._resolve_octoprint_address, self._settings_last_modified)
+        # Hash of the last acknowledged announcement, unchanged payloads are replaced by heartbeats
+        self._announcements = AnnouncementTracker()
+        # Multi-instance hub mode, None unless enabled in the settings
+        self._hub = None
+        self._batch_announce_supported = True
+        # Filament usage of the G-code sent to the printer, fed by the gcode.sent hook
+        self._pedometer = FilamentPedometer()
+        # Heater temperatures of the temperatures.received hook, downsampled per bucket for the telemetry upload
+        self._temperatures = TemperatureCapture()
+        # Telemetry samples are queued in a bounded buffer and uploaded in batches, created on first use
+        self._telemetry = None
+        self._reported_filament = []
+        # Printer status changes from OctoPrint events, pushed once per debounce window with only the changed fields
+        self._status = StatusPusher(self._send_status)
+        # Append-only log of undelivered announcements and telemetry, opened on first use
+        self._spool = None
+        # Multiplexed tunnel to FDM Monster, None unless enabled in the settings
+        self._tunnel = None
+        self._tunnel_future = None
+        # FDM Monster and OctoPrint addresses of the running tunnel, a change replaces the tunnel
+        self._tunnel_endpoints = None
+        # Resumable G-code uploads pushed by FDM Monster, created on first use
+        self._transfers = None
+        # Settings page probes share in-flight calls and are cached briefly, created on first use
+        self._probes = None
+        # Latest webcam snapshot shared by all viewers, and the keep-alive client fetching it, created on first use
+        self._snapshots = None
+        self._webcam_client = None
+        self._pushed_snapshot_etag = None
+        self._snapshot_capture_failing = False
 
     def on_after_startup(self):
         if self._settings.get(["fdm_host"]) is None:
             self._settings.set(["fdm_host"], Config.default_fdm_host)
         if self._settings.get(["fdm_port"]) is None:
             self._settings.set(["fdm_port"], Config.default_fdm_port)
-        self._get_device_uuid()
+        self._ensure_device_uuid()
+        self._reload_settings()
+        self._configure_http_client()
+        self._configure_hub()
         self._start_periodic_check()
+        # Container detection reads a handful of files, it doesn't need to hold up OctoPrint's startup
+        self._run_in_background(self._environment.refresh)
+
+    def on_settings_save(self, data):
+        octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
+        self._reload_settings()
+        self._configure_http_client()
+        self._environment.invalidate()
+        # Picks up a changed webcam URL or interval on the next request
+        self._snapshots = None
+        self._configure_hub()
+        self._configure_tunnel()
+
+    def on_shutdown(self):
+        self._engine.stop()
+        self._ping_worker = None
+        if self._hub is not None:
+            self._hub.release()
+        self._persistence.flush()
+        if self._spool is not None:
+            self._spool.close()
+        self._http_client.close()
+        if self._webcam_client is not None:
+            self._webcam_client.close()
+
+    def _get_settings(self):
+        """Current SettingsSnapshot, read on first use and replaced whenever the settings are saved"""
+        snapshot = self._settings_snapshot
+        if snapshot is None:
+            snapshot = self._reload_settings()
+        return snapshot
+
+    def _reload_settings(self):
+        snapshot = SettingsSnapshot.read(self._settings)
+        # A single attribute store, readers get either the previous or the new snapshot
+        self._settings_snapshot = snapshot
+        if not snapshot.fdm_host_valid:
+            self._logger.warning(f"Setting 'fdm_host' is not a http(s) URL: {self._settings.get(['fdm_host'])}")
+        return snapshot
+
+    def _configure_http_client(self):
+        settings = self._get_settings()
+        self._http_client.configure(
+            connect_timeout=settings.http_connect_timeout,
+            read_timeout=settings.http_read_timeout,
+            max_connections_per_host=settings.http_max_connections_per_host
+        )
+        # The FDM Monster server may have changed, the encoding is negotiated again and the whole status pushed
+        self._wire.reset(settings.wire_encoding)
+        for breaker in self._breakers.values():
+            breaker.reset()
+        self._status.resync()
+
+    def _configure_hub(self):
+        settings = self._get_settings()
+        hub_mode = settings.hub_mode
+        if hub_mode:
+            # Only loaded when hub mode is enabled
+            from fdm_connector.hub import HubCoordinator, default_hub_folder, hub_supported
+        if not hub_mode or not hub_supported():
+            if hub_mode:
+                self._logger.warning("Hub mode is not supported on this platform, announcing standalone")
+            if self._hub is not None:
+                self._hub.release()
+                self._hub = None
+            return
+
+        hub_folder = settings.hub_folder or default_hub_folder()
+        ping_interval = settings.ping or Config.default_ping_secs
+        member_ttl = Config.hub_member_ttl_pings * ping_interval
+        if self._hub is not None and self._hub.folder == hub_folder:
+            self._hub.member_ttl = member_ttl
+            return
+        if self._hub is not None:
+            self._hub.release()
+        self._hub = HubCoordinator(hub_folder, self._get_device_uuid(), member_ttl)
+
+    def _announce_through_hub(self):
+        """True when a sibling instance is the hub, it announces us together with its own announcement"""
+        from fdm_connector.hub import HubFolderError
+
+        try:
+            if self._hub.try_become_hub():
+                return False
+            self._hub.publish(self._build_announcement())
+            return True
+        except HubFolderError as e:
+            self._logger.error(f"{e}, announcing standalone")
+            self._hub.release()
+            self._hub = None
+            return False
+
+    def _configure_tunnel(self):
+        settings = self._get_settings()
+        if not settings.tunnel_enabled or settings.fdm_host is None:
+            self._stop_tunnel()
+            return
+        if not self._engine.running:
+            return
+
+        fdm_url = urlparse(settings.fdm_host)
+        tunnel_port = settings.tunnel_port or settings.fdm_port
+        local_host = settings.server_host
+        if local_host in (None, "", "0.0.0.0", "::"):
+            local_host = "127.0.0.1"
+        endpoints = (fdm_url.hostname, tunnel_port, fdm_url.scheme == "https", local_host, settings.server_port)
+        if self._tunnel is not None:
+            if endpoints == self._tunnel_endpoints:
+                return
+            # FDM Monster or OctoPrint moved, the connection to the old address is dropped
+            self._stop_tunnel()
+
+        # Only loaded when the tunnel is enabled
+        from fdm_connector.tunnel import TunnelClient
+
+        host, port, use_ssl, local_host, local_port = endpoints
+        self._tunnel = TunnelClient(host, port, fdm_tunnel_route, local_host, local_port, self._get_access_token,
+                                    use_ssl=use_ssl)
+        self._tunnel_endpoints = endpoints
+        self._tunnel_future = self._engine.submit(self._tunnel.run_forever)
+
+    def _stop_tunnel(self):
+        if self._tunnel_future is not None:
+            self._tunnel_future.cancel()
+        self._tunnel = self._tunnel_future = self._tunnel_endpoints = None
 
     def get_excluded_persistence_datapath(self):
-        self._excluded_persistence_datapath = os.path.join(self.get_plugin_data_folder(),
-                                                           Config.persisted_data_file)
+        if self._excluded_persistence_datapath is None:
+            self._excluded_persistence_datapath = os.path.join(self.get_plugin_data_folder(),
+                                                               Config.persisted_data_file)
         return self._excluded_persistence_datapath
 
+    def _resolve_octoprint_address(self):
+        # Only called after a settings change, which includes edits of config.yaml bypassing on_settings_save
+        settings = self._reload_settings()
+        octoprint_port = settings.port_override
+        octoprint_host = settings.server_host
+        # TODO maybe let FDM Monster decide instead of swapping ourselves?
+        if octoprint_port is None:
+            # Risk of failure when behind proxy (docker, vm, vpn, rev-proxy)
+            octoprint_port = settings.server_port
+        return octoprint_host, octoprint_port
+
+    def _settings_last_modified(self):
+        # Cheap change signal: a stat of config.yaml, catches edits which bypass on_settings_save
+        return self._settings.settings.last_modified
+
     def get_template_vars(self):
-        fdm_host = self._settings.get(["fdm_host"])
-        fdm_port = self._settings.get(["fdm_port"])
-        base_url = f"{fdm_host}:{fdm_port}"
-        favicon = f"{base_url}/favicon.ico"
-        return dict(url=base_url, of_favicon=favicon)
+        base_url = self._get_settings().fdm_base_url or ""
+        favicon = urljoin(base_url, "favicon.ico")
+        return dict(url=base_url.rstrip("/"), of_favicon=favicon)
 
     def get_template_configs(self):
         return [
@@ -72,7 +284,6 @@ class FdmConnectorPlugin(
             dict(type="navbar", custom_bindings=False)
         ]
 
-    # TODO make http://https:// slash robust
     def get_settings_defaults(self):
         return {
             "fdm_host": None,  # Without adjustment this config value is OFTEN useless
@@ -81,7 +292,20 @@ class FdmConnectorPlugin(
             "device_uuid": None,  # Auto-generated and unique
             "oidc_client_id": None,  # Without adjustment this config value is ALWAYS useless
             "oidc_client_secret": None,  # Without adjustment this config value is ALWAYS useless
-            "ping": Config.default_ping_secs
+            "ping": Config.default_ping_secs,
+            "http_connect_timeout": Config.default_http_connect_timeout,
+            "http_read_timeout": Config.default_http_read_timeout,
+            "http_max_connections_per_host": Config.default_http_max_connections_per_host,
+            "hub_mode": False,  # Let one OctoPrint instance on this host announce all of them
+            "hub_folder": None,  # Private folder of the instances on this host, defaults to one per user in the temp folder
+            "telemetry_enabled": True,
+            "tunnel_enabled": False,  # Serve FDM Monster's OctoPrint API calls over one outbound connection
+            "tunnel_port": None,  # FDM Monster tunnel port, defaults to 'fdm_port'
+            "wire_encoding": "auto",  # Request body encoding: auto, json, gzip, deflate or compact/1
+            "status_push_enabled": True,  # Push printer state changes instead of waiting for FDM Monster to poll
+            "snapshot_url": None,  # Webcam snapshot URL, defaults to OctoPrint's snapshot webcam
+            "snapshot_interval": Config.snapshot_min_interval_secs,  # Seconds a snapshot is served before refetching
+            "snapshot_push_enabled": False  # Push changed webcam snapshots to FDM Monster
         }
 
     def get_settings_version(self):
@@ -97,51 +321,89 @@ class FdmConnectorPlugin(
         )
 
     def initialize(self):
-        self._fetch_persisted_data()
+        # OctoPrint initializes the plugins one after another, reading the data folder is left to a background thread
+        threading.Thread(target=self._preload_persisted_data, name="fdm-connector-load", daemon=True).start()
+
+    def _preload_persisted_data(self):
+        try:
+            self._load_persisted_data()
+        except Exception:
+            self._logger.exception("Could not load the persisted data, retrying on first use")
+
+    def _load_persisted_data(self):
+        """Reads the persisted data and the stored access_token once, called before either is used"""
+        if self._persisted_data_loaded.is_set():
+            return
+        with self._load_lock:
+            if self._persisted_data_loaded.is_set():
+                return
+            self._fetch_persisted_data()
+            self._token_manager.load(self._persisted_data)
+            self._persisted_data_loaded.set()
+
+    def _get_access_token(self):
+        self._load_persisted_data()
+        return self._token_manager.get_token()
 
     def _fetch_persisted_data(self):
         filepath = self.get_excluded_persistence_datapath()
-        if os.path.exists(filepath):
-            try:
-                with io.open(filepath, "r", encoding="utf-8") as f:
-                    persistence_file = f.read()
-                    persistence_json = json.loads(persistence_file)
-                    self._persisted_data = persistence_json
-            except json.decoder.JSONDecodeError as e:
-                self._logger.warning(
-                    "FDM Connector persisted device Id file was of invalid format.")
-                self._write_new_device_uuid(filepath)
-        else:
+        # Only re-reads the file when it was changed on disk
+        result = self._persistence.load(filepath)
+        if result == LoadResult.RECOVERED:
+            self._logger.warning(
+                "FDM Connector persisted device Id file was of invalid format.")
+            if Keys.persistence_uuid_key in self._persisted_data:
+                self._persistence.flush()
+        if Keys.persistence_uuid_key not in self._persisted_data:
             self._write_new_device_uuid(filepath)
+        elif result == LoadResult.MISSING:
+            # Deleted while the data was cached, write the known persistence UUID back instead of losing it
+            self._write_persisted_data(filepath)
+            self._persistence.flush()
+            self._logger.warning("FDM Connector persisted data file was missing and has been written again.")
 
     def _write_new_access_token(self, filepath, at_data):
-        self._persisted_data["access_token"] = at_data["access_token"]
-        self._persisted_data["expires_in"] = at_data["expires_in"]
-        self._persisted_data["requested_at"] = int(datetime.utcnow().timestamp())
+        token_changed = self._token_manager.update(at_data)
+        persisted = {
+            "access_token": at_data["access_token"],
+            "expires_in": at_data["expires_in"],
+            "requested_at": int(datetime.utcnow().timestamp())
+        }
         if "token_type" in at_data.keys():
-            self._persisted_data["token_type"] = at_data["token_type"]
+            persisted["token_type"] = at_data["token_type"]
         if "scope" in at_data.keys():
-            self._persisted_data["scope"] = at_data["scope"]
-        self._write_persisted_data(filepath)
-        self._logger.info("FDM Connector persisted data file was updated (access_token)")
+            persisted["scope"] = at_data["scope"]
+        self._persistence.update(persisted)
+        if token_changed:
+            self._write_persisted_data(filepath)
+            self._logger.info("FDM Connector persisted data file was updated (access_token)")
 
     def _write_new_device_uuid(self, filepath):
         persistence_uuid = str(uuid.uuid4())
-        self._persisted_data[Keys.persistence_uuid_key] = persistence_uuid
+        self._persistence.update({Keys.persistence_uuid_key: persistence_uuid})
         self._write_persisted_data(filepath)
+        # The persistence UUID identifies this installation, don't wait for the debounced write
+        self._persistence.flush()
         self._logger.info("FDM Connector persisted data file was updated (device_uuid).")
 
     def _write_persisted_data(self, filepath):
-        with io.open(filepath, "w", encoding="utf-8") as f:
-            f.write(json.dumps(self._persisted_data))
+        self._persistence.write(filepath)
+
+    def _ensure_device_uuid(self):
+        # Generated and saved during startup, the engine threads only read it from the settings snapshot
+        if self._settings.get([Keys.device_uuid_key]) is None:
+            self._settings.set([Keys.device_uuid_key], str(uuid.uuid4()))
+            self._settings.save()
 
     def _get_device_uuid(self):
-        device_uuid = self._settings.get([Keys.device_uuid_key])
-        if device_uuid is None:
+        settings = self._get_settings()
+        if settings.device_uuid is None:
+            # Only happens before on_after_startup, the next settings save persists it
             device_uuid = str(uuid.uuid4())
             self._settings.set([Keys.device_uuid_key], device_uuid)
-            self._settings.save()
-        return device_uuid
+            self._settings_snapshot = settings._replace(device_uuid=device_uuid)
+            return device_uuid
+        return settings.device_uuid
 
     def get_update_information(self):
         # Define the configuration for your plugin to use with the Software Update
@@ -165,150 +427,479 @@ class FdmConnectorPlugin(
 
     def _start_periodic_check(self):
         if self._ping_worker is None:
-            ping_interval = self._settings.get_int(["ping"])
+            settings = self._get_settings()
+            ping_interval = settings.ping
             if ping_interval:
-                self._ping_worker = RepeatedTimer(
-                    ping_interval, self._check_fdmmonster, run_first=True
+                self._scheduler.interval = ping_interval
+                self._engine.start()
+                self._ping_worker = self._engine.schedule_periodic(
+                    "announce", self._check_fdmmonster, self._scheduler.next_delay,
+                    deadline=self._call_deadline(2), run_first=False
                 )
-                self._ping_worker.start()
+                # Nothing drains the capture without telemetry
+                self._temperatures.enabled = settings.telemetry_enabled
+                if settings.telemetry_enabled:
+                    self._engine.schedule_periodic("telemetry", self._telemetry_tick, Config.telemetry_check_secs,
+                                                   run_first=False)
+                self._engine.schedule_periodic("spool", self._spool_tick, Config.spool_check_secs, run_first=False)
+                self._engine.schedule_periodic("transfers", self._purge_stale_transfers, Config.transfer_cleanup_secs)
+                if settings.snapshot_push_enabled:
+                    self._engine.schedule_periodic("snapshots", self._push_snapshot, Config.snapshot_push_secs,
+                                                   deadline=self._call_deadline(2), run_first=False)
+                # Events received before the engine ran opened a debounce window nobody scheduled
+                self._engine.submit(self._push_status, self._status.debounce)
+                self._configure_tunnel()
             else:
                 return self._logger.error(Errors.ping_setting_unset)
 
-    def _check_fdmmonster(self):
-        fdm_host = self._settings.get(["fdm_host"])
-        fdm_port = self._settings.get(["fdm_port"])
+    def _set_state(self, state):
+        """Atomic state transition, returns the previous state"""
+        with self._state_lock:
+            previous, self._state = self._state, state
+        self._metrics.record_transition(previous, state)
+        return previous
+
+    def _call_deadline(self, calls):
+        # Abandon a task once all its HTTP calls could have timed out, plus some slack
+        connect_timeout, read_timeout = self._http_client.timeout
+        return calls * (connect_timeout + read_timeout) + Config.engine_deadline_slack_secs
+
+    def _is_server_busy(self, response):
+        if response.status_code not in Config.retry_status_codes:
+            return False
+        self._scheduler.record_retry_after(response.headers.get("Retry-After"))
+        self._set_state(State.RETRY)
+        return True
+
+    def _retry_after_circuit(self, endpoint):
+        # FDM Monster is unreachable, the next tick waits at least until the circuit lets a probe through
+        self._scheduler.record_retry_after(math.ceil(self._breakers[endpoint].retry_in()))
+        self._set_state(State.RETRY)
+
+    def _get_telemetry(self):
+        if self._telemetry is None:
+            # Not loaded when telemetry is disabled
+            from fdm_connector.telemetry import TelemetryBuffer, TelemetryUploader
+            self._telemetry = TelemetryUploader(TelemetryBuffer(), self._send_telemetry_batch,
+                                                spill=self._spool_telemetry)
+        return self._telemetry
+
+    async def _telemetry_tick(self):
+        # Runs on the engine loop, only hops to a worker thread when there is a batch to send
+        self._collect_filament_telemetry()
+        self._collect_temperature_telemetry()
+        telemetry = self._get_telemetry()
+        if telemetry.should_flush():
+            await self._engine.run(telemetry.flush, deadline=self._call_deadline(2))
+
+    def _collect_filament_telemetry(self):
+        extruded = self._pedometer.extruded
+        retracted = self._pedometer.retracted
+        for tool in range(len(extruded)):
+            used = extruded[tool] - retracted[tool]
+            if tool >= len(self._reported_filament):
+                self._reported_filament.append(0.0)
+            if used != self._reported_filament[tool]:
+                self._reported_filament[tool] = used
+                self._get_telemetry().push("filament", tool, used)
+
+    def _collect_temperature_telemetry(self):
+        buckets = self._temperatures.collect()
+        if buckets:
+            telemetry = self._get_telemetry()
+            for heater, (timestamp, low, high, last, target) in buckets:
+                telemetry.push("temperature", heater, [low, high, last, target], timestamp)
+
+    def _send_telemetry_batch(self, samples):
+        base_url = self._get_settings().fdm_base_url
+        if base_url is None:
+            return False
 
-        if fdm_host is not None and fdm_port is not None:
-            base_url = f"{fdm_host}:{fdm_port}"
+        # Hub siblings don't keep a token for announcing, fetch one for telemetry
+        self._load_persisted_data()
+        access_token = self._token_manager.get_or_refresh()
+        if access_token is None:
+            return False
+
+        url = urljoin(base_url, fdm_telemetry_route)
+        headers = {'Authorization': 'Bearer ' + access_token}
+        telemetry_data = {"deviceUuid": self._get_device_uuid(), "samples": samples}
+        try:
+            response = self._post_payload(url, headers, telemetry_data, "telemetry")
+        except requests.exceptions.RequestException as e:
+            self._logger.warning(f"Error sending telemetry to FDM Monster: {e}")
+            return False
+
+        if response.status_code in (404, 405):
+            self._logger.info("FDM Monster does not accept telemetry, telemetry disabled")
+            self._get_telemetry().disable()
+            return True
+        return 200 <= response.status_code < 300
+
+    def on_event(self, event, payload):
+        # Runs on OctoPrint's event thread, only merges the fields and leaves the push to the engine
+        if event not in status_events or not self._get_settings().status_push_enabled:
+            return
+        if self._status.update(fields_for_event(event, payload)) and self._engine.running:
+            self._engine.submit(self._push_status, self._status.debounce)
+
+    async def _push_status(self, delay):
+        # One coroutine per debounce window, events arriving meanwhile are merged into the same push
+        while delay is not None:
+            await asyncio.sleep(delay)
+            try:
+                delay = await self._engine.run(self._status.flush, deadline=self._call_deadline(2))
+            except asyncio.TimeoutError:
+                self._logger.warning("Pushing the printer status to FDM Monster exceeded its deadline")
+                return
+
+    def _send_status(self, fields):
+        base_url = self._get_settings().fdm_base_url
+        if base_url is None:
+            return False
 
-            # OIDC client_credentials flow result
-            access_token = self._persisted_data.get("access_token", None)
-            requested_at = self._persisted_data.get("requested_at", None)
-            expires = self._persisted_data.get("expires", None)
+        self._load_persisted_data()
+        access_token = self._token_manager.get_or_refresh()
+        if access_token is None:
+            return False
 
-            # Token expiry check - prone to time desync
-            is_expired = None
-            if requested_at is not None and expires is not None:
-                current_time = datetime.utcnow().timestamp()
-                is_expired = current_time > requested_at + expires
+        url = urljoin(base_url, fdm_status_route)
+        headers = {'Authorization': 'Bearer ' + access_token}
+        try:
+            response = self._post_payload(url, headers, {"deviceUuid": self._get_device_uuid(), "status": fields},
+                                          "status")
+        except requests.exceptions.RequestException as e:
+            self._logger.warning(f"Error pushing the printer status to FDM Monster: {e}")
+            return False
 
-            token_invalid = not access_token or is_expired
+        if response.status_code in (404, 405):
+            self._logger.info("FDM Monster does not accept status pushes, status push disabled")
+            self._status.disable()
+            return False
+        if response.status_code == 409:
+            self._logger.info("FDM Monster requested the whole printer status")
+            self._status.resync()
+            return False
+        return 200 <= response.status_code < 300
+
+    def _get_spool(self):
+        if self._spool is None:
+            # Only loaded once something couldn't be delivered
+            from fdm_connector.spool import OfflineSpool
+            self._spool = OfflineSpool(os.path.join(self.get_plugin_data_folder(), Config.spool_folder))
+            self._spool.open()
+        return self._spool
+
+    def _spool_telemetry(self, samples):
+        self._get_spool().append("telemetry", samples)
+
+    async def _spool_tick(self):
+        # Group fsync of the appended records, replay only once FDM Monster accepted an announcement again
+        spool = self._spool
+        if spool is None:
+            return
+        if spool.needs_sync:
+            await self._engine.run(spool.sync)
+        if self._state == State.SLEEP and spool.has_backlog():
+            replayed = await self._engine.run(spool.replay, self._upload_spooled)
+            if replayed:
+                self._logger.info(f"Replayed {replayed} spooled records to FDM Monster")
+
+    def _upload_spooled(self, records):
+        samples = []
+        for record in records:
+            if record["kind"] == "telemetry":
+                samples.extend(record["payload"])
+            elif record["kind"] == "announce":
+                # Host and port may have changed since, the current announcement supersedes the spooled one
+                self._announcements.request_resync()
+        if samples and self._get_telemetry().enabled:
+            return self._send_telemetry_batch(samples)
+        return True
+
+    def _get_transfers(self):
+        if self._transfers is None:
+            self._transfers = UploadTransfers(os.path.join(self.get_plugin_data_folder(), Config.transfer_folder))
+        return self._transfers
+
+    def _purge_stale_transfers(self):
+        purged = self._get_transfers().purge_stale()
+        if purged:
+            self._logger.info(f"Removed {purged} abandoned partial uploads")
+
+    def _run_in_background(self, target):
+        if self._engine.running:
+            self._engine.submit(target, deadline=self._call_deadline(1))
+        else:
+            threading.Thread(target=target, daemon=True).start()
 
-            if token_invalid:
-                oidc_client_id = self._settings.get(["oidc_client_id"])
-                oidc_client_secret = self._settings.get(["oidc_client_secret"])
+    def _check_fdmmonster(self):
+        if self._hub is not None and self._announce_through_hub():
+            self._set_state(State.SLEEP)
+            return
+
+        base_url = self._get_settings().fdm_base_url
+
+        if base_url is not None:
+
+            # OIDC client_credentials flow result, a token close to expiry is refreshed in the background
+            access_token = self._get_access_token()
+
+            if access_token is None:
                 self._logger.info("Refreshing access_token as it was expired")
-                success = self._query_access_token(base_url, oidc_client_id, oidc_client_secret)
+                # Shares the result of a refresh already running on another thread
+                success = self._token_manager.refresh()
                 if not success:
-                    self._state = State.CRASHED
+                    # The token query left RETRY or CRASHED behind, depending on why it failed
                     return False
+                access_token = self._token_manager.get_token()
             else:
                 # We skip querying the token
-                self._state = State.SUCCESS
+                self._set_state(State.SUCCESS)
 
-            if "access_token" not in self._persisted_data.keys():
+            if access_token is None:
                 # Quite unlikely as we'd be crashed
                 raise Exception(Errors.access_token_not_saved)
 
-            at = self._persisted_data["access_token"]
-
-            self._query_announcement(base_url, at)
+            self._query_announcement(base_url, access_token)
 
         else:
             self._logger.error(Errors.openid_config_unset)
-            self._state = State.CRASHED
+            self._set_state(State.CRASHED)
             raise Exception(Errors.config_openid_missing)
 
+    def _refresh_access_token(self):
+        settings = self._get_settings()
+        if settings.fdm_base_url is None:
+            self._logger.error(Errors.openid_config_unset)
+            return False
+
+        return self._query_access_token(settings.fdm_base_url, settings.oidc_client_id, settings.oidc_client_secret)
+
     def _query_access_token(self, base_url, oidc_client_id, oidc_client_secret):
+        state, at_data, response = self._request_access_token(base_url, oidc_client_id, oidc_client_secret,
+                                                              breaker=self._breakers["token"])
+        if response is not None and self._is_server_busy(response):
+            return False
+        if state == State.RETRY:
+            self._retry_after_circuit("token")
+            return False
+        self._set_state(state)
+        if at_data is None:
+            return False
+
+        # Saves to file and to this plugin instance self._persistence_data accordingly
+        self._write_new_access_token(self.get_excluded_persistence_datapath(), at_data)
+        return True
+
+    def _request_access_token(self, base_url, oidc_client_id, oidc_client_secret, breaker=None):
+        """OIDC client_credentials call without side effects on the connector, returns the resulting state, the token
+        data and the response when FDM Monster was busy. RETRY means FDM Monster couldn't be reached or was busy,
+        CRASHED that the credentials or the response are wrong."""
         if not oidc_client_id or not oidc_client_secret:
             self._logger.error("Configuration error: 'oidc_client_id' or 'oidc_client_secret' not set")
-            self._state = State.CRASHED
-            return False
+            return State.CRASHED, None, None
 
         at_data = None
         try:
             data = {'grant_type': 'client_credentials', 'scope': requested_scopes}
             self._logger.info("Calling FDM Connector at URL: " + base_url)
             url = urljoin(base_url, fdm_access_token_route)
-            response = requests.post(url, data=data,
-                                     verify=False, allow_redirects=False, auth=(oidc_client_id, oidc_client_secret))
+            started = time.perf_counter()
+            post = self._http_client.post if breaker is None else partial(breaker.call, self._http_client.post)
+            try:
+                response = post(url, data=data, allow_redirects=False,
+                                auth=(oidc_client_id, oidc_client_secret))
+            finally:
+                self._metrics.token_seconds.observe(time.perf_counter() - started)
             self._logger.info(response.text)
             self._logger.info(response.status_code)
+            if response.status_code in Config.retry_status_codes:
+                self._logger.warning(f"FDM Monster is busy ({response.status_code}), backing off")
+                return State.RETRY, None, response
             at_data = json.loads(response.text)
-        except requests.exceptions.ConnectionError:
-            self._state = State.RETRY  # TODO apply this with a backoff scheme
-            self._logger.error("ConnectionError: error sending access_token request to FDM Monster")
+        except requests.exceptions.RequestException as e:
+            self._logger.error(f"Error sending access_token request to FDM Monster: {e}")
+            return State.RETRY, None, None
         except Exception as e:
-            self._state = State.CRASHED
             self._logger.error(
                 "Generic Exception: error requesting access_token request to FDM Monster. Exception: " + str(e))
 
-        if at_data is not None:
-            if "access_token" not in at_data.keys():
-                raise Exception(
-                    "Response error: 'access_token' not received. Check your FDM Monster server logs. Aborting")
-            if "expires_in" not in at_data.keys() is None:
-                raise Exception("Response error: 'expires_in' not received. Check your FDM Monster server logs. Aborting")
-
-            # Saves to file and to this plugin instance self._persistence_data accordingly
-            self._write_new_access_token(self.get_excluded_persistence_datapath(), at_data)
-            self._state = State.SUCCESS
-            return True
-        else:
-            self._state = State.CRASHED
+        if at_data is None:
             self._logger.error("Response error: access_token data response was empty. Aborting")
+            return State.CRASHED, None, None
+        if "access_token" not in at_data.keys():
+            raise Exception(
+                "Response error: 'access_token' not received. Check your FDM Monster server logs. Aborting")
+        if "expires_in" not in at_data.keys():
+            raise Exception("Response error: 'expires_in' not received. Check your FDM Monster server logs. Aborting")
+        return State.SUCCESS, at_data, None
 
     def _query_announcement(self, base_url, access_token):
         if self._state != State.SUCCESS and self._state != State.SLEEP:
             self._logger.error("State error: tried to announce when state was not 'success'")
 
         if base_url is None:
-            self._state = State.CRASHED
+            self._set_state(State.CRASHED)
             raise Exception(Errors.base_url_not_provided)
 
         if len(access_token) < 43:
-            self._state = State.CRASHED
+            self._set_state(State.CRASHED)
             raise Exception(Errors.access_token_too_short)
 
-        # Announced data
-        octoprint_port = self._settings.get(["port_override"])
-        octoprint_host = self._settings.global_get(["server", "host"])
-        # TODO maybe let FDM Monster decide instead of swapping ourselves?
-        if octoprint_port is None:
-            # Risk of failure when behind proxy (docker, vm, vpn, rev-proxy)
-            octoprint_port = self._settings.global_get(["server", "port"])
-
         try:
-            # Data folder based
-            self._fetch_persisted_data()
-            # Config file based
-            device_uuid = self._get_device_uuid()
-
-            check_data = {
-                "deviceUuid": device_uuid,
-                "persistenceUuid": self._persisted_data["persistence_uuid"],
-                "host": octoprint_host,
-                "port": int(octoprint_port),
-                "docker": bool(is_docker())
-            }
+            check_data = self._build_announcement()
+            device_uuid = check_data["deviceUuid"]
+            # As hub the announcements of the sibling instances are sent along in one batch
+            payloads = self._hub.collect(check_data) if self._hub is not None and self._hub.is_hub else [check_data]
 
             headers = {'Authorization': 'Bearer ' + access_token}
-            url = urljoin(base_url, fdm_announce_route)
-            response = requests.post(url, headers=headers, json=check_data)
-
-            self._state = State.SLEEP
+            announce_hash = payload_hash(check_data if len(payloads) == 1 else payloads)
+            mode = self._announcements.next_mode(announce_hash)
+            if mode == AnnounceMode.SKIP:
+                self._announcements.record_skip()
+                self._set_state(State.SLEEP)
+                return
+            member_uuids = [payload.get("deviceUuid") for payload in payloads[1:]]
+            if mode == AnnounceMode.HEARTBEAT and \
+                    self._send_heartbeat(base_url, headers, device_uuid, announce_hash, member_uuids):
+                return
+
+            started = time.perf_counter()
+            try:
+                if len(payloads) == 1:
+                    url = urljoin(base_url, fdm_announce_route)
+                    response = self._post_payload(url, headers, check_data, "announce")
+                else:
+                    response = self._post_announcement_batch(base_url, headers, payloads)
+            finally:
+                self._metrics.announce_seconds.observe(time.perf_counter() - started)
+            if self._is_server_busy(response):
+                self._logger.warning(f"FDM Monster is busy ({response.status_code}), backing off")
+                return
+            if 200 <= response.status_code < 300:
+                self._announcements.acknowledge(announce_hash, self._parse_response_data(response))
+
+            self._set_state(State.SLEEP)
             self._logger.info(f"Done announcing to FDM Monster server ({response.status_code})")
             self._logger.info(response.text)
-        except requests.exceptions.ConnectionError:
-            self._state = State.CRASHED
-            self._logger.error("ConnectionError: error sending announcement to FDM Monster")
+        except requests.exceptions.RequestException as e:
+            self._retry_after_circuit("announce")
+            self._logger.error(f"Error sending announcement to FDM Monster, spooled for replay: {e}")
+            self._get_spool().append("announce", payloads)
+
+    def _build_announcement(self):
+        # Announced data, cached until the settings change
+        environment = self._environment.get()
+        # Data folder based, serialized with the preload so a fresh install creates a single persistence UUID
+        with self._load_lock:
+            self._fetch_persisted_data()
+        # Config file based
+        device_uuid = self._get_device_uuid()
+
+        return {
+            "deviceUuid": device_uuid,
+            "persistenceUuid": self._persisted_data["persistence_uuid"],
+            "host": environment.host,
+            "port": environment.port,
+            "docker": environment.docker,
+            "container": environment.container
+        }
+
+    def _post_announcement_batch(self, base_url, headers, payloads):
+        if self._batch_announce_supported:
+            url = urljoin(base_url, fdm_announce_batch_route)
+            response = self._post_payload(url, headers, {"announcements": payloads}, "announce")
+            if response.status_code not in (404, 405):
+                return response
+            self._logger.info("FDM Monster does not support batched announcements, announcing one by one")
+            self._batch_announce_supported = False
+
+        # Still a single token and a single pooled connection for all instances
+        url = urljoin(base_url, fdm_announce_route)
+        failed_response = None
+        for payload in payloads:
+            response = self._post_payload(url, headers, payload, "announce")
+            if failed_response is None and not 200 <= response.status_code < 300:
+                failed_response = response
+        return failed_response or response
+
+    def _send_heartbeat(self, base_url, headers, device_uuid, announce_hash, member_uuids=None):
+        """Returns False when a full announcement has to be sent instead"""
+        url = urljoin(base_url, fdm_heartbeat_route)
+        heartbeat = {"deviceUuid": device_uuid, "announceHash": announce_hash}
+        if member_uuids:
+            # As hub the heartbeat also tells FDM Monster the sibling instances are still alive
+            heartbeat["memberDeviceUuids"] = member_uuids
+        started = time.perf_counter()
+        try:
+            response = self._post_payload(url, headers, heartbeat, "announce")
+        finally:
+            self._metrics.heartbeat_seconds.observe(time.perf_counter() - started)
+        if response.status_code in (404, 405):
+            self._logger.info("FDM Monster does not support heartbeats, sending full announcements")
+            self._announcements.mark_heartbeat_unsupported()
+            return False
+        if self._is_server_busy(response):
+            self._logger.warning(f"FDM Monster is busy ({response.status_code}), backing off")
+            return True
+        if response.status_code == 409 or self._parse_response_data(response).get("resync", False):
+            self._logger.info("FDM Monster requested a full announcement")
+            self._announcements.request_resync()
+            return False
+
+        self._announcements.record_heartbeat()
+        self._set_state(State.SLEEP)
+        return True
+
+    def _post_payload(self, url, headers, payload, endpoint):
+        """Encoded POST through the circuit breaker of ``endpoint``, raises CircuitOpenError while it is open"""
+        breaker = self._breakers[endpoint]
+        body, body_headers = self._wire.encode(payload, negotiate=self._query_wire_encodings)
+        response = breaker.call(self._http_client.post, url, headers={**headers, **body_headers}, data=body)
+        if response.status_code == 415 and self._wire.encoding not in (None, WireEncoding.JSON):
+            self._logger.warning(f"FDM Monster rejected {self._wire.encoding} request bodies, sending plain JSON")
+            self._wire.fall_back()
+            body, body_headers = self._wire.encode(payload)
+            response = breaker.call(self._http_client.post, url, headers={**headers, **body_headers}, data=body)
+        return response
+
+    def _query_wire_encodings(self):
+        """Encodings FDM Monster accepts according to its api/version response, None when it couldn't be asked"""
+        base_url = self._get_settings().fdm_base_url
+        if base_url is None:
+            return None
+        try:
+            response = self._breakers["version"].call(self._http_client.get, urljoin(base_url, fdm_version_route))
+        except requests.exceptions.RequestException as e:
+            self._logger.warning(f"Error querying the FDM Monster version: {e}")
+            return None
+        if response.status_code != 200:
+            # Older servers without the route, plain JSON
+            return []
+        encodings = self._parse_response_data(response).get("wireEncodings")
+        return encodings if isinstance(encodings, list) else []
+
+    @staticmethod
+    def _parse_response_data(response):
+        try:
+            response_data = json.loads(response.text)
+        except (TypeError, ValueError):
+            return dict()
+        return response_data if isinstance(response_data, dict) else dict()
 
     def _call_validator_abort(self, key):
         flask.abort(400, description=f"Expected '{key}' parameter")
 
     @staticmethod
     def additional_excludes_hook(excludes, *args, **kwargs):
-        return [Config.persisted_data_file]
+        return [Config.persisted_data_file, Config.spool_folder, Config.transfer_folder]
+
+    @staticmethod
+    def increase_upload_bodysize_hook(current_max_body_sizes, *args, **kwargs):
+        # OctoPrint only streams multipart bodies to disk, any other body is held in memory before the route runs.
+        # Larger files are sent as several chunks.
+        return [("POST", r"/files/upload/.*", Config.transfer_max_request_bytes)]
 
     @octoprint.plugin.BlueprintPlugin.route("/test_fdmmonster_connection", methods=["POST"])
     def test_fdmmonster_connection(self):
@@ -319,10 +910,13 @@ class FdmConnectorPlugin(
                 return self._call_validator_abort(key)
 
         proposed_url = input["url"]
+        return self._run_probe(("version", proposed_url), self._probe_version, proposed_url)
+
+    def _probe_version(self, proposed_url):
         self._logger.info("Testing FDM Monster URL " + proposed_url)
 
         url = urljoin(proposed_url, fdm_version_route)
-        response = requests.get(url)
+        response = self._http_client.get(url)
         version_data = json.loads(response.text)
 
         self._logger.info("Version response from FDM Monster " + version_data["version"])
@@ -340,14 +934,255 @@ class FdmConnectorPlugin(
         proposed_url = input["url"]
         oidc_client_id = input["client_id"]
         oidc_client_secret = input["client_secret"]
-        self._query_access_token(proposed_url, oidc_client_id, oidc_client_secret)
+        return self._run_probe(("openid", proposed_url, oidc_client_id, oidc_client_secret), self._probe_openid,
+                               proposed_url, oidc_client_id, oidc_client_secret)
+
+    def _probe_openid(self, proposed_url, oidc_client_id, oidc_client_secret):
+        # The proposed credentials are only tested, the connector keeps its own token and state
+        try:
+            state, _, _ = self._request_access_token(proposed_url, oidc_client_id, oidc_client_secret)
+        except Exception as e:
+            self._logger.error(str(e))
+            state = State.CRASHED
 
         self._logger.info("Queried access_token from FDM Monster")
 
+        return {
+            "state": state,
+        }
+
+    def _get_probes(self):
+        if self._probes is None:
+            # Only loaded once the settings page tests a connection
+            from fdm_connector.probe import ProbeCache
+            # An openid probe which didn't get a token reports it in its state, it is tested again on the next click
+            self._probes = ProbeCache(cacheable=lambda result: result.get("state", State.SUCCESS) == State.SUCCESS)
+        return self._probes
+
+    def _run_probe(self, key_values, probe, *args):
+        from fdm_connector.probe import probe_key
+
+        key = probe_key(*key_values)
+        deadline = self._call_deadline(1)
+        self._engine.start()
+        try:
+            def submit():
+                return self._engine.submit(self._measure_probe, probe, *args, deadline=deadline)
+
+            return self._get_probes().get(key, submit, deadline)
+        except (FutureTimeoutError, asyncio.TimeoutError):
+            return {"error": f"FDM Monster did not respond within {deadline} seconds"}, 504
+        except requests.exceptions.RequestException as e:
+            return {"error": f"FDM Monster could not be reached: {e}"}, 502
+        except (ValueError, KeyError, TypeError) as e:
+            # Answered, but not with what an FDM Monster server returns
+            return {"error": f"Invalid response from FDM Monster: {e!r}"}, 502
+
+    def _measure_probe(self, probe, *args):
+        started = time.perf_counter()
+        try:
+            return probe(*args)
+        finally:
+            self._metrics.probe_seconds.observe(time.perf_counter() - started)
+
+    @octoprint.plugin.BlueprintPlugin.route("/snapshot", methods=["GET"])
+    def get_snapshot(self):
+        """Webcam snapshot shared by all viewers, with an ETag of its content for conditional requests"""
+        if not self._get_settings().snapshot_url and self._get_snapshot_webcam() is None:
+            return {"error": "No webcam able to take snapshots configured"}, 404
+        snapshots = self._get_snapshots()
+        try:
+            frame = snapshots.get(self._call_deadline(1))
+        except FutureTimeoutError:
+            return {"error": "The webcam did not respond in time"}, 504
+        except Exception as e:
+            # Webcam provider plugins raise whatever their webcam raises
+            return {"error": f"Error fetching the webcam snapshot: {e}"}, 502
+
+        response = flask.Response(frame.data, content_type=frame.content_type)
+        response.set_etag(frame.etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = int(snapshots.min_interval)
+        return response.make_conditional(request)
+
+    def _get_snapshots(self):
+        snapshots = self._snapshots
+        if snapshots is None:
+            # Only loaded once a snapshot is requested or pushed
+            from fdm_connector.snapshot import SnapshotCache
+            snapshots = self._snapshots = SnapshotCache(self._capture_snapshot, self._get_settings().snapshot_interval)
+        return snapshots
+
+    def _capture_snapshot(self):
+        snapshot_url = self._get_settings().snapshot_url
+        if not snapshot_url:
+            webcam = self._get_snapshot_webcam()
+            if webcam is None:
+                raise LookupError("No webcam able to take snapshots configured")
+            # An iterator over the bytes of a JPEG picture
+            return b"".join(webcam.providerPlugin.take_webcam_snapshot(webcam.config.name)), "image/jpeg"
+
+        if self._webcam_client is None:
+            self._webcam_client = FdmHttpClient(max_connections_per_host=1)
+        response = self._webcam_client.get(snapshot_url)
+        response.raise_for_status()
+        return response.content, response.headers.get("Content-Type", "image/jpeg")
+
+    @staticmethod
+    def _get_snapshot_webcam():
+        """OctoPrint's snapshot webcam as provided by a webcam provider plugin, None without one"""
+        try:
+            # OctoPrint 1.9 and later, older versions keep the URL in the 'webcam:snapshot' setting
+            from octoprint.webcams import get_snapshot_webcam
+        except ImportError:
+            return None
+        webcam = get_snapshot_webcam()
+        if webcam is None or not webcam.config.canSnapshot:
+            return None
+        return webcam
+
+    def _push_snapshot(self):
+        settings = self._get_settings()
+        if settings.fdm_base_url is None or not settings.snapshot_url and self._get_snapshot_webcam() is None:
+            return
+        try:
+            # Shares the capture with the viewers of the snapshot route
+            frame = self._get_snapshots().get(self._call_deadline(1))
+        except Exception as e:
+            # Reported once while the webcam is down, until a capture succeeds again
+            if self._snapshot_capture_failing:
+                self._logger.debug(f"Webcam snapshot capture still failing: {e}")
+            else:
+                self._snapshot_capture_failing = True
+                self._logger.warning(f"Error capturing the webcam snapshot: {e}", exc_info=True)
+            return
+        self._snapshot_capture_failing = False
+        if frame.etag == self._pushed_snapshot_etag:
+            return
+
+        access_token = self._get_access_token()
+        if access_token is None:
+            return
+        headers = {"Authorization": "Bearer " + access_token, "Content-Type": frame.content_type,
+                   "ETag": f'"{frame.etag}"', "X-Device-Uuid": self._get_device_uuid()}
+        try:
+            response = self._breakers["snapshot"].call(self._http_client.post,
+                                                       urljoin(settings.fdm_base_url, fdm_snapshot_route),
+                                                       headers=headers, data=frame.data)
+        except requests.exceptions.RequestException as e:
+            self._logger.warning(f"Error pushing the webcam snapshot to FDM Monster: {e}")
+            return
+        if response.status_code in (404, 405):
+            self._logger.info("FDM Monster does not accept webcam snapshots, snapshot push disabled")
+            task = self._engine.get_tasks().get("snapshots")
+            if task is not None:
+                task.cancel()
+        elif 200 <= response.status_code < 300:
+            self._pushed_snapshot_etag = frame.etag
+
+    @octoprint.plugin.BlueprintPlugin.route("/files/upload/<upload_id>", methods=["POST"])
+    def upload_file_chunk(self, upload_id):
+        """Receive (a chunk of) a G-code file as multipart or raw body, continuing at 'offset' or 'Content-Range'"""
+        from octoprint.filemanager import valid_file_type
+        from octoprint.filemanager.destinations import FileDestinations
+        from octoprint.filemanager.util import DiskFileWrapper
+
+        transfers = self._get_transfers()
+        try:
+            if (request.content_length or 0) > Config.transfer_max_request_bytes:
+                raise TransferError(f"Chunks are limited to {Config.transfer_max_chunk_bytes} bytes per request", 413)
+            offset, size = self._parse_upload_range()
+            filename = request.values.get("filename")
+            if filename is not None:
+                filename = self._file_manager.sanitize_name(FileDestinations.LOCAL, filename)
+                if not valid_file_type(filename, type="machinecode"):
+                    return {"error": f"'{filename}' is not a G-code file"}, 415
+            meta = transfers.begin(upload_id, filename, size)
+            if offset is None:
+                offset = transfers.offset(upload_id)
+
+            path_suffix = self._get_settings().upload_path_suffix
+            spooled_path = request.values.get(f"file.{path_suffix}") if path_suffix else None
+            if spooled_path is not None:
+                transfers.append_file(upload_id, offset, spooled_path)
+            else:
+                transfers.append(upload_id, offset, request.stream, request.content_length)
+        except TransferError as e:
+            return {"error": str(e), "offset": e.offset}, e.status
+
+        status = transfers.status(upload_id)
+        status["complete"] = status["offset"] == meta["size"]
+        if status["complete"]:
+            status["path"] = self._file_manager.add_file(
+                FileDestinations.LOCAL, meta["filename"],
+                DiskFileWrapper(meta["filename"], transfers.finish(upload_id), move=True),
+                allow_overwrite=True
+            )
+            transfers.discard(upload_id)
+            self._logger.info(f"Received '{meta['filename']}' ({meta['size']} bytes) from FDM Monster")
+        return status
+
+    @octoprint.plugin.BlueprintPlugin.route("/files/upload/<upload_id>", methods=["GET"])
+    def get_upload_status(self, upload_id):
+        try:
+            status = self._get_transfers().status(upload_id)
+        except TransferError as e:
+            return {"error": str(e)}, e.status
+        if status is None:
+            return {"error": f"Unknown upload '{upload_id}'"}, 404
+        return status
+
+    @octoprint.plugin.BlueprintPlugin.route("/files/upload/<upload_id>", methods=["DELETE"])
+    def cancel_upload(self, upload_id):
+        try:
+            self._get_transfers().discard(upload_id)
+        except TransferError as e:
+            return {"error": str(e)}, e.status
+        return {"uploadId": upload_id}
+
+    @staticmethod
+    def _parse_upload_range():
+        """Offset and total size from 'Content-Range: bytes <start>-<end>/<total>' or the query parameters"""
+        content_range = request.headers.get("Content-Range")
+        try:
+            if content_range:
+                unit, _, byte_range = content_range.partition(" ")
+                span, _, total = byte_range.partition("/")
+                if unit != "bytes" or not span:
+                    raise ValueError(content_range)
+                return int(span.split("-")[0]), None if total in ("", "*") else int(total)
+            offset = request.values.get("offset")
+            size = request.values.get("size")
+            return None if offset is None else int(offset), None if size is None else int(size)
+        except ValueError:
+            raise TransferError(f"Invalid range '{content_range or request.query_string}'")
+
+    @octoprint.plugin.BlueprintPlugin.route("/state", methods=["GET"])
+    def get_connector_state(self):
         return {
             "state": self._state,
+            "scheduler": self._scheduler.status(),
+            "announcements": self._announcements.status(),
+            "hub": self._hub.status() if self._hub is not None else None,
+            "filament": self._pedometer.snapshot(),
+            "temperatures": self._temperatures.status(),
+            "telemetry": self._telemetry.status() if self._telemetry is not None else None,
+            "spool": self._spool.status() if self._spool is not None else None,
+            "tunnel": self._tunnel.status() if self._tunnel is not None else None,
+            "wire": self._wire.status(),
+            "status_push": self._status.status(),
+            "snapshots": self._snapshots.status() if self._snapshots is not None else None,
+            "breakers": {endpoint: breaker.status() for endpoint, breaker in self._breakers.items()},
         }
 
+    @octoprint.plugin.BlueprintPlugin.route("/connection_stats", methods=["GET"])
+    def get_connection_stats(self):
+        return self._http_client.stats()
+
+    @octoprint.plugin.BlueprintPlugin.route("/metrics", methods=["GET"])
+    def get_metrics(self):
+        return flask.Response(self._metrics.render(), content_type=self._metrics.content_type)
+
 
 __plugin_name__ = "FDM Connector"
 __plugin_version__ = "0.2.0"
@@ -362,5 +1197,10 @@ def __plugin_load__():
     global __plugin_hooks__
     __plugin_hooks__ = {
         "octoprint.plugin.softwareupdate.check_config": __plugin_implementation__.get_update_information,
-        "octoprint.plugin.backup.additional_excludes": __plugin_implementation__.additional_excludes_hook
+        "octoprint.plugin.backup.additional_excludes": __plugin_implementation__.additional_excludes_hook,
+        "octoprint.server.http.bodysize": __plugin_implementation__.increase_upload_bodysize_hook,
+        # Registered directly to keep the serial thread fast path free of extra calls
+        "octoprint.comm.protocol.gcode.sent": __plugin_implementation__._pedometer.on_gcode_sent,
+        "octoprint.comm.protocol.temperatures.received":
+            __plugin_implementation__._temperatures.on_temperatures_received
     }
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import json
+import threading
+import time
+
+from fdm_connector.constants import Config
+
+
+def payload_hash(payload):
+    """Stable hash of an announcement payload, independent of key order"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AnnounceMode:
+    FULL = "full"
+    HEARTBEAT = "heartbeat"
+    SKIP = "skip"
+
+
+class AnnouncementTracker(object):
+    """Remembers the last announcement FDM Monster acknowledged, so unchanged payloads aren't sent again.
+
+    A full announcement is due when the payload hash changed, when the server asked for a resync, when the server
+    doesn't know heartbeats or when the last full announcement is older than ``resync_interval``. Otherwise a
+    heartbeat suffices, or nothing at all when the server acknowledged that it doesn't need heartbeats.
+    """
+
+    def __init__(self, resync_interval=Config.announce_resync_secs, clock=time.monotonic):
+        self.resync_interval = resync_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._acknowledged_hash = None
+        self._acknowledged_at = None
+        self._resync_requested = False
+        self._heartbeat_supported = True
+        self._heartbeat_optional = False
+        self.full_announcements = 0
+        self.heartbeats = 0
+        self.skipped = 0
+
+    def next_mode(self, announce_hash):
+        with self._lock:
+            if (announce_hash != self._acknowledged_hash
+                    or self._resync_requested
+                    or not self._heartbeat_supported
+                    or self._clock() - self._acknowledged_at >= self.resync_interval):
+                return AnnounceMode.FULL
+            return AnnounceMode.SKIP if self._heartbeat_optional else AnnounceMode.HEARTBEAT
+
+    def acknowledge(self, announce_hash, response_data=None):
+        """Record a full announcement accepted by FDM Monster"""
+        with self._lock:
+            self._acknowledged_hash = announce_hash
+            self._acknowledged_at = self._clock()
+            self._resync_requested = False
+            self._heartbeat_optional = bool((response_data or {}).get("heartbeatOptional", False))
+            self.full_announcements += 1
+
+    def record_heartbeat(self):
+        with self._lock:
+            self.heartbeats += 1
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def request_resync(self):
+        with self._lock:
+            self._resync_requested = True
+
+    def mark_heartbeat_unsupported(self):
+        with self._lock:
+            self._heartbeat_supported = False
+
+    def reset(self):
+        with self._lock:
+            self._acknowledged_hash = None
+            self._acknowledged_at = None
+
+    def status(self):
+        with self._lock:
+            return dict(
+                acknowledged_hash=self._acknowledged_hash,
+                heartbeat_supported=self._heartbeat_supported,
+                heartbeat_optional=self._heartbeat_optional,
+                full_announcements=self.full_announcements,
+                heartbeats=self.heartbeats,
+                skipped=self.skipped
+            )
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+from collections import deque
+
+import requests
+
+from fdm_connector.constants import Config
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending the request while the circuit of an endpoint is open.
+
+    A ConnectionError, so callers handle it like an unreachable FDM Monster, only without waiting for a timeout.
+    """
+
+    def __init__(self, endpoint, retry_in):
+        super(CircuitOpenError, self).__init__(
+            f"Circuit of FDM Monster endpoint '{endpoint}' is open, next probe in {retry_in:.0f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def is_failure_response(response):
+    # FDM Monster answered but is in trouble, a 4xx is the caller's problem and counts as a success
+    return response.status_code >= 500 or response.status_code in Config.retry_status_codes
+
+
+class CircuitBreaker(object):
+    """Circuit breaker of one FDM Monster endpoint, calls fail fast while the endpoint keeps failing.
+
+    CLOSED keeps the outcomes of the last ``window`` calls and opens once at least ``min_calls`` were made and the
+    share of failures reaches ``failure_rate``. OPEN rejects every call with a CircuitOpenError until ``open_secs``
+    passed, then HALF_OPEN lets a single probe through. A successful probe closes the circuit, a failed one opens it
+    again for twice as long, up to ``max_open_secs``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, endpoint,
+                 failure_rate=Config.breaker_failure_rate,
+                 window=Config.breaker_window_calls,
+                 min_calls=Config.breaker_min_calls,
+                 open_secs=Config.breaker_open_secs,
+                 max_open_secs=Config.breaker_max_open_secs,
+                 clock=time.monotonic):
+        self.endpoint = endpoint
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_secs = open_secs
+        self.max_open_secs = max_open_secs
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._open_until = None
+        self._current_open_secs = open_secs
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+
+    def call(self, func, *args, **kwargs):
+        """Run ``func``, a requests call, through the breaker. Raises CircuitOpenError without calling it when open."""
+        probe = self._before_call()
+        try:
+            response = func(*args, **kwargs)
+        except requests.exceptions.RequestException:
+            self._record(False, probe)
+            raise
+        except BaseException:
+            # Not an FDM Monster failure, but a probe slot must not be held forever
+            self._record(None, probe)
+            raise
+        self._record(not is_failure_response(response), probe)
+        return response
+
+    def retry_in(self):
+        """Seconds until the open circuit lets a probe through, 0 when calls are let through"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0
+            return max(self._open_until - self._clock(), 0)
+
+    def reset(self):
+        with self._lock:
+            self._close()
+
+    def _before_call(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                retry_in = self._open_until - self._clock()
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.endpoint, retry_in)
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.endpoint, 0)
+                self._probing = True
+                self.probes += 1
+                return True
+            return False
+
+    def _record(self, success, probe):
+        with self._lock:
+            if probe:
+                self._probing = False
+                if success:
+                    self._close()
+                elif success is False:
+                    self._open(self._current_open_secs * 2)
+                return
+            # Calls sent before the circuit opened don't count towards the next window
+            if success is None or self._state != self.CLOSED:
+                return
+            self._outcomes.append(success)
+            calls = len(self._outcomes)
+            if not success and calls >= self.min_calls and \
+                    self._outcomes.count(False) / calls >= self.failure_rate:
+                self._open(self.open_secs)
+
+    def _open(self, open_secs):
+        self._current_open_secs = min(open_secs, self.max_open_secs)
+        self._open_until = self._clock() + self._current_open_secs
+        self._state = self.OPEN
+        self._outcomes.clear()
+        self.opened += 1
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._open_until = None
+        self._current_open_secs = self.open_secs
+        self._probing = False
+        self._outcomes.clear()
+
+    def status(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            state = self._state
+            retry_in = max(self._open_until - self._clock(), 0) if state == self.OPEN else 0
+            if state == self.OPEN and retry_in == 0:
+                # Half open as soon as the next call may probe
+                state = self.HALF_OPEN
+            return dict(
+                state=state,
+                calls=calls,
+                failures=failures,
+                failure_rate=round(failures / calls, 3) if calls else 0.0,
+                retry_in=round(retry_in, 3),
+                opened=self.opened,
+                rejected=self.rejected,
+                probes=self.probes
+            )
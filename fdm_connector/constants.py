@@ -22,6 +22,64 @@ class Config:
     default_fdm_host = "http://127.0.0.1"
     default_fdm_port = 4000
     default_ping_secs = 120
+    default_http_connect_timeout = 5
+    default_http_read_timeout = 10
+    default_http_max_connections_per_host = 2
+    http_pool_hosts = 4
+    token_refresh_margin_secs = 60
+    token_refresh_retry_secs = 5
+    token_refresh_max_retry_secs = 60
+    persistence_flush_delay_secs = 5
+    engine_max_workers = 4
+    engine_shutdown_timeout_secs = 5
+    engine_deadline_slack_secs = 5
+    backoff_base_secs = 5
+    backoff_min_secs = 1
+    backoff_max_secs = 600
+    startup_splay_secs = 30
+    retry_status_codes = (429, 503)
+    announce_resync_secs = 6 * 60 * 60
+    hub_folder_name = "fdm_connector_hub"
+    hub_member_ttl_pings = 3
+    pedometer_default_tools = 1
+    telemetry_buffer_capacity = 1024
+    telemetry_batch_size = 200
+    telemetry_max_age_secs = 60
+    telemetry_check_secs = 1
+    spool_folder = "spool"
+    spool_segment_bytes = 1024 * 1024
+    spool_max_bytes = 16 * 1024 * 1024
+    spool_sync_secs = 5
+    spool_sync_records = 64
+    spool_replay_batch = 100
+    spool_check_secs = 5
+    tunnel_window_bytes = 256 * 1024
+    tunnel_max_frame_bytes = 16 * 1024
+    tunnel_max_streams = 32
+    tunnel_ping_secs = 30
+    transfer_folder = "uploads"
+    transfer_chunk_bytes = 256 * 1024
+    transfer_max_chunk_bytes = 4 * 1024 * 1024
+    # Room for the multipart envelope around a chunk
+    transfer_max_request_bytes = transfer_max_chunk_bytes + 64 * 1024
+    transfer_max_age_secs = 24 * 60 * 60
+    transfer_cleanup_secs = 60 * 60
+    probe_cache_secs = 10
+    wire_min_encode_bytes = 1024
+    wire_compress_level = 6
+    status_debounce_secs = 0.25
+    status_retry_secs = 5
+    temperature_history_samples = 600
+    temperature_bucket_secs = 10
+    temperature_max_heaters = 8
+    snapshot_min_interval_secs = 1.0
+    snapshot_push_secs = 10
+    breaker_endpoints = ("token", "announce", "version", "telemetry", "status", "snapshot")
+    breaker_failure_rate = 0.5
+    breaker_window_calls = 10
+    breaker_min_calls = 3
+    breaker_open_secs = 30
+    breaker_max_open_secs = 600
 
 
 class State:
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fdm_connector.constants import Config
+
+_logger = logging.getLogger("octoprint.plugins.fdm_connector.engine")
+
+
+class PeriodicTask(object):
+    """Handle to a task scheduled with ``ConnectorEngine.schedule_periodic``"""
+
+    def __init__(self, name, func, interval, deadline, run_first):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.deadline = deadline
+        self.run_first = run_first
+        self.runs = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.last_run = None
+        self.next_run = None
+        self._future = None
+
+    def next_delay(self):
+        interval = self.interval() if callable(self.interval) else self.interval
+        return max(float(interval), 0)
+
+    def cancel(self):
+        if self._future is not None:
+            self._future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._future is not None and self._future.cancelled()
+
+
+class ConnectorEngine(object):
+    """Single background asyncio loop which runs all connector tasks of the plugin.
+
+    Tasks are coroutine functions or blocking callables, the latter are run on a small shared thread pool. Every
+    invocation can be given a deadline after which it is abandoned, so one hung call can't hold up the next tick.
+    """
+
+    def __init__(self, max_workers=Config.engine_max_workers):
+        self._max_workers = max_workers
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._tasks = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._loop is not None and self._loop.is_running()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            started = threading.Event()
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                thread_name_prefix="fdm-connector-worker")
+            self._loop = asyncio.new_event_loop()
+            self._loop.set_default_executor(self._executor)
+            self._thread = threading.Thread(target=self._run_loop, args=(started,),
+                                            name="fdm-connector-engine", daemon=True)
+            self._thread.start()
+        started.wait()
+
+    def stop(self, timeout=Config.engine_shutdown_timeout_secs):
+        """Cancel all tasks and stop the loop, blocks for at most ``timeout`` seconds"""
+        with self._lock:
+            loop, thread, executor = self._loop, self._thread, self._executor
+            self._loop = self._thread = self._executor = None
+            self._tasks = dict()
+        if loop is None:
+            return
+
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._cancel_all(), loop)
+            thread.join(timeout)
+        executor.shutdown(wait=False)
+
+    def schedule_periodic(self, name, func, interval, deadline=None, run_first=True):
+        """Run ``func`` every ``interval`` seconds, ``interval`` may be a callable returning the next delay"""
+        task = PeriodicTask(name, func, interval, deadline, run_first)
+        task._future = asyncio.run_coroutine_threadsafe(self._run_periodic(task), self._loop)
+        with self._lock:
+            self._tasks[name] = task
+        return task
+
+    def submit(self, func, *args, deadline=None):
+        """Run a coroutine function or blocking callable on the engine, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self.run(func, *args, deadline=deadline), self._loop)
+
+    async def run(self, func, *args, deadline=None):
+        """Await ``func`` on the loop, or on the thread pool when it is blocking, within ``deadline`` seconds"""
+        if asyncio.iscoroutinefunction(func):
+            awaitable = func(*args)
+        else:
+            awaitable = asyncio.get_running_loop().run_in_executor(None, func, *args)
+        if deadline is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, deadline)
+
+    def get_tasks(self):
+        with self._lock:
+            return dict(self._tasks)
+
+    async def _run_periodic(self, task):
+        delay = 0 if task.run_first else task.next_delay()
+        while True:
+            task.next_run = time.time() + delay
+            await asyncio.sleep(delay)
+            task.last_run = time.time()
+            task.runs += 1
+            try:
+                await self.run(task.func, deadline=task.deadline)
+            except asyncio.TimeoutError:
+                task.timeouts += 1
+                _logger.error(f"Connector task '{task.name}' exceeded its deadline of {task.deadline}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                task.errors += 1
+                _logger.exception(f"Connector task '{task.name}' failed")
+            delay = task.next_delay()
+
+    async def _cancel_all(self):
+        current = asyncio.current_task()
+        pending = [t for t in asyncio.all_tasks() if t is not current]
+        for pending_task in pending:
+            pending_task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    def _run_loop(self, started):
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
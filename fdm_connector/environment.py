@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import os
+import threading
+from collections import namedtuple
+
+_unset = object()
+
+# Markers found in /proc/self/cgroup (v1 controller paths) or /proc/self/mountinfo (cgroup v2), most specific first
+_cgroup_markers = (
+    ("kubepods", "kubernetes"),
+    ("libpod", "podman"),
+    ("docker", "docker"),
+    ("containerd", "containerd"),
+    ("lxc", "lxc"),
+)
+_mountinfo_markers = (
+    ("/kubelet/pods/", "kubernetes"),
+    ("/containers/storage/", "podman"),
+    ("/docker/containers/", "docker"),
+    ("/containerd/", "containerd"),
+)
+# Only these make the announced 'docker' true, whichever runtime manages the container (a Kubernetes pod on Docker)
+_docker_cgroup_markers = (("docker", "docker"), ("moby", "docker"))
+_docker_mountinfo_markers = (("/docker/containers/", "docker"), ("/moby/", "docker"))
+
+
+def _read_lines(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+def _match_marker(lines, markers):
+    for line in lines:
+        for marker, runtime in markers:
+            if marker in line:
+                return runtime
+    return None
+
+
+def _match_proc_markers(cgroup_markers, mountinfo_markers):
+    cgroup_lines = _read_lines("/proc/self/cgroup")
+    runtime = _match_marker(cgroup_lines, cgroup_markers)
+    if runtime is not None:
+        return runtime
+
+    # cgroup v2 inside a container namespace only shows '0::/', the mounts still reveal the runtime. Any other cgroup
+    # is a host, whose mounts may well include those of the containers it runs.
+    if cgroup_lines == ["0::/"]:
+        return _match_marker(_read_lines("/proc/self/mountinfo"), mountinfo_markers)
+    return None
+
+
+def _detect_container_runtime():
+    if os.environ.get("KUBERNETES_SERVICE_HOST"):
+        return "kubernetes"
+    if os.path.exists("/.dockerenv"):
+        return "docker"
+    if os.path.exists("/run/.containerenv"):
+        return "podman"
+    return _match_proc_markers(_cgroup_markers, _mountinfo_markers)
+
+
+def _detect_docker():
+    if os.path.exists("/.dockerenv"):
+        return True
+    return _match_proc_markers(_docker_cgroup_markers, _docker_mountinfo_markers) is not None
+
+
+_detected = {}
+_detected_lock = threading.Lock()
+
+
+def _detect_once(detect):
+    # A process can't change its container, so every detection runs once
+    with _detected_lock:
+        if detect not in _detected:
+            _detected[detect] = detect()
+        return _detected[detect]
+
+
+def detect_container_runtime():
+    """Name of the container runtime we run in or None"""
+    return _detect_once(_detect_container_runtime)
+
+
+def is_docker():
+    """Whether we run in a Docker container, other runtimes like podman, lxc or containerd don't count"""
+    return _detect_once(_detect_docker)
+
+
+class EnvironmentFingerprint(namedtuple("EnvironmentFingerprint",
+                                        ["host", "port", "docker", "container", "container_runtime"])):
+    """Host facts announced to FDM Monster"""
+    __slots__ = ()
+
+
+class EnvironmentProbe(object):
+    """Caches the EnvironmentFingerprint until invalidated or until ``change_signal`` returns a different value.
+
+    ``resolve_address`` returns the announced (host, port). ``change_signal`` should be cheap, like the config file
+    modification time, as it is evaluated on every ``get``.
+    """
+
+    def __init__(self, resolve_address, change_signal=None):
+        self._resolve_address = resolve_address
+        self._change_signal = change_signal
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._signal_value = None
+
+    def get(self):
+        signal_value = self._read_signal()
+        with self._lock:
+            if self._fingerprint is not None and signal_value == self._signal_value:
+                return self._fingerprint
+        return self.refresh(signal_value)
+
+    def refresh(self, signal_value=_unset):
+        if signal_value is _unset:
+            signal_value = self._read_signal()
+        host, port = self._resolve_address()
+        runtime = detect_container_runtime()
+        fingerprint = EnvironmentFingerprint(
+            host=host,
+            port=int(port) if port is not None else None,
+            docker=is_docker(),
+            container=runtime is not None,
+            container_runtime=runtime
+        )
+        with self._lock:
+            self._fingerprint = fingerprint
+            self._signal_value = signal_value
+        return fingerprint
+
+    def invalidate(self):
+        with self._lock:
+            self._fingerprint = None
+
+    def _read_signal(self):
+        if self._change_signal is None:
+            return None
+        try:
+            return self._change_signal()
+        except Exception:
+            return None
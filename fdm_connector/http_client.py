@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fdm_connector.constants import Config
+
+
+class _PoolStatsAdapter(HTTPAdapter):
+    """HTTPAdapter which keeps the urllib3 pool counters of pools it has evicted"""
+
+    def __init__(self, *args, **kwargs):
+        self.retired_connections = 0
+        self.retired_requests = 0
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def retire(pool):
+            self.retired_connections += pool.num_connections
+            self.retired_requests += pool.num_requests
+            if dispose is not None:
+                dispose(pool)
+
+        pools.dispose_func = retire
+
+    def pool_counters(self):
+        connections = self.retired_connections
+        pool_requests = self.retired_requests
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                pool_requests += pool.num_requests
+        return connections, pool_requests
+
+
+class FdmHttpClient(object):
+    """Keep-alive HTTP client shared by every outbound FDM Monster call of the plugin.
+
+    Connections are pooled per host and limited to ``max_connections_per_host``, callers block on the pool instead
+    of opening extra sockets. Every call gets a (connect, read) timeout unless it passes its own.
+    """
+
+    def __init__(self,
+                 connect_timeout=Config.default_http_connect_timeout,
+                 read_timeout=Config.default_http_read_timeout,
+                 max_connections_per_host=Config.default_http_max_connections_per_host,
+                 metrics=None):
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._requests = 0
+        self._failed_requests = 0
+        # Counters of sessions closed by configure() or shutdown
+        self._closed_connections = 0
+        self._closed_pool_requests = 0
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections_per_host = max_connections_per_host
+        # Optional ConnectorMetrics, records status codes and bytes sent of every call
+        self.metrics = metrics
+
+    @property
+    def timeout(self):
+        return self.connect_timeout, self.read_timeout
+
+    def configure(self, connect_timeout=None, read_timeout=None, max_connections_per_host=None):
+        """Apply new limits, values which are None are left untouched. A pool size change recreates the session."""
+        if connect_timeout is not None:
+            self.connect_timeout = float(connect_timeout)
+        if read_timeout is not None:
+            self.read_timeout = float(read_timeout)
+        if max_connections_per_host is not None and int(max_connections_per_host) != self.max_connections_per_host:
+            self.max_connections_per_host = int(max_connections_per_host)
+            self.close()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._adapter = _PoolStatsAdapter(pool_connections=Config.http_pool_hosts,
+                                                  pool_maxsize=self.max_connections_per_host,
+                                                  pool_block=True)
+                session = requests.Session()
+                session.mount("http://", self._adapter)
+                session.mount("https://", self._adapter)
+                self._session = session
+            return self._session
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.session
+        with self._lock:
+            self._requests += 1
+        try:
+            if method == "GET":
+                response = session.get(url, **kwargs)
+            elif method == "POST":
+                response = session.post(url, **kwargs)
+            else:
+                response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._failed_requests += 1
+            if self.metrics is not None:
+                self.metrics.record_failure()
+            raise
+        if self.metrics is not None:
+            self.metrics.record_response(response)
+        return response
+
+    def stats(self):
+        """Connection reuse counters, 'connections_reused' going up while 'connections_opened' stays flat means
+        keep-alive is doing its job"""
+        with self._lock:
+            adapter = self._adapter
+            total_requests = self._requests
+            failed_requests = self._failed_requests
+            connections_opened = self._closed_connections
+            pool_requests = self._closed_pool_requests
+        if adapter is not None:
+            live_connections, live_requests = adapter.pool_counters()
+            connections_opened += live_connections
+            pool_requests += live_requests
+        return dict(
+            requests=total_requests,
+            failed_requests=failed_requests,
+            connections_opened=connections_opened,
+            connections_reused=max(pool_requests - connections_opened, 0),
+            max_connections_per_host=self.max_connections_per_host,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+        )
+
+    def close(self):
+        with self._lock:
+            session = self._session
+            if self._adapter is not None:
+                connections, pool_requests = self._adapter.pool_counters()
+                self._closed_connections += connections
+                self._closed_pool_requests += pool_requests
+            self._session = None
+            self._adapter = None
+        if session is not None:
+            session.close()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows, hub mode is not available
+    fcntl = None
+
+from fdm_connector.constants import Config
+
+hub_lock_file = "hub.lock"
+hub_members_folder = "members"
+
+
+def hub_supported():
+    return fcntl is not None
+
+
+class HubFolderError(Exception):
+    """The hub folder is not private to the user running OctoPrint, other users could take over the hub"""
+
+
+def secure_hub_folder(folder):
+    """Create ``folder`` readable by the current user only, refuse one another user owns or may write to"""
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    stat = os.stat(folder)
+    if stat.st_uid != os.getuid():
+        raise HubFolderError(f"Hub folder '{folder}' is owned by another user")
+    if stat.st_mode & 0o022:
+        raise HubFolderError(f"Hub folder '{folder}' is writable by other users")
+
+
+class HubCoordinator(object):
+    """Lets the OctoPrint instances on one host elect a hub which announces for all of them.
+
+    The instance holding an exclusive lock on ``hub.lock`` in the shared ``folder`` is the hub. The other instances
+    publish their announcement payload as ``members/<device_uuid>.json`` and skip their own FDM Monster calls. The
+    lock is released by the OS when the hub process dies, after which the next sibling to tick takes over.
+
+    ``folder`` has to be private to the user running the instances, ``try_become_hub`` and ``publish`` raise a
+    HubFolderError otherwise.
+    """
+
+    def __init__(self, folder, device_uuid, member_ttl):
+        self.folder = folder
+        self.device_uuid = device_uuid
+        self.member_ttl = member_ttl
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._published = None
+        self._published_at = None
+
+    @property
+    def members_folder(self):
+        return os.path.join(self.folder, hub_members_folder)
+
+    @property
+    def is_hub(self):
+        return self._lock_file is not None
+
+    def try_become_hub(self):
+        with self._lock:
+            if self._lock_file is not None:
+                return True
+            if not hub_supported():
+                return False
+
+            self._prepare_folder()
+            lock_file = open(os.path.join(self.folder, hub_lock_file), "a+")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+
+            self._lock_file = lock_file
+            self._remove_member_file()
+            return True
+
+    def publish(self, payload):
+        """Hand our announcement to the hub, an unchanged payload only has its file timestamp refreshed"""
+        self._prepare_folder()
+        path = self._member_path(self.device_uuid)
+        now = time.time()
+        if payload == self._published and os.path.exists(path):
+            if now - self._published_at >= self.member_ttl / 3:
+                os.utime(path, None)
+                self._published_at = now
+            return
+
+        temp_path = path + ".tmp"
+        with io.open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(payload))
+        os.replace(temp_path, path)
+        self._published = payload
+        self._published_at = now
+
+    def collect(self, own_payload):
+        """Announcements of this instance and every sibling which published within the member TTL"""
+        payloads = [own_payload]
+        now = time.time()
+        for path in self._sibling_paths():
+            try:
+                if now - os.path.getmtime(path) > self.member_ttl:
+                    # Sibling stopped, drop it from the batch and clean up after it
+                    os.remove(path)
+                    continue
+                with io.open(path, "r", encoding="utf-8") as f:
+                    payload = json.loads(f.read())
+            except (OSError, ValueError):
+                continue
+            if isinstance(payload, dict):
+                payloads.append(payload)
+        return payloads
+
+    def release(self):
+        with self._lock:
+            lock_file, self._lock_file = self._lock_file, None
+        if lock_file is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+        else:
+            self._remove_member_file()
+
+    def status(self):
+        return dict(folder=self.folder, is_hub=self.is_hub, members=self._count_members() if self.is_hub else None)
+
+    def _count_members(self):
+        # Read only, stale member files are left for the next collect to clean up
+        now = time.time()
+        members = 0
+        for path in self._sibling_paths():
+            try:
+                if now - os.path.getmtime(path) <= self.member_ttl:
+                    members += 1
+            except OSError:
+                pass
+        return members
+
+    def _sibling_paths(self):
+        try:
+            entries = os.listdir(self.members_folder)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.members_folder, entry) for entry in sorted(entries)
+                if entry.endswith(".json") and entry[:-len(".json")] != self.device_uuid]
+
+    def _prepare_folder(self):
+        # Checked on every use, the temp folder may have been cleaned up and created again by someone else
+        secure_hub_folder(self.folder)
+        os.makedirs(self.members_folder, mode=0o700, exist_ok=True)
+
+    def _member_path(self, device_uuid):
+        return os.path.join(self.members_folder, f"{device_uuid}.json")
+
+    def _remove_member_file(self):
+        try:
+            os.remove(self._member_path(self.device_uuid))
+        except OSError:
+            pass
+        self._published = None
+
+
+def default_hub_folder():
+    # One folder per user, the instances sharing a hub run as the same user
+    return os.path.join(tempfile.gettempdir(), f"{Config.hub_folder_name}-{os.getuid()}")
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import math
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds, from a LAN round trip up to the default connect plus read timeout
+default_latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Histogram(object):
+    """Fixed bucket histogram, ``observe`` only bumps preallocated slots under an uncontended lock"""
+
+    def __init__(self, name, documentation, buckets=default_latency_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # One slot per upper bound plus the +Inf slot, made cumulative when rendered
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self):
+        return self._count
+
+    def render(self, lines):
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+            total_count = self._count
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} histogram")
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(float(bound))}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(total_sum)}")
+        lines.append(f"{self.name}_count {total_count}")
+
+
+class Counter(object):
+    """Monotonic counter, one value per tuple of label values"""
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        # Unlabelled counters are exported from the start, at zero
+        self._values = dict() if self.label_names else {(): 0}
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, label_values=()):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self, lines):
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: [str(v) for v in item[0]])
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} counter")
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+
+
+class Gauge(object):
+    """Single value which can go up and down, setting it is one attribute store"""
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} gauge")
+        if self.value is not None:
+            lines.append(f"{self.name} {_format_value(self.value)}")
+
+
+class MetricsRegistry(object):
+    """Metrics in registration order, rendered in the Prometheus text exposition format"""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, documentation, buckets=default_latency_buckets):
+        return self._register(Histogram(name, documentation, buckets))
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation):
+        return self._register(Gauge(name, documentation))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+class ConnectorMetrics(MetricsRegistry):
+    """Latency, outcome and state transition metrics of the connector"""
+
+    def __init__(self, clock=time.time):
+        super(ConnectorMetrics, self).__init__()
+        self._clock = clock
+        self.token_seconds = self.histogram(
+            "fdm_connector_token_request_seconds", "Duration of OIDC access_token requests to FDM Monster")
+        self.announce_seconds = self.histogram(
+            "fdm_connector_announce_seconds", "Duration of announcement requests to FDM Monster")
+        self.heartbeat_seconds = self.histogram(
+            "fdm_connector_heartbeat_seconds", "Duration of heartbeat requests to FDM Monster")
+        self.probe_seconds = self.histogram(
+            "fdm_connector_probe_seconds", "Duration of the settings page connection tests")
+        self.state_transitions = self.counter(
+            "fdm_connector_state_transitions_total", "Connector state transitions", ("from", "to"))
+        self.http_responses = self.counter(
+            "fdm_connector_http_responses_total", "FDM Monster responses by status code", ("code",))
+        self.http_failures = self.counter(
+            "fdm_connector_http_failures_total", "FDM Monster requests which got no response")
+        self.sent_bytes = self.counter(
+            "fdm_connector_http_sent_bytes_total", "Request body bytes sent to FDM Monster")
+        self.last_success = self.gauge(
+            "fdm_connector_last_success_timestamp_seconds", "Unix time of the last 2xx response from FDM Monster")
+
+    def record_response(self, response):
+        status_code = response.status_code
+        self.http_responses.inc((status_code,))
+        # Not set on responses built by hand, like a cached or mocked response
+        request = getattr(response, "request", None)
+        body = request.body if request is not None else None
+        if body:
+            self.sent_bytes.inc(amount=len(body))
+        if 200 <= status_code < 300:
+            self.last_success.set(self._clock())
+
+    def record_failure(self):
+        self.http_failures.inc()
+
+    def record_transition(self, previous, state):
+        if previous != state:
+            self.state_transitions.inc((previous, state))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from fdm_connector.constants import Config
+
+# Linear and arc moves, arc fitting slicers extrude along G2/G3
+_moves = frozenset(("G0", "G1", "G2", "G3"))
+# Extruder mode set by each G-code, True for relative
+_extrusion_modes = {"M83": True, "G91": True, "M82": False, "G90": False}
+
+
+class FilamentPedometer(object):
+    """Tracks E-axis extrusion of the G-code sent to the printer, per tool.
+
+    ``on_gcode_sent`` runs on OctoPrint's serial thread for every line, so moves are handled with plain string
+    searches and a single float parse; no regexes and no per-line containers. Lengths are in millimeters of filament.
+    """
+
+    __slots__ = ("relative", "tool", "position", "extruded", "retracted", "lines")
+
+    def __init__(self, tools=Config.pedometer_default_tools):
+        self.relative = False
+        self.tool = 0
+        self.position = 0.0
+        self.extruded = [0.0] * tools
+        self.retracted = [0.0] * tools
+        self.lines = 0
+
+    def reset(self):
+        tools = len(self.extruded)
+        self.relative = False
+        self.tool = 0
+        self.position = 0.0
+        self.extruded = [0.0] * tools
+        self.retracted = [0.0] * tools
+        self.lines = 0
+
+    def on_gcode_sent(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+        self.lines += 1
+        if gcode in _moves:
+            self._move(cmd)
+        elif gcode == "G92":
+            self._set_position(cmd)
+        elif gcode == "T":
+            # OctoPrint only hands over the letter as gcode, the tool number is in the command
+            self._select_tool(cmd)
+        else:
+            relative = _extrusion_modes.get(gcode)
+            if relative is not None:
+                self.relative = relative
+
+    def total(self, tool=None):
+        """Net filament used, retractions which were primed again cancel out"""
+        if tool is None:
+            return sum(self.extruded) - sum(self.retracted)
+        return self.extruded[tool] - self.retracted[tool]
+
+    def snapshot(self):
+        return dict(
+            tool=self.tool,
+            relative=self.relative,
+            extruded=list(self.extruded),
+            retracted=list(self.retracted),
+            total=self.total(),
+            lines=self.lines
+        )
+
+    @staticmethod
+    def _parse_value(cmd, index):
+        end = cmd.find(" ", index)
+        try:
+            return float(cmd[index + 1:] if end < 0 else cmd[index + 1:end])
+        except ValueError:
+            # Trailing comment or checksum, rare enough to take the slow path
+            token = (cmd[index + 1:] if end < 0 else cmd[index + 1:end]).split(";")[0].split("*")[0]
+            try:
+                return float(token)
+            except ValueError:
+                return None
+
+    def _move(self, cmd):
+        index = cmd.find("E")
+        if index < 0:
+            return
+        value = self._parse_value(cmd, index)
+        if value is None:
+            return
+        if self.relative:
+            delta = value
+        else:
+            delta = value - self.position
+            self.position = value
+        if delta > 0:
+            self.extruded[self.tool] += delta
+        else:
+            self.retracted[self.tool] -= delta
+
+    def _set_position(self, cmd):
+        index = cmd.find("E")
+        if index >= 0:
+            value = self._parse_value(cmd, index)
+            if value is not None:
+                self.position = value
+        elif cmd.find("X") < 0 and cmd.find("Y") < 0 and cmd.find("Z") < 0:
+            # A bare G92 resets all axes
+            self.position = 0.0
+
+    def _select_tool(self, cmd):
+        start = cmd.find("T") + 1
+        end = start
+        while end < len(cmd) and cmd[end].isdigit():
+            end += 1
+        if end == start:
+            return
+        tool = int(cmd[start:end])
+        if tool >= len(self.extruded):
+            missing = tool + 1 - len(self.extruded)
+            self.extruded.extend([0.0] * missing)
+            self.retracted.extend([0.0] * missing)
+        self.tool = tool
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import io
+import json
+import os
+import re
+import threading
+
+from fdm_connector.constants import Config, Keys
+
+_persistence_uuid_pattern = re.compile(
+    r'"' + Keys.persistence_uuid_key + r'"\s*:\s*'
+    r'"([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})"'
+)
+
+
+class LoadResult:
+    MISSING = "missing"
+    CACHED = "cached"
+    LOADED = "loaded"
+    RECOVERED = "recovered"
+
+
+def _start_timer(delay, callback):
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class PersistedDataStore(object):
+    """Write-through cache of the backup-excluded persisted data file.
+
+    ``data`` is a single dict which stays the same object for the lifetime of the store. ``load`` only re-reads the
+    file when its mtime or size changed, ``write`` schedules a debounced atomic rewrite and ``flush`` forces it.
+    """
+
+    def __init__(self, flush_delay=Config.persistence_flush_delay_secs, run_later=_start_timer):
+        self.data = dict()
+        self._flush_delay = flush_delay
+        self._run_later = run_later
+        self._lock = threading.RLock()
+        self._filepath = None
+        self._file_signature = None
+        self._dirty = False
+        self._pending_flush = None
+
+    def load(self, filepath):
+        """Refresh the in-memory copy from disk when the file changed, returns a LoadResult value"""
+        with self._lock:
+            self._filepath = filepath
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                self._file_signature = None
+                return LoadResult.MISSING
+
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._file_signature:
+                return LoadResult.CACHED
+
+            with io.open(filepath, "r", encoding="utf-8", errors="replace") as f:
+                raw = f.read()
+            self._file_signature = signature
+            try:
+                persisted = json.loads(raw)
+                if not isinstance(persisted, dict):
+                    raise ValueError("Persisted data is not a JSON object")
+            except ValueError:
+                self._recover(raw)
+                return LoadResult.RECOVERED
+
+            self.data.clear()
+            self.data.update(persisted)
+            return LoadResult.LOADED
+
+    def update(self, values):
+        """Change the in-memory data, atomic with respect to flushes on other threads"""
+        with self._lock:
+            self.data.update(values)
+
+    def write(self, filepath):
+        """Mark the data as changed, the file is rewritten once the debounce delay passes"""
+        with self._lock:
+            self._filepath = filepath
+            self._dirty = True
+            if self._pending_flush is None:
+                self._pending_flush = self._run_later(self._flush_delay, self.flush)
+
+    def flush(self):
+        """Atomically replace the file with the in-memory data if anything changed"""
+        with self._lock:
+            if self._pending_flush is not None:
+                self._pending_flush.cancel()
+                self._pending_flush = None
+            if not self._dirty or self._filepath is None:
+                return False
+
+            self._atomic_write(self._filepath, json.dumps(dict(self.data)))
+            stat = os.stat(self._filepath)
+            self._file_signature = (stat.st_mtime_ns, stat.st_size)
+            self._dirty = False
+            return True
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def _recover(self, raw):
+        """Keep what can be trusted of a corrupt file, most importantly the persistence UUID which identifies this
+        OctoPrint installation to FDM Monster"""
+        persistence_uuid = self.data.get(Keys.persistence_uuid_key, None)
+        if persistence_uuid is None:
+            match = _persistence_uuid_pattern.search(raw)
+            if match is not None:
+                persistence_uuid = match.group(1)
+
+        self.data.clear()
+        if persistence_uuid is not None:
+            self.data[Keys.persistence_uuid_key] = persistence_uuid
+        self._dirty = True
+
+    @staticmethod
+    def _atomic_write(filepath, content):
+        temp_path = filepath + ".tmp"
+        with io.open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+
+        if hasattr(os, "O_DIRECTORY"):
+            # Make the rename itself durable
+            dir_fd = os.open(os.path.dirname(filepath) or ".", os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
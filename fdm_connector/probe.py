@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import json
+import threading
+import time
+
+from fdm_connector.constants import Config
+
+
+def probe_key(endpoint, *values):
+    """Cache key of a probe, credentials only end up in it hashed"""
+    return hashlib.sha256(json.dumps([endpoint] + list(values), default=str).encode("utf-8")).hexdigest()
+
+
+class ProbeCache(object):
+    """Single-flight cache for the settings page probes.
+
+    Concurrent probes with the same key share one outbound call, and its result is served from memory for ``ttl``
+    seconds. ``start_probe`` returns a ``concurrent.futures.Future``; failed probes and results ``cacheable`` rejects
+    aren't cached, so a corrected setting can be tested straight away.
+    """
+
+    def __init__(self, ttl=Config.probe_cache_secs, clock=time.monotonic, cacheable=None):
+        self.ttl = ttl
+        self._clock = clock
+        self._cacheable = cacheable
+        # Reentrant, a probe which already finished runs its done callback right away
+        self._lock = threading.RLock()
+        self._results = dict()
+        self._inflight = dict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, start_probe, timeout):
+        """Result of the probe, raises ``concurrent.futures.TimeoutError`` after ``timeout`` seconds"""
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and self._clock() < cached[0]:
+                self.hits += 1
+                return cached[1]
+
+            future = self._inflight.get(key)
+            if future is None:
+                self.misses += 1
+                future = start_probe()
+                self._inflight[key] = future
+                future.add_done_callback(lambda done: self._complete(key, done))
+            else:
+                self.coalesced += 1
+        return future.result(timeout)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def _complete(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if not future.cancelled() and future.exception() is None and \
+                    (self._cacheable is None or self._cacheable(future.result())):
+                self._results[key] = (self._clock() + self.ttl, future.result())
+            # Expired results are dropped whenever a probe finishes, the cache only holds a handful of keys
+            now = self._clock()
+            for expired in [k for k, (expires_at, _) in self._results.items() if expires_at <= now]:
+                del self._results[expired]
+
+    def status(self):
+        with self._lock:
+            return dict(cached=len(self._results), inflight=len(self._inflight), hits=self.hits, misses=self.misses,
+                        coalesced=self.coalesced)
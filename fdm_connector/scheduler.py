@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from fdm_connector.constants import Config, State
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait according to a Retry-After header, which is either delta-seconds or an HTTP-date"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at is None:
+        return None
+    now = time.time() if now is None else now
+    return max(retry_at.timestamp() - now, 0)
+
+
+class BackoffScheduler(object):
+    """Decides when the next connector tick runs, based on the State the previous tick left behind.
+
+    The first tick is splayed over ``startup_splay`` seconds. SUCCESS and SLEEP wait the regular ``interval``.
+    RETRY and CRASHED back off exponentially with full jitter, so a fleet recovering from a server outage spreads
+    out instead of reconnecting in lockstep. A Retry-After received from FDM Monster is a lower bound for the delay.
+    """
+
+    def __init__(self, get_state, interval,
+                 base_delay=Config.backoff_base_secs,
+                 max_delay=Config.backoff_max_secs,
+                 startup_splay=Config.startup_splay_secs,
+                 rand=random.random,
+                 clock=time.time):
+        self._get_state = get_state
+        self.interval = interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.startup_splay = startup_splay
+        self._rand = rand
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._started = False
+        self._failed_attempts = 0
+        self._retry_after = None
+        self.last_state = None
+        self.next_attempt_at = None
+
+    def record_retry_after(self, header_value):
+        seconds = parse_retry_after(header_value, self._clock())
+        if seconds is not None:
+            with self._lock:
+                self._retry_after = max(seconds, self._retry_after or 0)
+
+    def next_delay(self):
+        state = self._get_state()
+        with self._lock:
+            if not self._started:
+                self._started = True
+                delay = self._rand() * self.startup_splay
+            elif state in (State.RETRY, State.CRASHED):
+                self._failed_attempts += 1
+                cap = min(self.max_delay, self.base_delay * 2 ** (self._failed_attempts - 1))
+                delay = max(self._rand() * cap, Config.backoff_min_secs)
+            else:
+                self._failed_attempts = 0
+                delay = self.interval
+
+            if self._retry_after is not None:
+                delay = max(delay, self._retry_after)
+                self._retry_after = None
+
+            self.last_state = state
+            self.next_attempt_at = self._clock() + delay
+            return delay
+
+    def status(self):
+        with self._lock:
+            return dict(
+                state=self.last_state,
+                failed_attempts=self._failed_attempts,
+                next_attempt_at=self.next_attempt_at,
+                interval=self.interval
+            )
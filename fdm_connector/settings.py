@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from fdm_connector.constants import Config, Keys
+from fdm_connector.wire import WireEncoding
+
+_default_schemes = ("http", "https")
+
+
+def normalize_fdm_host(value):
+    """``scheme://host[/path]`` and the port written in it, None for a missing or unusable host.
+
+    Accepts what users type in the settings: no scheme, trailing slashes, surrounding whitespace or an upper case
+    scheme. A host without scheme is reached over http.
+    """
+    if value is None:
+        return None, None
+    value = str(value).strip().rstrip("/")
+    if not value:
+        return None, None
+    if "://" not in value:
+        value = "http://" + value
+    try:
+        parts = urlsplit(value)
+        port = parts.port
+    except ValueError:
+        return None, None
+    scheme = parts.scheme.lower()
+    if scheme not in _default_schemes or not parts.hostname:
+        return None, None
+    hostname = parts.hostname
+    if ":" in hostname:
+        # IPv6 literal
+        hostname = f"[{hostname}]"
+    return f"{scheme}://{hostname}{parts.path.rstrip('/')}", port
+
+
+def _as_int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value, default):
+    try:
+        return float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+class SettingsSnapshot(namedtuple("SettingsSnapshot", [
+    "fdm_host", "fdm_port", "fdm_base_url", "fdm_host_valid", "port_override", "device_uuid", "oidc_client_id",
+    "oidc_client_secret", "ping", "http_connect_timeout", "http_read_timeout", "http_max_connections_per_host",
+    "hub_mode", "hub_folder", "telemetry_enabled", "tunnel_enabled", "tunnel_port", "server_host", "server_port",
+    "upload_path_suffix", "wire_encoding", "status_push_enabled", "snapshot_url", "snapshot_interval",
+    "snapshot_push_enabled"
+])):
+    """Immutable copy of the plugin settings, read once from OctoPrint's layered settings tree.
+
+    The plugin replaces its snapshot as a whole when the settings are saved, a tick reads one snapshot and can't see
+    half of a settings change. ``fdm_host`` is normalized, ``fdm_base_url`` is None unless host and port are usable.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def read(cls, settings):
+        raw_host = settings.get(["fdm_host"])
+        fdm_host, embedded_port = normalize_fdm_host(raw_host)
+        fdm_port = _as_int(settings.get(["fdm_port"])) or embedded_port
+        fdm_base_url = None
+        if fdm_host is not None and fdm_port is not None:
+            parts = urlsplit(fdm_host)
+            # A path prefix, like FDM Monster behind a reverse proxy, needs the trailing slash to survive urljoin
+            fdm_base_url = f"{parts.scheme}://{parts.netloc}:{fdm_port}" + (f"{parts.path}/" if parts.path else "")
+
+        return cls(
+            fdm_host=fdm_host,
+            fdm_port=fdm_port,
+            fdm_base_url=fdm_base_url,
+            fdm_host_valid=raw_host is None or fdm_host is not None,
+            port_override=_as_int(settings.get(["port_override"])),
+            device_uuid=settings.get([Keys.device_uuid_key]),
+            oidc_client_id=settings.get(["oidc_client_id"]),
+            oidc_client_secret=settings.get(["oidc_client_secret"]),
+            ping=_as_int(settings.get_int(["ping"])),
+            http_connect_timeout=_as_float(settings.get(["http_connect_timeout"]),
+                                           Config.default_http_connect_timeout),
+            http_read_timeout=_as_float(settings.get(["http_read_timeout"]), Config.default_http_read_timeout),
+            http_max_connections_per_host=_as_int(settings.get(["http_max_connections_per_host"]))
+            or Config.default_http_max_connections_per_host,
+            hub_mode=bool(settings.get(["hub_mode"])),
+            hub_folder=settings.get(["hub_folder"]),
+            telemetry_enabled=settings.get(["telemetry_enabled"]) is not False,
+            tunnel_enabled=settings.get(["tunnel_enabled"]) is True,
+            tunnel_port=_as_int(settings.get(["tunnel_port"])),
+            server_host=settings.global_get(["server", "host"]),
+            server_port=_as_int(settings.global_get(["server", "port"])),
+            upload_path_suffix=settings.global_get(["server", "uploads", "pathSuffix"]),
+            wire_encoding=settings.get(["wire_encoding"]) or WireEncoding.AUTO,
+            status_push_enabled=settings.get(["status_push_enabled"]) is not False,
+            # OctoPrint before 1.9, later versions provide the snapshot through webcam provider plugins
+            snapshot_url=settings.get(["snapshot_url"]) or settings.global_get(["webcam", "snapshot"]),
+            snapshot_interval=_as_float(settings.get(["snapshot_interval"]), Config.snapshot_min_interval_secs),
+            snapshot_push_enabled=settings.get(["snapshot_push_enabled"]) is True,
+        )
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from fdm_connector.constants import Config
+
+# A webcam picture, ``etag`` is the hash of its content and ``changed_at`` the time this content was first captured
+Frame = namedtuple("Frame", ["data", "etag", "content_type", "changed_at"])
+
+
+class SnapshotCache(object):
+    """Latest webcam snapshot, captured at most once per ``min_interval`` seconds however many viewers ask.
+
+    The first request after the interval starts ``capture`` on a thread of its own, requests arriving meanwhile wait
+    for that capture instead of starting their own. Every request waits at most its ``timeout``, a capture which takes
+    longer keeps running and is shared by the requests after it. A capture with the same content as the cached frame
+    keeps the frame and its ETag, so viewers revalidating get a 304. When a capture fails the previous frame is
+    served, if there is one, and the webcam isn't asked again before the interval passed.
+    """
+
+    def __init__(self, capture, min_interval=Config.snapshot_min_interval_secs, clock=time.monotonic):
+        self._capture = capture
+        self.min_interval = min_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._frame = None
+        self._captured_at = None
+        # Exception of the last capture, None when it succeeded
+        self._error = None
+        self._inflight = None
+        self.hits = 0
+        self.captures = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.failures = 0
+        self.stale = 0
+
+    def get(self, timeout=None):
+        """Current frame, raises the capture's exception or ``concurrent.futures.TimeoutError`` without a frame"""
+        with self._lock:
+            if self._captured_at is not None and self._clock() - self._captured_at < self.min_interval:
+                if self._error is None:
+                    self.hits += 1
+                    return self._frame
+                if self._frame is not None:
+                    self.stale += 1
+                    return self._frame
+                # Raised again without its previous traceback, which would grow with every request
+                raise self._error.with_traceback(None)
+            future = self._inflight
+            leader = future is None
+            if leader:
+                future = self._inflight = Future()
+                self.captures += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            threading.Thread(target=self._run_capture, args=(future,), name="fdm-connector-snapshot",
+                             daemon=True).start()
+        try:
+            return future.result(timeout)
+        except Exception:
+            with self._lock:
+                frame = self._frame
+                if frame is not None:
+                    self.stale += 1
+            if frame is None:
+                raise
+            return frame
+
+    def _run_capture(self, future):
+        try:
+            data, content_type = self._capture()
+            # Hashed outside the lock, waiting viewers only need the result
+            etag = hashlib.sha256(data).hexdigest()
+        except Exception as e:
+            with self._lock:
+                self._inflight = None
+                self._error = e
+                self._captured_at = self._clock()
+                self.failures += 1
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            self._inflight = None
+            self._error = None
+            if self._frame is not None and self._frame.etag == etag:
+                self.unchanged += 1
+            else:
+                self._frame = Frame(data, etag, content_type, time.time())
+            self._captured_at = self._clock()
+            frame = self._frame
+        future.set_result(frame)
+
+    def status(self):
+        with self._lock:
+            frame = self._frame
+            return dict(
+                etag=frame.etag if frame is not None else None,
+                bytes=len(frame.data) if frame is not None else 0,
+                changed_at=frame.changed_at if frame is not None else None,
+                min_interval=self.min_interval,
+                hits=self.hits,
+                captures=self.captures,
+                coalesced=self.coalesced,
+                unchanged=self.unchanged,
+                failures=self.failures,
+                stale=self.stale
+            )
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import io
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+from fdm_connector.constants import Config
+
+# Record header: payload length and CRC32 of the payload, little endian
+_header = struct.Struct("<II")
+_segment_suffix = ".seg"
+_cursor_file = "cursor.json"
+
+
+class OfflineSpool(object):
+    """Durable append-only log of records which could not be delivered to FDM Monster.
+
+    Records are length-prefixed, CRC checked JSON documents in numbered segment files. Appends only hit the write
+    buffer, ``sync`` flushes and fsyncs them in groups and is meant to run off the printer's comm thread. Segments
+    rotate at ``segment_size`` bytes and the oldest segments are deleted once the spool exceeds ``max_bytes``.
+    Replay reads closed segments in order and remembers its position in a cursor file, so a restart doesn't replay
+    records FDM Monster already accepted.
+    """
+
+    def __init__(self, folder,
+                 segment_size=Config.spool_segment_bytes,
+                 max_bytes=Config.spool_max_bytes,
+                 sync_interval=Config.spool_sync_secs,
+                 clock=time.monotonic):
+        self.folder = folder
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._replay_lock = threading.Lock()
+        self._active = None
+        self._active_sequence = None
+        self._active_size = 0
+        # Segments rotated out since the last sync, fsynced by the next one
+        self._closed_unsynced = []
+        self._unsynced = 0
+        self._last_sync = clock()
+        self._cursor = None
+        self.appended = 0
+        self.replayed = 0
+        self.corrupt = 0
+        self.dropped_segments = 0
+
+    def open(self):
+        with self._lock:
+            os.makedirs(self.folder, exist_ok=True)
+            self._cursor = self._read_cursor()
+            segments = self._segments()
+            self._active_sequence = (segments[-1] + 1) if segments else 1
+            self._active = None
+            self._active_size = 0
+
+    def append(self, kind, payload):
+        """Buffered append, never fsyncs on the calling thread"""
+        record = json.dumps({"kind": kind, "t": time.time(), "payload": payload},
+                            separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            if self._active_sequence is None:
+                self.open()
+            if self._active is not None and self._active_size + _header.size + len(record) > self.segment_size:
+                self._close_active()
+            if self._active is None:
+                self._active = io.open(self._segment_path(self._active_sequence), "ab")
+                self._active_size = self._active.tell()
+            self._active.write(_header.pack(len(record), zlib.crc32(record) & 0xffffffff))
+            self._active.write(record)
+            self._active_size += _header.size + len(record)
+            self._unsynced += 1
+            self.appended += 1
+
+    @property
+    def needs_sync(self):
+        return self._unsynced > 0 and (self._unsynced >= Config.spool_sync_records
+                                       or self._clock() - self._last_sync >= self.sync_interval)
+
+    def sync(self):
+        """Flush and fsync all appended records as one group"""
+        with self._lock:
+            closed, self._closed_unsynced = self._closed_unsynced, []
+            for sequence in closed:
+                self._fsync_segment(sequence)
+            if self._active is not None and self._unsynced:
+                self._active.flush()
+                os.fsync(self._active.fileno())
+            self._unsynced = 0
+            self._last_sync = self._clock()
+
+    def has_backlog(self):
+        with self._lock:
+            return self._active is not None or bool(self._segments())
+
+    def replay(self, upload, batch_size=Config.spool_replay_batch):
+        """Hand spooled records to ``upload`` in order and in batches, stops at the first batch it rejects.
+        Returns the number of records FDM Monster accepted."""
+        with self._replay_lock:
+            with self._lock:
+                if self._active is not None:
+                    self._close_active()
+                segments = self._segments()
+
+            replayed = 0
+            for sequence in segments:
+                start = self._cursor["offset"] if self._cursor and self._cursor["segment"] == sequence else 0
+                try:
+                    records, offsets = self._read_segment(sequence, start)
+                except FileNotFoundError:
+                    # Dropped by the size cap of an append rotating meanwhile
+                    continue
+                for index in range(0, len(records), batch_size):
+                    if not upload(records[index:index + batch_size]):
+                        self._write_cursor(sequence, offsets[index])
+                        self.replayed += replayed
+                        return replayed
+                    replayed += len(records[index:index + batch_size])
+                    self._write_cursor(sequence, offsets[min(index + batch_size, len(records))])
+                self._remove_segment(sequence)
+            self._clear_cursor()
+            self.replayed += replayed
+            return replayed
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self.sync()
+                self._active.close()
+                self._active = None
+
+    def status(self):
+        with self._lock:
+            segments = self._segments()
+            return dict(
+                segments=len(segments) + (1 if self._active is not None and self._active_sequence not in segments
+                                          else 0),
+                bytes=self._total_bytes(segments),
+                unsynced=self._unsynced,
+                appended=self.appended,
+                replayed=self.replayed,
+                corrupt=self.corrupt,
+                dropped_segments=self.dropped_segments
+            )
+
+    def _close_active(self):
+        # Rotation runs on the appending thread, the fsync is left to the next sync
+        self._active.close()
+        self._closed_unsynced.append(self._active_sequence)
+        self._active = None
+        self._active_sequence += 1
+        self._active_size = 0
+        self._enforce_cap()
+
+    def _fsync_segment(self, sequence):
+        try:
+            fd = os.open(self._segment_path(sequence), os.O_RDWR)
+        except FileNotFoundError:
+            # Already replayed or dropped by the size cap
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _enforce_cap(self):
+        segments = self._segments()
+        while len(segments) > 1 and self._total_bytes(segments) > self.max_bytes:
+            self._remove_segment(segments.pop(0))
+            self.dropped_segments += 1
+
+    def _read_segment(self, sequence, start):
+        """Valid records from ``start`` on, with the offset of each record plus the end offset"""
+        records = []
+        offsets = []
+        with io.open(self._segment_path(sequence), "rb") as f:
+            data = f.read()
+        position = start
+        while position + _header.size <= len(data):
+            length, crc = _header.unpack_from(data, position)
+            end = position + _header.size + length
+            body = data[position + _header.size:end]
+            if end > len(data) or zlib.crc32(body) & 0xffffffff != crc:
+                # Torn write at the tail or bit rot, nothing after it can be trusted
+                self.corrupt += 1
+                break
+            try:
+                records.append(json.loads(body.decode("utf-8")))
+            except ValueError:
+                self.corrupt += 1
+                break
+            offsets.append(position)
+            position = end
+        offsets.append(position)
+        return records, offsets
+
+    def _segments(self):
+        try:
+            entries = os.listdir(self.folder)
+        except FileNotFoundError:
+            return []
+        return sorted(int(entry[:-len(_segment_suffix)]) for entry in entries
+                      if entry.endswith(_segment_suffix) and entry[:-len(_segment_suffix)].isdigit())
+
+    def _total_bytes(self, segments):
+        total = 0
+        for sequence in segments:
+            try:
+                total += os.path.getsize(self._segment_path(sequence))
+            except OSError:
+                pass
+        return total
+
+    def _segment_path(self, sequence):
+        return os.path.join(self.folder, f"{sequence:012d}{_segment_suffix}")
+
+    def _remove_segment(self, sequence):
+        try:
+            os.remove(self._segment_path(sequence))
+        except FileNotFoundError:
+            pass
+        if self._cursor and self._cursor["segment"] == sequence:
+            self._clear_cursor()
+
+    def _read_cursor(self):
+        try:
+            with io.open(os.path.join(self.folder, _cursor_file), "r", encoding="utf-8") as f:
+                cursor = json.loads(f.read())
+            return dict(segment=int(cursor["segment"]), offset=int(cursor["offset"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_cursor(self, sequence, offset):
+        self._cursor = dict(segment=sequence, offset=offset)
+        path = os.path.join(self.folder, _cursor_file)
+        with io.open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(json.dumps(self._cursor))
+        os.replace(path + ".tmp", path)
+
+    def _clear_cursor(self):
+        self._cursor = None
+        try:
+            os.remove(os.path.join(self.folder, _cursor_file))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+from fdm_connector.constants import Config
+
+
+def _job_fields(payload, result):
+    return {"jobName": payload.get("name"), "jobOrigin": payload.get("origin"), "jobResult": result, "error": None}
+
+
+# OctoPrint event name to the status fields it changes, events not listed here are ignored
+_event_fields = {
+    "Connected": lambda payload: {"connected": True, "error": None},
+    "Disconnected": lambda payload: {"connected": False},
+    "PrinterStateChanged": lambda payload: {"state": payload.get("state_id"), "stateText": payload.get("state_string")},
+    "PrintStarted": lambda payload: _job_fields(payload, "printing"),
+    "PrintPaused": lambda payload: {"jobResult": "paused"},
+    "PrintResumed": lambda payload: {"jobResult": "printing"},
+    "PrintDone": lambda payload: {"jobResult": "done", "jobTime": payload.get("time")},
+    "PrintFailed": lambda payload: {"jobResult": "failed", "error": payload.get("reason")},
+    "PrintCancelled": lambda payload: {"jobResult": "cancelled"},
+    "Error": lambda payload: {"error": payload.get("error")},
+}
+
+status_events = frozenset(_event_fields)
+
+
+def fields_for_event(event, payload):
+    """Status fields an OctoPrint event changes, None for events which don't change the pushed status"""
+    fields = _event_fields.get(event)
+    return fields(payload or {}) if fields is not None else None
+
+
+class StatusPusher(object):
+    """Pushes printer status changes to FDM Monster, coalesced per ``debounce`` window.
+
+    Events update the current status. The first change after a push opens a window, at its end one push sends the
+    fields which differ from what FDM Monster acknowledged last; a field which changed back and forth within the
+    window isn't sent at all. A rejected push is retried after ``retry_delay`` with whatever changed by then.
+    """
+
+    def __init__(self, send, debounce=Config.status_debounce_secs, retry_delay=Config.status_retry_secs,
+                 clock=time.monotonic):
+        self._send = send
+        self.debounce = debounce
+        self.retry_delay = retry_delay
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._current = {}
+        self._acknowledged = {}
+        self._window_open = False
+        self.enabled = True
+        self.events = 0
+        self.pushes = 0
+        self.failed_pushes = 0
+        self.fields_sent = 0
+        self.last_push_at = None
+
+    def update(self, fields):
+        """Merge changed fields into the current status, returns True when this opened a new debounce window"""
+        with self._lock:
+            self.events += 1
+            self._current.update(fields)
+            if not self.enabled or self._window_open or not self._changed_locked():
+                return False
+            self._window_open = True
+            return True
+
+    def changed(self):
+        with self._lock:
+            return self._changed_locked()
+
+    def _changed_locked(self):
+        acknowledged = self._acknowledged
+        return {key: value for key, value in self._current.items()
+                if key not in acknowledged or acknowledged[key] != value}
+
+    def flush(self):
+        """Push the changed fields, returns the delay before the next attempt or None when nothing is left"""
+        with self._flush_lock:
+            with self._lock:
+                self._window_open = False
+                changed = self._changed_locked() if self.enabled else {}
+            if not changed:
+                return None
+
+            if not self._send(changed):
+                with self._lock:
+                    self.failed_pushes += 1
+                    if not self.enabled or self._window_open:
+                        return None
+                    self._window_open = True
+                return self.retry_delay
+
+            with self._lock:
+                self._acknowledged.update(changed)
+                self.pushes += 1
+                self.fields_sent += len(changed)
+                self.last_push_at = self._clock()
+            return None
+
+    def resync(self):
+        """FDM Monster lost track, the next push sends the whole status"""
+        with self._lock:
+            self._acknowledged = {}
+
+    def disable(self):
+        with self._lock:
+            self.enabled = False
+
+    def status(self):
+        with self._lock:
+            return dict(
+                enabled=self.enabled,
+                current=dict(self._current),
+                pending=sorted(self._changed_locked()),
+                events=self.events,
+                pushes=self.pushes,
+                failed_pushes=self.failed_pushes,
+                fields_sent=self.fields_sent,
+                last_push_at=self.last_push_at
+            )
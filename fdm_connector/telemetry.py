@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+from fdm_connector.constants import Config
+
+
+class TelemetryBuffer(object):
+    """Bounded ring buffer of telemetry samples with preallocated slots.
+
+    Pushing never allocates a container. When the buffer is full a sample replaces the newest queued sample with the
+    same kind and key (coalescing), only when there is none the oldest sample is overwritten and counted as dropped.
+    """
+
+    def __init__(self, capacity=Config.telemetry_buffer_capacity, clock=time.time):
+        self.capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._timestamps = [0.0] * capacity
+        self._kinds = [None] * capacity
+        self._keys = [None] * capacity
+        self._values = [None] * capacity
+        self._head = 0
+        self._size = 0
+        self.pushed = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, kind, key, value, timestamp=None):
+        if timestamp is None:
+            timestamp = self._clock()
+        with self._lock:
+            self.pushed += 1
+            if self._size < self.capacity:
+                slot = (self._head + self._size) % self.capacity
+                self._size += 1
+            else:
+                slot = self._find_newest(kind, key)
+                if slot >= 0:
+                    self.coalesced += 1
+                else:
+                    slot = self._head
+                    self._head = (self._head + 1) % self.capacity
+                    self.dropped += 1
+            self._timestamps[slot] = timestamp
+            self._kinds[slot] = kind
+            self._keys[slot] = key
+            self._values[slot] = value
+
+    def oldest_timestamp(self):
+        with self._lock:
+            return self._timestamps[self._head] if self._size else None
+
+    def drain(self, max_samples):
+        """Remove and return up to ``max_samples`` samples, oldest first"""
+        with self._lock:
+            count = min(max_samples, self._size)
+            samples = []
+            for _ in range(count):
+                slot = self._head
+                samples.append(dict(t=self._timestamps[slot], kind=self._kinds[slot], key=self._keys[slot],
+                                    value=self._values[slot]))
+                self._values[slot] = None
+                self._head = (self._head + 1) % self.capacity
+            self._size -= count
+            return samples
+
+    def clear(self):
+        with self._lock:
+            for slot in range(self.capacity):
+                self._values[slot] = None
+            self._head = 0
+            self._size = 0
+
+    def _find_newest(self, kind, key):
+        # Only scanned while the buffer overflows
+        for offset in range(self._size - 1, -1, -1):
+            slot = (self._head + offset) % self.capacity
+            if self._keys[slot] == key and self._kinds[slot] == kind:
+                return slot
+        return -1
+
+
+class TelemetryUploader(object):
+    """Flushes the TelemetryBuffer in batches once ``batch_size`` samples are queued or the oldest is ``max_age``
+    seconds old. ``send_batch`` returns True when FDM Monster accepted the batch, a rejected batch is handed to
+    ``spill`` when given (the offline spool) and queued again otherwise."""
+
+    def __init__(self, buffer, send_batch,
+                 batch_size=Config.telemetry_batch_size,
+                 max_age=Config.telemetry_max_age_secs,
+                 clock=time.time,
+                 spill=None):
+        self.buffer = buffer
+        self._send_batch = send_batch
+        self.spill = spill
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self._clock = clock
+        self._flush_lock = threading.Lock()
+        self.enabled = True
+        self.batches_sent = 0
+        self.samples_sent = 0
+        self.failed_batches = 0
+        self.spilled_samples = 0
+        self.last_flush_at = None
+
+    def push(self, kind, key, value, timestamp=None):
+        if self.enabled:
+            self.buffer.push(kind, key, value, timestamp)
+
+    def should_flush(self):
+        if not self.enabled or not len(self.buffer):
+            return False
+        if len(self.buffer) >= self.batch_size:
+            return True
+        oldest = self.buffer.oldest_timestamp()
+        return oldest is not None and self._clock() - oldest >= self.max_age
+
+    def flush(self, force=False):
+        """Send queued samples, returns the number of samples FDM Monster accepted"""
+        with self._flush_lock:
+            sent = 0
+            while self.enabled and (force and len(self.buffer) or self.should_flush()):
+                batch = self.buffer.drain(self.batch_size)
+                if not self._send_batch(batch):
+                    self.failed_batches += 1
+                    if self.spill is not None:
+                        self.spill(batch)
+                        self.spilled_samples += len(batch)
+                        break
+                    for sample in batch:
+                        self.buffer.push(sample["kind"], sample["key"], sample["value"], sample["t"])
+                    break
+                self.batches_sent += 1
+                self.samples_sent += len(batch)
+                sent += len(batch)
+            self.last_flush_at = self._clock()
+            return sent
+
+    def disable(self):
+        self.enabled = False
+        self.buffer.clear()
+
+    def status(self):
+        return dict(
+            enabled=self.enabled,
+            queue_depth=len(self.buffer),
+            capacity=self.buffer.capacity,
+            pushed=self.buffer.pushed,
+            coalesced=self.buffer.coalesced,
+            dropped=self.buffer.dropped,
+            batches_sent=self.batches_sent,
+            samples_sent=self.samples_sent,
+            failed_batches=self.failed_batches,
+            spilled_samples=self.spilled_samples,
+            last_flush_at=self.last_flush_at
+        )
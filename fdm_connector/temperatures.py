@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from fdm_connector.constants import Config
+
+
+class HeaterSeries(object):
+    """Fixed-size ring of (time, actual, target) samples of one heater, in typed arrays of doubles.
+
+    Appending never allocates. When the ring is full the oldest sample is overwritten and counted as dropped, so the
+    memory of a heater is bounded by ``capacity`` at 24 bytes per sample.
+    """
+
+    __slots__ = ("capacity", "times", "actual", "target", "_head", "_size", "dropped")
+
+    def __init__(self, capacity=Config.temperature_history_samples):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.actual = array("d", bytes(8 * capacity))
+        self.target = array("d", bytes(8 * capacity))
+        self._head = 0
+        self._size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, actual, target):
+        if self._size < self.capacity:
+            slot = (self._head + self._size) % self.capacity
+            self._size += 1
+        else:
+            slot = self._head
+            self._head = (self._head + 1) % self.capacity
+            self.dropped += 1
+        self.times[slot] = timestamp
+        self.actual[slot] = actual
+        # NaN while the heater has no target
+        self.target[slot] = math.nan if target is None else target
+
+    def oldest_timestamp(self):
+        return self.times[self._head] if self._size else None
+
+    def take_before(self, until):
+        """Remove the samples older than ``until``, returns their times, actual and target arrays, oldest first"""
+        times, actual, target = self._ordered()
+        count = bisect_left(times, until)
+        self._head = (self._head + count) % self.capacity
+        self._size -= count
+        return times[:count], actual[:count], target[:count]
+
+    def _ordered(self):
+        head, end = self._head, self._head + self._size
+        if end <= self.capacity:
+            return self.times[head:end], self.actual[head:end], self.target[head:end]
+        end -= self.capacity
+        return (self.times[head:] + self.times[:end], self.actual[head:] + self.actual[:end],
+                self.target[head:] + self.target[:end])
+
+    def nbytes(self):
+        return sum(values.buffer_info()[1] * values.itemsize for values in (self.times, self.actual, self.target))
+
+
+def downsample(times, actual, target, bucket_secs):
+    """Min, max and last temperature per ``bucket_secs`` bucket, aligned to multiples of ``bucket_secs``.
+
+    Returns (time of the last sample, min, max, last, target) per bucket. Bucket edges are found by bisecting the
+    sorted times and min and max run over array slices, the per-sample work stays in C.
+    """
+    buckets = []
+    start, count = 0, len(times)
+    while start < count:
+        bucket_end = (math.floor(times[start] / bucket_secs) + 1) * bucket_secs
+        end = bisect_left(times, bucket_end, start)
+        window = actual[start:end]
+        last_target = target[end - 1]
+        buckets.append((times[end - 1], min(window), max(window), window[-1],
+                        None if math.isnan(last_target) else last_target))
+        start = end
+    return buckets
+
+
+class TemperatureCapture(object):
+    """Captures the heater temperatures OctoPrint parses from the printer, one HeaterSeries per heater.
+
+    ``on_temperatures_received`` runs on OctoPrint's serial thread for every temperature report, it only appends to
+    the rings. ``collect`` downsamples the buckets which are complete, for the telemetry upload.
+    """
+
+    def __init__(self, capacity=Config.temperature_history_samples, bucket_secs=Config.temperature_bucket_secs,
+                 max_heaters=Config.temperature_max_heaters, clock=time.time):
+        self.capacity = capacity
+        self.bucket_secs = bucket_secs
+        self.max_heaters = max_heaters
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._heaters = {}
+        self.enabled = True
+        self.reports = 0
+        self.ignored_heaters = 0
+
+    def on_temperatures_received(self, comm_instance, parsed_temperatures, *args, **kwargs):
+        if not self.enabled:
+            return parsed_temperatures
+        now = self._clock()
+        with self._lock:
+            self.reports += 1
+            for heater, (actual, target) in parsed_temperatures.items():
+                if actual is None:
+                    continue
+                series = self._heaters.get(heater)
+                if series is None:
+                    if len(self._heaters) >= self.max_heaters:
+                        self.ignored_heaters += 1
+                        continue
+                    series = self._heaters[heater] = HeaterSeries(self.capacity)
+                series.append(now, actual, target)
+        # The hook hands the temperatures on to the next plugin
+        return parsed_temperatures
+
+    def collect(self, now=None):
+        """Downsampled buckets which ended before ``now``, as (heater, bucket) pairs"""
+        now = self._clock() if now is None else now
+        until = math.floor(now / self.bucket_secs) * self.bucket_secs
+        taken = []
+        with self._lock:
+            for heater, series in self._heaters.items():
+                oldest = series.oldest_timestamp()
+                if oldest is not None and oldest < until:
+                    taken.append((heater, series.take_before(until)))
+        # Outside the lock, the serial thread isn't held up by the downsampling
+        return [(heater, bucket) for heater, (times, actual, target) in taken
+                for bucket in downsample(times, actual, target, self.bucket_secs)]
+
+    def status(self):
+        with self._lock:
+            return dict(
+                enabled=self.enabled,
+                reports=self.reports,
+                heaters={heater: len(series) for heater, series in self._heaters.items()},
+                dropped=sum(series.dropped for series in self._heaters.values()),
+                ignored_heaters=self.ignored_heaters,
+                bytes=sum(series.nbytes() for series in self._heaters.values())
+            )
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+from datetime import datetime
+
+from fdm_connector.constants import Config
+
+
+def _utc_timestamp():
+    # Same time base as the 'requested_at' value written to the persisted data file
+    return datetime.utcnow().timestamp()
+
+
+def _run_in_thread(target):
+    threading.Thread(target=target, name="fdm-connector-token-refresh", daemon=True).start()
+
+
+class TokenManager(object):
+    """Keeps the OIDC access_token in memory and tracks its expiry on the monotonic clock.
+
+    ``fetch_token`` is called to obtain a new token and is expected to hand the result to ``update``. Once a token
+    enters its refresh window ``get_token`` keeps returning it while a refresh runs in the background, so callers
+    only ever block when there is no usable token at all. At most one fetch is in flight: threads calling ``refresh``
+    meanwhile wait for it and share its result. A failed background refresh is retried after ``retry_delay``,
+    doubling up to ``max_retry_delay`` while the token endpoint keeps failing.
+    """
+
+    def __init__(self, fetch_token,
+                 refresh_margin=Config.token_refresh_margin_secs,
+                 retry_delay=Config.token_refresh_retry_secs,
+                 max_retry_delay=Config.token_refresh_max_retry_secs,
+                 clock=time.monotonic,
+                 wall_clock=_utc_timestamp,
+                 run_in_background=_run_in_thread):
+        self._fetch_token = fetch_token
+        self._refresh_margin = refresh_margin
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._run_in_background = run_in_background
+        self._lock = threading.Lock()
+        self._fetched = threading.Condition(self._lock)
+        self._access_token = None
+        self._expires_at = None
+        self._refresh_at = None
+        self._refreshing = False
+        self._refresh_failures = 0
+        self._fetching = False
+        self._fetch_generation = 0
+        self._fetch_result = False
+        self.fetches = 0
+        self.shared_fetches = 0
+
+    def load(self, persisted_data):
+        """Restore a token persisted by an earlier run. The wall clock is only consulted here, after this the
+        remaining lifetime is tracked on the monotonic clock."""
+        access_token = persisted_data.get("access_token", None)
+        requested_at = persisted_data.get("requested_at", None)
+        expires_in = self._parse_lifetime(persisted_data.get("expires_in", None))
+        if not access_token or requested_at is None:
+            return False
+
+        remaining = requested_at + expires_in - self._wall_clock()
+        if remaining <= 0:
+            return False
+        self._set_token(access_token, remaining, expires_in)
+        return True
+
+    def update(self, at_data):
+        """Store a freshly received token, returns whether the token differs from the one held in memory"""
+        expires_in = self._parse_lifetime(at_data.get("expires_in", None))
+        with self._lock:
+            changed = at_data["access_token"] != self._access_token
+        self._set_token(at_data["access_token"], expires_in, expires_in)
+        return changed
+
+    def invalidate(self):
+        with self._lock:
+            self._access_token = None
+            self._expires_at = None
+            self._refresh_at = None
+
+    def get_token(self):
+        """Return the current token or None when there is no unexpired token. Never blocks on the token endpoint."""
+        now = self._clock()
+        with self._lock:
+            if self._access_token is None or now >= self._expires_at:
+                return None
+            token = self._access_token
+            refresh_due = now >= self._refresh_at and not self._refreshing and not self._fetching
+            if refresh_due:
+                self._refreshing = True
+        if refresh_due:
+            self._run_in_background(self._background_refresh)
+        return token
+
+    def refresh(self, timeout=None):
+        """Fetch a new token on the calling thread, or wait for the fetch already in flight and return its result"""
+        with self._lock:
+            if self._fetching:
+                self.shared_fetches += 1
+                generation = self._fetch_generation
+                if not self._fetched.wait_for(lambda: self._fetch_generation != generation, timeout):
+                    return False
+                return self._fetch_result
+            self._fetching = True
+            self.fetches += 1
+
+        result = False
+        try:
+            result = self._fetch_token()
+        finally:
+            with self._lock:
+                self._fetching = False
+                self._fetch_generation += 1
+                self._fetch_result = result
+                self._fetched.notify_all()
+        return result
+
+    def get_or_refresh(self):
+        """Current token, fetched first when there is none. Concurrent callers share a single fetch."""
+        token = self.get_token()
+        if token is None:
+            self.refresh()
+            token = self.get_token()
+        return token
+
+    def seconds_until_expiry(self):
+        with self._lock:
+            if self._access_token is None:
+                return None
+            return max(self._expires_at - self._clock(), 0)
+
+    @property
+    def refreshing(self):
+        return self._refreshing or self._fetching
+
+    def _background_refresh(self):
+        result = False
+        try:
+            result = self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+                if not result and self._refresh_at is not None:
+                    # Keep serving the current token, but don't ask the failing endpoint again on every call
+                    delay = min(self._retry_delay * 2 ** self._refresh_failures, self._max_retry_delay)
+                    self._refresh_failures += 1
+                    self._refresh_at = self._clock() + delay
+
+    def _set_token(self, access_token, remaining, lifetime):
+        now = self._clock()
+        # Refresh ahead of expiry, short-lived tokens are refreshed after 80% of their lifetime
+        margin = min(self._refresh_margin, lifetime * 0.2)
+        with self._lock:
+            self._access_token = access_token
+            self._expires_at = now + remaining
+            self._refresh_at = self._expires_at - margin
+            self._refresh_failures = 0
+
+    @staticmethod
+    def _parse_lifetime(expires_in):
+        try:
+            return max(float(expires_in), 0)
+        except (TypeError, ValueError):
+            # Unknown lifetime, treat the token as usable only once
+            return 0
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import io
+import json
+import os
+import re
+import threading
+import time
+
+from fdm_connector.constants import Config
+
+_upload_id_pattern = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_part_suffix = ".part"
+_meta_suffix = ".json"
+
+
+class TransferError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super(TransferError, self).__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class UploadTransfers(object):
+    """Resumable uploads, each written to ``<folder>/<upload_id>.part`` next to a small metadata file.
+
+    Bodies are copied in ``chunk_size`` blocks through one reusable buffer per thread, or by the kernel with
+    ``os.sendfile`` when the source is a file, so memory use doesn't depend on the file size. The offset of an
+    upload is the size of its part file, after a dropped connection the client asks for it and continues there.
+    """
+
+    def __init__(self, folder, chunk_size=Config.transfer_chunk_bytes, max_age=Config.transfer_max_age_secs):
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._active = set()
+        self._buffers = threading.local()
+        self.bytes_received = 0
+        self.completed = 0
+
+    def begin(self, upload_id, filename, size):
+        """Metadata of the upload, created on the first chunk. A resumed upload must keep its name and size."""
+        self._validate_id(upload_id)
+        meta = self._read_meta(upload_id)
+        if meta is not None:
+            if (filename is not None and filename != meta["filename"]) or (size is not None and size != meta["size"]):
+                raise TransferError(f"Upload '{upload_id}' was started for another file", 409, self.offset(upload_id))
+            return meta
+        if not filename:
+            raise TransferError("Expected 'filename' parameter")
+        if size is None or size < 0:
+            raise TransferError("Expected the total file size in 'Content-Range' or the 'size' parameter")
+
+        os.makedirs(self.folder, exist_ok=True)
+        meta = dict(filename=filename, size=size, started=time.time())
+        temp_path = self._path(upload_id, _meta_suffix) + ".tmp"
+        with io.open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(meta))
+        os.replace(temp_path, self._path(upload_id, _meta_suffix))
+        io.open(self._path(upload_id, _part_suffix), "ab").close()
+        return meta
+
+    def offset(self, upload_id):
+        try:
+            return os.path.getsize(self._path(upload_id, _part_suffix))
+        except OSError:
+            return None
+
+    def status(self, upload_id):
+        self._validate_id(upload_id)
+        meta = self._read_meta(upload_id)
+        if meta is None:
+            return None
+        return dict(uploadId=upload_id, filename=meta["filename"], size=meta["size"], offset=self.offset(upload_id))
+
+    def append(self, upload_id, offset, source, length=None):
+        """Copy ``length`` bytes (or up to EOF) of the ``source`` stream to the upload, returns the new offset"""
+        with self._writing(upload_id, offset) as (part, remaining):
+            if length is not None and length > remaining:
+                raise TransferError("Chunk extends beyond the announced file size", 416, offset)
+            limit = remaining if length is None else length
+            copied = self._copy(source, part, limit)
+            if length is None and copied == limit and self._peek(source):
+                part.truncate(offset)
+                raise TransferError("Chunk extends beyond the announced file size", 416, offset)
+            self.bytes_received += copied
+            return offset + copied
+
+    def append_file(self, upload_id, offset, path):
+        """Append a file already on disk, like the temp file OctoPrint spools multipart bodies to"""
+        length = os.path.getsize(path)
+        if offset == 0 and length and self.offset(upload_id) == 0:
+            # Whole file in one request: take over the temp file instead of copying it
+            with self._writing(upload_id, offset) as (part, remaining):
+                if length > remaining:
+                    raise TransferError("Chunk extends beyond the announced file size", 416, offset)
+                try:
+                    os.replace(path, self._path(upload_id, _part_suffix))
+                    self.bytes_received += length
+                    return length
+                except OSError:
+                    # Other filesystem, fall through to a copy
+                    pass
+        with io.open(path, "rb") as source:
+            return self.append(upload_id, offset, source, length)
+
+    def is_complete(self, upload_id):
+        meta = self._read_meta(upload_id)
+        return meta is not None and self.offset(upload_id) == meta["size"]
+
+    def finish(self, upload_id):
+        """Path of the completed part file, the caller moves it away before calling ``discard``"""
+        if not self.is_complete(upload_id):
+            raise TransferError(f"Upload '{upload_id}' is not complete", 409, self.offset(upload_id))
+        self.completed += 1
+        return self._path(upload_id, _part_suffix)
+
+    def discard(self, upload_id):
+        self._validate_id(upload_id)
+        for suffix in (_part_suffix, _meta_suffix):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def purge_stale(self):
+        """Remove uploads which didn't receive data for ``max_age`` seconds, returns how many were removed"""
+        try:
+            entries = os.listdir(self.folder)
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        purged = 0
+        for entry in entries:
+            if not entry.endswith(_meta_suffix):
+                continue
+            upload_id = entry[:-len(_meta_suffix)]
+            with self._lock:
+                if upload_id in self._active:
+                    continue
+            part_path = self._path(upload_id, _part_suffix)
+            last_write = os.path.getmtime(part_path) if os.path.exists(part_path) else 0
+            if now - last_write > self.max_age:
+                self.discard(upload_id)
+                purged += 1
+        return purged
+
+    def _writing(self, upload_id, offset):
+        return _PartWriter(self, upload_id, offset)
+
+    def _copy(self, source, target, limit):
+        fileno = self._fileno(source)
+        if fileno is not None and hasattr(os, "sendfile"):
+            copied = self._copy_sendfile(fileno, target, limit)
+            if copied is not None:
+                return copied
+        return self._copy_buffered(source, target, limit)
+
+    def _copy_sendfile(self, fileno, target, limit):
+        target.flush()
+        copied = 0
+        try:
+            position = os.lseek(fileno, 0, os.SEEK_CUR)
+            while copied < limit:
+                sent = os.sendfile(target.fileno(), fileno, position + copied, min(limit - copied, self.chunk_size))
+                if not sent:
+                    break
+                copied += sent
+        except OSError:
+            if copied:
+                raise
+            # Not a regular file or no kernel file to file copy on this platform
+            return None
+        os.lseek(fileno, position + copied, os.SEEK_SET)
+        target.seek(0, os.SEEK_END)
+        return copied
+
+    def _copy_buffered(self, source, target, limit):
+        view = self._buffer()
+        readinto = getattr(source, "readinto", None)
+        copied = 0
+        while copied < limit:
+            wanted = min(len(view), limit - copied)
+            if readinto is not None:
+                received = readinto(view[:wanted])
+            else:
+                data = source.read(wanted)
+                received = len(data)
+                view[:received] = data
+            if not received:
+                break
+            target.write(view[:received])
+            copied += received
+        return copied
+
+    def _buffer(self):
+        view = getattr(self._buffers, "view", None)
+        if view is None or len(view) != self.chunk_size:
+            view = memoryview(bytearray(self.chunk_size))
+            self._buffers.view = view
+        return view
+
+    @staticmethod
+    def _fileno(source):
+        try:
+            return source.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+
+    @staticmethod
+    def _peek(source):
+        return bool(source.read(1))
+
+    def _read_meta(self, upload_id):
+        try:
+            with io.open(self._path(upload_id, _meta_suffix), "r", encoding="utf-8") as f:
+                meta = json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        return meta if isinstance(meta, dict) and "filename" in meta and "size" in meta else None
+
+    def _path(self, upload_id, suffix):
+        return os.path.join(self.folder, upload_id + suffix)
+
+    @staticmethod
+    def _validate_id(upload_id):
+        if not _upload_id_pattern.match(upload_id or ""):
+            raise TransferError(f"Invalid upload id '{upload_id}'")
+
+
+class _PartWriter(object):
+    """Exclusive append access to one part file, at the offset the client expects"""
+
+    def __init__(self, transfers, upload_id, offset):
+        self._transfers = transfers
+        self._upload_id = upload_id
+        self._offset = offset
+        self._part = None
+
+    def __enter__(self):
+        transfers = self._transfers
+        meta = transfers._read_meta(self._upload_id)
+        if meta is None:
+            raise TransferError(f"Unknown upload '{self._upload_id}'", 404)
+        with transfers._lock:
+            if self._upload_id in transfers._active:
+                raise TransferError(f"Upload '{self._upload_id}' is already receiving data", 409,
+                                    transfers.offset(self._upload_id))
+            transfers._active.add(self._upload_id)
+        current = transfers.offset(self._upload_id) or 0
+        if self._offset != current:
+            self._release()
+            raise TransferError(f"Upload '{self._upload_id}' continues at offset {current}", 409, current)
+        # Not opened for appending, sendfile refuses O_APPEND targets
+        self._part = io.open(transfers._path(self._upload_id, _part_suffix), "r+b")
+        self._part.seek(current)
+        return self._part, meta["size"] - current
+
+    def __exit__(self, *args):
+        if self._part is not None:
+            self._part.close()
+        self._release()
+
+    def _release(self):
+        with self._transfers._lock:
+            self._transfers._active.discard(self._upload_id)
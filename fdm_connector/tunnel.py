@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import asyncio
+import json
+import logging
+import random
+import struct
+
+from fdm_connector.constants import Config
+
+_logger = logging.getLogger("octoprint.plugins.fdm_connector.tunnel")
+
+# Frame header: type, stream id and payload length, network byte order
+frame_header = struct.Struct(">BII")
+_window_increment = struct.Struct(">I")
+tunnel_protocol = "fdm-tunnel/1"
+
+# Connection-specific headers which must not be forwarded by a proxy
+_hop_by_hop_headers = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+                       "transfer-encoding", "upgrade", "host"}
+_body_methods = {"POST", "PUT", "PATCH"}
+
+
+class FrameType:
+    OPEN = 1
+    RESPONSE = 2
+    DATA = 3
+    END = 4
+    WINDOW_UPDATE = 5
+    RESET = 6
+    PING = 7
+    PONG = 8
+
+
+class TunnelProtocolError(Exception):
+    pass
+
+
+def encode_frame(frame_type, stream_id, payload=b""):
+    return frame_header.pack(frame_type, stream_id, len(payload)) + payload
+
+
+async def read_frame(reader, max_payload=Config.tunnel_max_frame_bytes):
+    frame_type, stream_id, length = frame_header.unpack(await reader.readexactly(frame_header.size))
+    if length > max_payload:
+        raise TunnelProtocolError(f"Frame of {length} bytes exceeds the maximum of {max_payload}")
+    payload = await reader.readexactly(length) if length else b""
+    return frame_type, stream_id, payload
+
+
+class TunnelStream(object):
+    """One proxied request. Both directions are flow controlled with a window of unacknowledged DATA bytes."""
+
+    def __init__(self, stream_id, window):
+        self.id = stream_id
+        self.send_window = window
+        self.receive_window = window
+        self.inbound = asyncio.Queue()
+        self.task = None
+        self._window_open = asyncio.Event()
+        self._window_open.set()
+
+    def grant(self, increment):
+        self.send_window += increment
+        if self.send_window > 0:
+            self._window_open.set()
+
+    async def reserve(self, size):
+        """Wait until the peer accepts data, returns how many of ``size`` bytes may be sent now"""
+        while self.send_window <= 0:
+            self._window_open.clear()
+            await self._window_open.wait()
+        granted = min(size, self.send_window)
+        self.send_window -= granted
+        return granted
+
+
+class TunnelClient(object):
+    """Keeps one outbound connection to FDM Monster and serves the OctoPrint API requests multiplexed over it.
+
+    The connection starts as an HTTP/1.1 Upgrade request on ``route``, after which both sides exchange frames.
+    FDM Monster opens a stream per request, the connector proxies it to the local OctoPrint and streams the response
+    back. A stream only receives as much body data as its window allows and grants more once the data has been
+    written to OctoPrint, so one slow request can't starve the others or buffer without bound.
+    """
+
+    def __init__(self, host, port, route, local_host, local_port, get_token,
+                 use_ssl=False,
+                 window=Config.tunnel_window_bytes,
+                 max_frame=Config.tunnel_max_frame_bytes,
+                 max_streams=Config.tunnel_max_streams,
+                 ping_interval=Config.tunnel_ping_secs,
+                 rand=random.random):
+        self.host = host
+        self.port = port
+        self.route = route
+        self.local_host = local_host
+        self.local_port = local_port
+        self._get_token = get_token
+        self.use_ssl = use_ssl
+        self.window = window
+        self.max_frame = max_frame
+        self.max_streams = max_streams
+        self.ping_interval = ping_interval
+        self._rand = rand
+        self._streams = dict()
+        self._writer = None
+        self._write_lock = None
+        self._last_received = None
+        self.connected = False
+        self.connects = 0
+        self.failures = 0
+        self.streams_total = 0
+        self.streams_reset = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def run_forever(self):
+        """Reconnects with jittered exponential backoff until cancelled"""
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ValueError, asyncio.IncompleteReadError, TunnelProtocolError) as e:
+                self.failures += 1
+                _logger.warning(f"FDM Monster tunnel disconnected: {e}")
+            delay = min(Config.backoff_max_secs, Config.backoff_base_secs * 2 ** max(self.failures - 1, 0))
+            await asyncio.sleep(max(self._rand() * delay, Config.backoff_min_secs))
+
+    async def run_once(self):
+        """Serve a single tunnel connection until either side closes it"""
+        reader, writer = await self._connect()
+        self._writer = writer
+        self._write_lock = asyncio.Lock()
+        self._last_received = asyncio.get_running_loop().time()
+        self.connected = True
+        self.connects += 1
+        self.failures = 0
+        keepalive = asyncio.ensure_future(self._keepalive())
+        try:
+            while True:
+                try:
+                    frame_type, stream_id, payload = await read_frame(reader, self.max_frame)
+                except asyncio.IncompleteReadError as e:
+                    if e.partial:
+                        raise
+                    return
+                self._last_received = asyncio.get_running_loop().time()
+                await self._dispatch(frame_type, stream_id, payload)
+        finally:
+            self.connected = False
+            keepalive.cancel()
+            streams, self._streams = self._streams, dict()
+            for stream in streams.values():
+                stream.task.cancel()
+            await asyncio.gather(keepalive, *[stream.task for stream in streams.values()], return_exceptions=True)
+            writer.close()
+            self._writer = None
+
+    def status(self):
+        return dict(
+            connected=self.connected,
+            connects=self.connects,
+            failures=self.failures,
+            active_streams=len(self._streams),
+            streams_total=self.streams_total,
+            streams_reset=self.streams_reset,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out
+        )
+
+    async def _connect(self):
+        token = self._get_token()
+        if token is None:
+            raise TunnelProtocolError("No access_token available for the tunnel handshake")
+
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=True if self.use_ssl else None)
+        handshake = (f"GET /{self.route.lstrip('/')} HTTP/1.1\r\n"
+                     f"Host: {self.host}:{self.port}\r\n"
+                     f"Connection: Upgrade\r\n"
+                     f"Upgrade: {tunnel_protocol}\r\n"
+                     f"Authorization: Bearer {token}\r\n\r\n")
+        writer.write(handshake.encode("latin-1"))
+        await writer.drain()
+        status, _ = _parse_response_head(await reader.readuntil(b"\r\n\r\n"))
+        if status != 101:
+            writer.close()
+            raise TunnelProtocolError(f"FDM Monster refused the tunnel upgrade ({status})")
+        return reader, writer
+
+    async def _dispatch(self, frame_type, stream_id, payload):
+        if frame_type == FrameType.OPEN:
+            if stream_id in self._streams or len(self._streams) >= self.max_streams:
+                await self._reset(stream_id, "Too many concurrent streams")
+                return
+            request = json.loads(payload.decode("utf-8"))
+            stream = TunnelStream(stream_id, self.window)
+            if request.get("end"):
+                # Request without body, no DATA or END frames follow
+                stream.inbound.put_nowait(None)
+            stream.task = asyncio.ensure_future(self._proxy(stream, request))
+            self._streams[stream_id] = stream
+            self.streams_total += 1
+        elif frame_type == FrameType.PING:
+            await self._send(FrameType.PONG, 0, payload)
+        elif frame_type == FrameType.PONG:
+            pass
+        else:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                # Late frame of a finished or reset stream
+                return
+            if frame_type == FrameType.DATA:
+                self.bytes_in += len(payload)
+                stream.receive_window -= len(payload)
+                if stream.receive_window < 0:
+                    await self._abort(stream, "Flow control window exceeded")
+                    return
+                stream.inbound.put_nowait(payload)
+            elif frame_type == FrameType.END:
+                stream.inbound.put_nowait(None)
+            elif frame_type == FrameType.WINDOW_UPDATE:
+                stream.grant(_window_increment.unpack(payload)[0])
+            elif frame_type == FrameType.RESET:
+                self.streams_reset += 1
+                self._streams.pop(stream_id, None)
+                stream.task.cancel()
+
+    async def _proxy(self, stream, request):
+        local_writer = None
+        try:
+            local_reader, local_writer = await asyncio.open_connection(self.local_host, self.local_port)
+            headers = [(name, value) for name, value in request.get("headers", [])
+                       if name.lower() not in _hop_by_hop_headers]
+            has_length = any(name.lower() == "content-length" for name, _ in headers)
+            chunked = not has_length and request["method"].upper() in _body_methods
+            head = [f"{request['method']} {request['path']} HTTP/1.1",
+                    f"Host: {self.local_host}:{self.local_port}", "Connection: close"]
+            head.extend(f"{name}: {value}" for name, value in headers)
+            if chunked:
+                head.append("Transfer-Encoding: chunked")
+            local_writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+            # Request body, more is granted to the peer only once OctoPrint took the previous chunk
+            while True:
+                chunk = await stream.inbound.get()
+                if chunk is None:
+                    break
+                local_writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                await local_writer.drain()
+                stream.receive_window += len(chunk)
+                await self._send(FrameType.WINDOW_UPDATE, stream.id, _window_increment.pack(len(chunk)))
+            if chunked:
+                local_writer.write(b"0\r\n\r\n")
+            await local_writer.drain()
+
+            status, response_headers = _parse_response_head(await local_reader.readuntil(b"\r\n\r\n"))
+            forwarded = [(name, value) for name, value in response_headers
+                         if name.lower() not in _hop_by_hop_headers]
+            await self._send(FrameType.RESPONSE, stream.id,
+                             json.dumps({"status": status, "headers": forwarded}).encode("utf-8"))
+            async for chunk in _read_body(local_reader, response_headers, self.max_frame):
+                await self._send_data(stream, chunk)
+            await self._send(FrameType.END, stream.id)
+            self._streams.pop(stream.id, None)
+        except asyncio.CancelledError:
+            raise
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            _logger.warning(f"Tunnel stream {stream.id} failed: {e}")
+            await self._abort(stream, str(e))
+        finally:
+            if local_writer is not None:
+                local_writer.close()
+
+    async def _send_data(self, stream, chunk):
+        view = memoryview(chunk)
+        while view:
+            granted = await stream.reserve(min(len(view), self.max_frame))
+            await self._send(FrameType.DATA, stream.id, bytes(view[:granted]))
+            self.bytes_out += granted
+            view = view[granted:]
+
+    async def _abort(self, stream, reason):
+        self._streams.pop(stream.id, None)
+        self.streams_reset += 1
+        if stream.task is not asyncio.current_task():
+            stream.task.cancel()
+        await self._reset(stream.id, reason)
+
+    async def _reset(self, stream_id, reason):
+        try:
+            await self._send(FrameType.RESET, stream_id, reason.encode("utf-8")[:self.max_frame])
+        except OSError:
+            pass
+
+    async def _send(self, frame_type, stream_id, payload=b""):
+        writer = self._writer
+        if writer is None:
+            raise ConnectionResetError("FDM Monster tunnel is not connected")
+        async with self._write_lock:
+            writer.write(encode_frame(frame_type, stream_id, payload))
+            # Transport backpressure, a slow link holds up the senders instead of buffering in memory
+            await writer.drain()
+
+    async def _keepalive(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if loop.time() - self._last_received > 2 * self.ping_interval:
+                _logger.warning("FDM Monster tunnel stopped responding, reconnecting")
+                self._writer.close()
+                return
+            await self._send(FrameType.PING, 0, struct.pack(">d", loop.time()))
+
+
+def _parse_response_head(head):
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ValueError(f"Malformed HTTP status line '{lines[0]}'")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers.append((name.strip(), value.strip()))
+    return int(parts[1]), headers
+
+
+async def _read_body(reader, headers, chunk_size):
+    values = {name.lower(): value for name, value in headers}
+    if values.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0].strip(), 16)
+            if size == 0:
+                await reader.readuntil(b"\r\n")
+                return
+            while size:
+                chunk = await reader.readexactly(min(size, chunk_size))
+                size -= len(chunk)
+                yield chunk
+            await reader.readexactly(2)
+    elif "content-length" in values:
+        remaining = int(values["content-length"])
+        while remaining:
+            chunk = await reader.readexactly(min(remaining, chunk_size))
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import json
+import struct
+import threading
+import zlib
+
+from fdm_connector.constants import Config
+
+
+class WireEncoding:
+    AUTO = "auto"
+    JSON = "json"
+    GZIP = "gzip"
+    DEFLATE = "deflate"
+    COMPACT = "compact/1"
+
+
+# Picked in this order from what FDM Monster lists as 'wireEncodings' in its api/version response. Compressed JSON
+# is several times smaller than the compact encoding on telemetry batches (benchmarks/wire_benchmark.py), compact
+# serves servers which can't inflate request bodies.
+wire_preference = (WireEncoding.GZIP, WireEncoding.DEFLATE, WireEncoding.COMPACT)
+
+# Map keys replaced by their index in the compact encoding, per schema version. Only ever append to a table, a
+# removed or reordered field needs a new schema version.
+field_tables = {
+    1: ("deviceUuid", "persistenceUuid", "host", "port", "docker", "announceHash", "announcements", "samples", "t",
+        "kind", "key", "value", "container"),
+}
+
+compact_content_type = "application/msgpack; schema=1"
+json_content_type = "application/json"
+
+_pack_double = struct.Struct(">Bd").pack
+_pack_single = struct.Struct(">Bf").pack
+_single = struct.Struct(">f")
+
+
+def pack_compact(payload, fields=field_tables[1]):
+    """MessagePack encoding of a JSON compatible payload, map keys found in ``fields`` are written as their index.
+
+    Only the subset of MessagePack which JSON values need, so any MessagePack decoder on the FDM Monster side reads it.
+    """
+    field_index = {name: index for index, name in enumerate(fields)}
+    out = bytearray()
+    _pack(payload, out, field_index)
+    return bytes(out)
+
+
+def _pack(value, out, field_index):
+    packer = _packers.get(type(value))
+    if packer is None:
+        packer = _packer_for(type(value))
+    packer(value, out, field_index)
+
+
+def _packer_for(value_type):
+    # Subclasses like OrderedDict or an IntEnum are packed as their base type
+    for base in value_type.__mro__:
+        if base in _packers:
+            return _packers[base]
+    return _pack_other
+
+
+def _pack_str(value, out, field_index):
+    data = value.encode("utf-8")
+    size = len(data)
+    if size < 32:
+        out.append(0xa0 | size)
+    elif size < 0x100:
+        out += struct.pack(">BB", 0xd9, size)
+    else:
+        _pack_size(out, size, 0xda, 0xdb)
+    out += data
+
+
+def _pack_map(value, out, field_index):
+    size = len(value)
+    if size < 16:
+        out.append(0x80 | size)
+    else:
+        _pack_size(out, size, 0xde, 0xdf)
+    for key, item in value.items():
+        index = field_index.get(key)
+        _pack(index if index is not None else str(key), out, field_index)
+        _pack(item, out, field_index)
+
+
+def _pack_array(value, out, field_index):
+    size = len(value)
+    if size < 16:
+        out.append(0x90 | size)
+    else:
+        _pack_size(out, size, 0xdc, 0xdd)
+    for item in value:
+        _pack(item, out, field_index)
+
+
+def _pack_size(out, size, tag16, tag32):
+    out += struct.pack(">BH", tag16, size) if size < 0x10000 else struct.pack(">BI", tag32, size)
+
+
+def _pack_none(value, out, field_index):
+    out.append(0xc0)
+
+
+def _pack_bool(value, out, field_index):
+    out.append(0xc3 if value else 0xc2)
+
+
+def _pack_integer(value, out, field_index):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    else:
+        out += _pack_int(value)
+
+
+def _pack_float(value, out, field_index):
+    # Temperatures and filament lengths often fit a float32 exactly, timestamps don't
+    try:
+        single = _single.unpack(_single.pack(value))[0] == value
+    except OverflowError:
+        single = False
+    out += _pack_single(0xca, value) if single else _pack_double(0xcb, value)
+
+
+def _pack_other(value, out, field_index):
+    # Same fallback as the JSON encoding of payload_hash()
+    _pack_str(str(value), out, field_index)
+
+
+# Packer per exact type, bool before int matters as bool is an int subclass
+_packers = {str: _pack_str, dict: _pack_map, type(None): _pack_none, bool: _pack_bool, int: _pack_integer,
+            float: _pack_float, list: _pack_array, tuple: _pack_array}
+
+
+def _pack_int(value):
+    if value >= 0:
+        if value < 0x100:
+            return struct.pack(">BB", 0xcc, value)
+        if value < 0x10000:
+            return struct.pack(">BH", 0xcd, value)
+        if value < 0x100000000:
+            return struct.pack(">BI", 0xce, value)
+        return struct.pack(">BQ", 0xcf, value)
+    if value >= -0x80:
+        return struct.pack(">Bb", 0xd0, value)
+    if value >= -0x8000:
+        return struct.pack(">Bh", 0xd1, value)
+    if value >= -0x80000000:
+        return struct.pack(">Bi", 0xd2, value)
+    return struct.pack(">Bq", 0xd3, value)
+
+
+def unpack_compact(data, fields=field_tables[1]):
+    """Decode ``pack_compact`` output, for tests and the benchmarks' stand-in server"""
+    value, offset = _unpack(memoryview(data), 0, fields)
+    if offset != len(data):
+        raise ValueError(f"{len(data) - offset} trailing bytes after the compact payload")
+    return value
+
+
+def _unpack(data, offset, fields):
+    tag = data[offset]
+    decoder = _decoders[tag]
+    if decoder is None:
+        raise ValueError(f"Unsupported MessagePack type 0x{tag:02x}")
+    return decoder(data, offset + 1, tag, fields)
+
+
+def _unpack_fixed(data, offset, tag, fields):
+    fmt = _fixed_width[tag]
+    return struct.unpack_from(fmt, data, offset)[0], offset + struct.calcsize(fmt)
+
+
+def _unpack_sized(data, offset, tag, fields):
+    unpack_body, fmt = _sized[tag]
+    size = struct.unpack_from(fmt, data, offset)[0]
+    return unpack_body(data, offset + struct.calcsize(fmt), size, fields)
+
+
+def _unpack_str(data, offset, size, fields):
+    end = offset + size
+    return str(data[offset:end], "utf-8"), end
+
+
+def _unpack_map(data, offset, size, fields):
+    result = {}
+    for _ in range(size):
+        key, offset = _unpack(data, offset, fields)
+        value, offset = _unpack(data, offset, fields)
+        result[fields[key] if isinstance(key, int) else key] = value
+    return result, offset
+
+
+def _unpack_array(data, offset, size, fields):
+    result = []
+    for _ in range(size):
+        value, offset = _unpack(data, offset, fields)
+        result.append(value)
+    return result, offset
+
+
+_fixed_width = {0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q", 0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q",
+                0xca: ">f", 0xcb: ">d"}
+_sized = {0xd9: (_unpack_str, ">B"), 0xda: (_unpack_str, ">H"), 0xdb: (_unpack_str, ">I"),
+          0xdc: (_unpack_array, ">H"), 0xdd: (_unpack_array, ">I"), 0xde: (_unpack_map, ">H"), 0xdf: (_unpack_map, ">I")}
+
+
+def _build_decoders():
+    """Decoder per prefix byte, None for the MessagePack types pack_compact never writes"""
+    decoders = [None] * 0x100
+    for tag in range(0x80):
+        decoders[tag] = lambda data, offset, tag, fields: (tag, offset)
+    for tag in range(0xe0, 0x100):
+        decoders[tag] = lambda data, offset, tag, fields: (tag - 0x100, offset)
+    for tag in range(0x80, 0x90):
+        decoders[tag] = lambda data, offset, tag, fields: _unpack_map(data, offset, tag & 0x0f, fields)
+    for tag in range(0x90, 0xa0):
+        decoders[tag] = lambda data, offset, tag, fields: _unpack_array(data, offset, tag & 0x0f, fields)
+    for tag in range(0xa0, 0xc0):
+        decoders[tag] = lambda data, offset, tag, fields: _unpack_str(data, offset, tag & 0x1f, fields)
+    decoders[0xc0] = lambda data, offset, tag, fields: (None, offset)
+    decoders[0xc2] = decoders[0xc3] = lambda data, offset, tag, fields: (tag == 0xc3, offset)
+    for tag in _fixed_width:
+        decoders[tag] = _unpack_fixed
+    for tag in _sized:
+        decoders[tag] = _unpack_sized
+    return tuple(decoders)
+
+
+_decoders = _build_decoders()
+
+
+class WireEncoder(object):
+    """Encodes request bodies in the wire encoding negotiated with FDM Monster, plain JSON until then.
+
+    Bodies smaller than ``min_bytes`` as JSON are sent as plain JSON, next to the HTTP headers the saving is
+    negligible. The first larger body asks ``negotiate`` for the encodings the server accepts. A server which
+    answers 415 to an encoded body gets plain JSON from then on, until ``reset``.
+    """
+
+    def __init__(self, preferred=WireEncoding.AUTO, min_bytes=Config.wire_min_encode_bytes):
+        self.preferred = preferred
+        self.min_bytes = min_bytes
+        self._lock = threading.Lock()
+        self._encoding = None
+        self.payloads = 0
+        self.wire_bytes = 0
+
+    @property
+    def encoding(self):
+        """Negotiated encoding, None while not negotiated"""
+        return self._encoding
+
+    def negotiated(self, server_encodings):
+        """Pick the encoding from the server's list, None or an empty list means plain JSON"""
+        if self.preferred == WireEncoding.JSON:
+            return WireEncoding.JSON
+        candidates = wire_preference if self.preferred == WireEncoding.AUTO else (self.preferred,)
+        for encoding in candidates:
+            if encoding in (server_encodings or ()):
+                return encoding
+        return WireEncoding.JSON
+
+    def encode(self, payload, negotiate=None):
+        """Request body and headers of a payload. ``negotiate`` returns the server's encodings, or None when it
+        couldn't be asked, in which case this body goes out as plain JSON and the next large body asks again."""
+        encoding = self._encoding
+        if encoding == WireEncoding.COMPACT:
+            return self._counted(pack_compact(payload), {"Content-Type": compact_content_type})
+
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+        if len(body) < self.min_bytes:
+            return self._counted(body, {"Content-Type": json_content_type})
+        if encoding is None and negotiate is not None and self.preferred != WireEncoding.JSON:
+            encoding = self._negotiate(negotiate)
+            if encoding == WireEncoding.COMPACT:
+                return self._counted(pack_compact(payload), {"Content-Type": compact_content_type})
+
+        headers = {"Content-Type": json_content_type}
+        if encoding == WireEncoding.GZIP:
+            # zlib writes a gzip header without mtime, equal payloads give equal bodies
+            compressor = zlib.compressobj(Config.wire_compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            headers["Content-Encoding"] = WireEncoding.GZIP
+        elif encoding == WireEncoding.DEFLATE:
+            body = zlib.compress(body, Config.wire_compress_level)
+            headers["Content-Encoding"] = WireEncoding.DEFLATE
+        return self._counted(body, headers)
+
+    def _counted(self, body, headers):
+        with self._lock:
+            self.payloads += 1
+            self.wire_bytes += len(body)
+        return body, headers
+
+    def _negotiate(self, negotiate):
+        with self._lock:
+            if self._encoding is not None:
+                return self._encoding
+        server_encodings = negotiate()
+        if server_encodings is None:
+            return None
+        encoding = self.negotiated(server_encodings)
+        with self._lock:
+            if self._encoding is None:
+                self._encoding = encoding
+            return self._encoding
+
+    def fall_back(self):
+        with self._lock:
+            self._encoding = WireEncoding.JSON
+
+    def reset(self, preferred=None):
+        """Negotiate again before the next large body, after the FDM Monster server or the setting changed"""
+        with self._lock:
+            if preferred is not None:
+                self.preferred = preferred
+            self._encoding = None
+
+    def status(self):
+        with self._lock:
+            return dict(
+                preferred=self.preferred,
+                encoding=self._encoding,
+                payloads=self.payloads,
+                wire_bytes=self.wire_bytes
+            )
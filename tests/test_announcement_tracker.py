@@ -0,0 +1,43 @@
+import unittest
+
+from fdm_connector.announcement import AnnouncementTracker, AnnounceMode, payload_hash
+
+
+class TestAnnouncementTracker(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.tracker = AnnouncementTracker(resync_interval=3600, clock=lambda: self.now)
+        self.hash = payload_hash({"deviceUuid": "a", "port": 80})
+
+    def test_payload_hash_is_order_independent(self):
+        assert payload_hash({"port": 80, "deviceUuid": "a"}) == self.hash
+        assert payload_hash({"deviceUuid": "a", "port": 81}) != self.hash
+
+    def test_first_announcement_is_full(self):
+        assert self.tracker.next_mode(self.hash) == AnnounceMode.FULL
+
+    def test_unchanged_payload_sends_heartbeat(self):
+        self.tracker.acknowledge(self.hash)
+        assert self.tracker.next_mode(self.hash) == AnnounceMode.HEARTBEAT
+        assert self.tracker.next_mode(payload_hash({"deviceUuid": "b"})) == AnnounceMode.FULL
+
+    def test_periodic_resync(self):
+        self.tracker.acknowledge(self.hash)
+        self.now += 3600
+        assert self.tracker.next_mode(self.hash) == AnnounceMode.FULL
+
+    def test_server_requested_resync(self):
+        self.tracker.acknowledge(self.hash)
+        self.tracker.request_resync()
+        assert self.tracker.next_mode(self.hash) == AnnounceMode.FULL
+        self.tracker.acknowledge(self.hash)
+        assert self.tracker.next_mode(self.hash) == AnnounceMode.HEARTBEAT
+
+    def test_heartbeat_unsupported(self):
+        self.tracker.acknowledge(self.hash)
+        self.tracker.mark_heartbeat_unsupported()
+        assert self.tracker.next_mode(self.hash) == AnnounceMode.FULL
+
+    def test_heartbeat_optional(self):
+        self.tracker.acknowledge(self.hash, {"heartbeatOptional": True})
+        assert self.tracker.next_mode(self.hash) == AnnounceMode.SKIP
@@ -7,7 +7,7 @@ import pytest
 from fdm_connector import FdmConnectorPlugin
 from fdm_connector.constants import Errors, State
 from tests.utils import mock_settings_get, mock_settings_global_get, mock_settings_custom, create_fake_at, \
-    mocked_host_intercepted
+    mocked_host_intercepted, posted_json
 
 
 class TestPluginAnnouncing(unittest.TestCase):
@@ -65,7 +65,7 @@ class TestPluginAnnouncing(unittest.TestCase):
             return MockResponse(200, json.dumps({"access_token": fake_token, "expires_in": 100}))
         return MockResponse(404, "{}")
 
-    @mock.patch('requests.post', side_effect=mocked_requests_post)
+    @mock.patch('requests.Session.post', side_effect=mocked_requests_post)
     def test_announcement_with_proper_data(self, mock_post):
         """Call the query announcement properly"""
 
@@ -92,10 +92,10 @@ class TestPluginAnnouncing(unittest.TestCase):
 
         self.plugin._check_fdmmonster()
 
-        # TODO We are crashed with a connection error being caught. Save the reason
-        self.assert_state(State.CRASHED)
+        # An unreachable server is retried, only wrong credentials or responses crash
+        self.assert_state(State.RETRY)
 
-    @mock.patch('requests.post', side_effect=mocked_requests_post)
+    @mock.patch('requests.Session.post', side_effect=mocked_requests_post)
     def test_check_fdmmonster_reachable_settings(self, mock_request):
         self.plugin._settings.get = mock_settings_custom
         self.assert_state(State.BOOT)
@@ -103,24 +103,96 @@ class TestPluginAnnouncing(unittest.TestCase):
         self.plugin._check_fdmmonster()
         self.assert_state(State.SLEEP)
 
-    @mock.patch('requests.post', side_effect=mocked_requests_post)
+    @mock.patch('requests.Session.post', side_effect=mocked_requests_post)
     def test_check_fdmmonster_reachable_settings_expired(self, mock_request):
         self.plugin._settings.get = mock_settings_custom
-        self.plugin._persisted_data["requested_at"] = datetime.datetime.utcnow().timestamp()
-        self.plugin._persisted_data["expires"] = -100
+        self.plugin._persisted_data["requested_at"] = datetime.datetime.utcnow().timestamp() - 1000
+        self.plugin._persisted_data["expires_in"] = 100
+        self.plugin._persisted_data["access_token"] = create_fake_at()
+        assert not self.plugin._token_manager.load(self.plugin._persisted_data)
         self.assert_state(State.BOOT)
 
         self.plugin._check_fdmmonster()
 
+        # Token and announcement query
+        assert mock_request.call_count == 2
         self.assert_state(State.SLEEP)
 
-    @mock.patch('requests.post', side_effect=mocked_requests_post)
+    @mock.patch('requests.Session.post', side_effect=mocked_requests_post)
     def test_check_fdmmonster_reachable_settings_unexpired(self, mock_request):
         self.plugin._settings.get = mock_settings_custom
         self.plugin._persisted_data["requested_at"] = datetime.datetime.utcnow().timestamp()
-        self.plugin._persisted_data["expires"] = 10000000
+        self.plugin._persisted_data["expires_in"] = 10000000
         self.plugin._persisted_data["access_token"] = create_fake_at()
+        assert self.plugin._token_manager.load(self.plugin._persisted_data)
 
         self.assert_state(State.BOOT)
-        self.plugin._check_fdmmonster() # We skip querying the access_token
+        self.plugin._check_fdmmonster()  # We skip querying the access_token
+        assert mock_request.call_count == 1
+        self.assert_state(State.SLEEP)
+
+    # This method will be used by the mock to replace requests.post
+    def mocked_requests_post_busy(*args, **kwargs):
+        class MockResponse:
+            def __init__(self, status_code, text, headers):
+                self.status_code = status_code
+                self.text = text
+                self.headers = headers
+
+        if "announce" in args[0]:
+            return MockResponse(503, "Service Unavailable", {"Retry-After": "300"})
+        return MockResponse(200, json.dumps({"access_token": create_fake_at(), "expires_in": 100}), {})
+
+    @mock.patch('requests.Session.post', side_effect=mocked_requests_post_busy)
+    def test_check_fdmmonster_busy_server(self, mock_request):
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._scheduler.next_delay()  # startup splay
+
+        self.plugin._check_fdmmonster()
+
+        self.assert_state(State.RETRY)
+        assert self.plugin._scheduler.next_delay() >= 300
+
+    def test_unchanged_announcement_sends_heartbeat(self):
+        self.plugin._persisted_data["persistence_uuid"] = "persistence"
+        self.plugin._settings.get = lambda accessor: "device" if accessor[0] == "device_uuid" else None
+        calls = []
+
+        def mocked_post(url, **kwargs):
+            calls.append((url, posted_json(kwargs)))
+
+            class MockResponse:
+                status_code = 200
+                text = "{}"
+
+            return MockResponse()
+
+        with mock.patch('requests.Session.post', side_effect=mocked_post):
+            self.plugin._query_announcement(mocked_host_intercepted, create_fake_at())
+            self.plugin._query_announcement(mocked_host_intercepted, create_fake_at())
+
+        assert calls[0][0].endswith("announce")
+        assert "host" in calls[0][1]
+        assert calls[1][0].endswith("heartbeat")
+        assert set(calls[1][1].keys()) == {"deviceUuid", "announceHash"}
         self.assert_state(State.SLEEP)
+
+    def test_heartbeat_unsupported_falls_back_to_full(self):
+        self.plugin._persisted_data["persistence_uuid"] = "persistence"
+        self.plugin._settings.get = lambda accessor: "device" if accessor[0] == "device_uuid" else None
+        calls = []
+
+        def mocked_post(url, **kwargs):
+            calls.append(url)
+
+            class MockResponse:
+                status_code = 404 if url.endswith("heartbeat") else 200
+                text = "{}"
+
+            return MockResponse()
+
+        with mock.patch('requests.Session.post', side_effect=mocked_post):
+            for _ in range(3):
+                self.plugin._query_announcement(mocked_host_intercepted, create_fake_at())
+
+        assert [url.rsplit("/", 1)[1] for url in calls] == ["announce", "heartbeat", "announce", "announce"]
@@ -0,0 +1,166 @@
+import json
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import pytest
+import requests
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.breaker import CircuitBreaker, CircuitOpenError
+from fdm_connector.constants import State
+from tests.utils import create_fake_at, mock_settings_custom
+
+
+class Response(object):
+    def __init__(self, status_code, text="{}", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.calls = 0
+        self.breaker = CircuitBreaker("announce", failure_rate=0.5, window=4, min_calls=2, open_secs=10,
+                                      max_open_secs=25, clock=lambda: self.now)
+
+    def send(self, outcome):
+        def request():
+            self.calls += 1
+            if isinstance(outcome, Exception):
+                raise outcome
+            return Response(outcome)
+
+        return self.breaker.call(request)
+
+    def fail(self):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            self.send(requests.exceptions.ConnectionError("refused"))
+
+    def test_opens_at_failure_rate(self):
+        self.send(200)
+        self.send(404)
+        self.fail()
+        assert self.breaker.status()["state"] == CircuitBreaker.CLOSED
+
+        self.send(503)
+        status = self.breaker.status()
+        assert status["state"] == CircuitBreaker.OPEN
+        assert status["opened"] == 1
+        assert self.breaker.retry_in() == 10
+
+    def test_open_circuit_fails_fast(self):
+        self.fail()
+        self.fail()
+        with pytest.raises(CircuitOpenError) as e:
+            self.send(200)
+
+        assert self.calls == 2
+        assert e.value.retry_in == 10
+        assert self.breaker.status()["rejected"] == 1
+
+    def test_single_probe_when_half_open(self):
+        self.fail()
+        self.fail()
+        self.now += 10
+        assert self.breaker.status()["state"] == CircuitBreaker.HALF_OPEN
+
+        def probe():
+            # A concurrent call while the probe is in flight is rejected
+            with pytest.raises(CircuitOpenError):
+                self.send(200)
+            return Response(200)
+
+        self.breaker.call(probe)
+        status = self.breaker.status()
+        assert status["state"] == CircuitBreaker.CLOSED
+        assert status["probes"] == 1
+        assert status["rejected"] == 1
+
+    def test_failed_probe_doubles_open_time(self):
+        self.fail()
+        self.fail()
+        self.now += 10
+        self.fail()
+        assert self.breaker.retry_in() == 20
+
+        self.now += 20
+        self.fail()
+        assert self.breaker.retry_in() == 25
+
+    def test_reset_closes(self):
+        self.fail()
+        self.fail()
+        self.breaker.reset()
+        self.send(200)
+        assert self.breaker.status()["state"] == CircuitBreaker.CLOSED
+
+
+class TestPluginBreakers(unittest.TestCase):
+    def setUp(self):
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._write_persisted_data = lambda *args: None
+        self.plugin._data_folder = tempfile.mkdtemp()
+        self.plugin._persisted_data_loaded.set()
+        self.plugin._scheduler.next_delay()  # startup splay
+
+    def tearDown(self):
+        shutil.rmtree(self.plugin._data_folder)
+
+    def test_unreachable_token_endpoint_opens_circuit(self):
+        post = mock.MagicMock(side_effect=requests.exceptions.ConnectTimeout("timed out"))
+        with mock.patch("requests.Session.post", post):
+            for _ in range(4):
+                assert self.plugin._check_fdmmonster() is False
+                assert self.plugin._state == State.RETRY
+
+        assert post.call_count == 3
+        status = self.plugin.get_connector_state()["breakers"]["token"]
+        assert status["state"] == CircuitBreaker.OPEN
+        assert status["rejected"] == 1
+        # The next tick waits for the probe instead of hammering the open circuit
+        assert self.plugin._scheduler.next_delay() >= status["retry_in"]
+
+    def test_busy_token_endpoint_retries(self):
+        busy = Response(503, "Service Unavailable", {"Retry-After": "120"})
+        with mock.patch("requests.Session.post", return_value=busy):
+            assert self.plugin._check_fdmmonster() is False
+
+        assert self.plugin._state == State.RETRY
+        assert self.plugin._scheduler.next_delay() >= 120
+
+    def test_bad_credentials_crash(self):
+        self.plugin._settings.get = lambda accessor: "" if accessor[0] == "oidc_client_secret" \
+            else mock_settings_custom(accessor)
+        assert self.plugin._check_fdmmonster() is False
+        assert self.plugin._state == State.CRASHED
+
+    def test_open_announce_circuit_spools_without_request(self):
+        self.plugin._token_manager.update({"access_token": create_fake_at(), "expires_in": 600})
+        self.plugin._get_spool = mock.MagicMock()
+        breaker = self.plugin._breakers["announce"]
+        breaker.min_calls = 1
+        with mock.patch("requests.Session.post", side_effect=requests.exceptions.ConnectionError("refused")) as post:
+            self.plugin._check_fdmmonster()
+            self.plugin._check_fdmmonster()
+
+        assert post.call_count == 1
+        assert self.plugin._get_spool().append.call_count == 2
+        assert breaker.status()["rejected"] == 1
+        assert self.plugin._state == State.RETRY
+
+    def test_state_route_lists_breakers(self):
+        with mock.patch("requests.Session.post",
+                        return_value=Response(200, json.dumps({"access_token": create_fake_at(),
+                                                               "expires_in": 600}))):
+            self.plugin._check_fdmmonster()
+
+        breakers = self.plugin.get_connector_state()["breakers"]
+        assert sorted(breakers) == ["announce", "snapshot", "status", "telemetry", "token", "version"]
+        assert all(status["state"] == CircuitBreaker.CLOSED for status in breakers.values())
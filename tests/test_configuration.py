@@ -9,15 +9,14 @@ from tests.utils import mock_settings_get, mock_settings_get_int
 
 class TestPluginConfiguration(unittest.TestCase):
     @classmethod
-    @mock.patch('fdm_connector.RepeatedTimer')
-    def setUp(cls, mock_repeated_timer):
+    @mock.patch('fdm_connector.ConnectorEngine')
+    def setUp(cls, mock_engine):
         cls.settings = mock.MagicMock()  # Replace or refine with set/get
         cls.settings.get = mock_settings_get
         cls.settings.get_int = mock_settings_get_int
         cls.logger = mock.MagicMock()
 
-        cls.mock_repeated_timer = mock_repeated_timer
-        cls.mock_repeated_timer.start = lambda *args: None
+        cls.mock_engine = mock_engine
 
         cls.plugin = FdmConnectorPlugin()
         cls.plugin._settings = cls.settings
@@ -29,12 +28,16 @@ class TestPluginConfiguration(unittest.TestCase):
     def test_initialize(self):
         self.plugin.initialize()
 
+        # Read in the background, OctoPrint doesn't wait for it
+        assert self.plugin._persisted_data_loaded.wait(5)
         assert len(self.plugin._persisted_data.get("persistence_uuid")) == Config.uuid_length
 
     def test_excludes_hook(self):
         excludes = self.plugin.additional_excludes_hook(None)
-        assert len(excludes) == 1
+        assert len(excludes) == 3
         assert excludes[0] == Config.persisted_data_file
+        assert excludes[1] == Config.spool_folder
+        assert excludes[2] == Config.transfer_folder
 
     def test_persisted_data(self):
         # State has already been set
@@ -49,7 +52,7 @@ class TestPluginConfiguration(unittest.TestCase):
         assert len(persistence_uuid) > 20
 
     def test_startup_with_ping_worker(self):
-        self.plugin._ping_worker = self.mock_repeated_timer
+        self.plugin._ping_worker = self.mock_engine
         self.plugin.on_after_startup()
 
         assert not self.logger.error.called
@@ -71,6 +74,7 @@ class TestPluginConfiguration(unittest.TestCase):
         assert self.plugin._settings.get_int(["ping"]) == Config.default_ping_secs
         assert Config.default_ping_secs == 120
         assert self.plugin._ping_worker is not None
+        self.plugin._engine.start.assert_called_once()
 
     def test_on_settings_cleanup(self):
         """Tests that after cleanup only minimal config is left in storage."""
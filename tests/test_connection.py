@@ -3,6 +3,7 @@ import unittest
 import unittest.mock as mock
 
 import pytest
+import requests
 from werkzeug.exceptions import BadRequest
 
 from fdm_connector import FdmConnectorPlugin, State
@@ -23,6 +24,9 @@ class TestPluginConnection(unittest.TestCase):
         cls.plugin._data_folder = "test_data/connection"
         cls.plugin._write_persisted_data = lambda *args: None
 
+    def tearDown(self):
+        self.plugin._engine.stop()
+
     def assert_state(self, state):
         assert self.plugin._state is state
 
@@ -39,7 +43,7 @@ class TestPluginConnection(unittest.TestCase):
 
         return MockResponse({"version": "test-version"}, 200, json.dumps({"version": "test-version"}))
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('requests.Session.get', side_effect=mocked_requests_get)
     def test_fdm_connection_test(self, mocked_requests_get):
         """Call the FDM Monster connection test properly"""
 
@@ -51,10 +55,37 @@ class TestPluginConnection(unittest.TestCase):
             response = self.plugin.test_fdmmonster_connection()
             assert response["version"] == "test-version"
 
+    @mock.patch('requests.Session.get', side_effect=mocked_requests_get)
+    def test_fdm_connection_test_is_cached(self, mocked_requests_get):
+        """Repeated tests of the same URL are answered from the cache"""
+
+        m = mock.MagicMock()
+        m.data = json.dumps({"url": "http://127.0.0.1"})
+        with mock.patch("fdm_connector.request", m):
+            for _ in range(3):
+                assert self.plugin.test_fdmmonster_connection()["version"] == "test-version"
+        assert mocked_requests_get.call_count == 1
+
+    def test_fdm_connection_test_failures(self):
+        """Unreachable servers and invalid answers are reported as 502 and not cached"""
+
+        m = mock.MagicMock()
+        m.data = json.dumps({"url": "http://127.0.0.1"})
+        unreachable = requests.exceptions.ConnectionError("refused")
+        invalid = mock.MagicMock(status_code=200, text="<html>not FDM Monster</html>")
+        with mock.patch("fdm_connector.request", m), \
+                mock.patch("requests.Session.get", side_effect=[unreachable, invalid]) as get:
+            response, status = self.plugin.test_fdmmonster_connection()
+            assert status == 502
+            assert "refused" in response["error"]
+            response, status = self.plugin.test_fdmmonster_connection()
+            assert status == 502
+            assert get.call_count == 2
+
     def _assert_bad_request_parameter(self, exception_info, param):
         assert str(exception_info.value) == f"400 Bad Request: Expected '{param}' parameter"
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
+    @mock.patch('requests.Session.get', side_effect=mocked_requests_get)
     def test_fdm_connection_test_validation(self, mocked_requests_get):
         """Call the FDM Monster connection test with faulty input"""
 
@@ -65,7 +96,7 @@ class TestPluginConnection(unittest.TestCase):
                 self.plugin.test_fdmmonster_connection()
             self._assert_bad_request_parameter(e, "url")
 
-    @mock.patch('requests.post', side_effect=mocked_requests_get)
+    @mock.patch('requests.Session.post', side_effect=mocked_requests_get)
     def test_fdm_openid_validation(self, mocked_requests_get):
         """Call the FDM Monster OpenID connection test with faulty input"""
 
@@ -106,7 +137,7 @@ class TestPluginConnection(unittest.TestCase):
 
         return MockResponse({}, 404)
 
-    @mock.patch('requests.post', side_effect=mocked_openid_response_notfound)
+    @mock.patch('requests.Session.post', side_effect=mocked_openid_response_notfound)
     def test_fdm_openid_bug_response(self, mocked_requests_get):
         """Call the FDM Monster OpenID connection test with a not found error"""
 
@@ -114,8 +145,13 @@ class TestPluginConnection(unittest.TestCase):
         m.data = json.dumps({"url": "http://127.0.0.1", "client_id": "asd", "client_secret": "ok"})
         with mock.patch("fdm_connector.request", m):
             self.assert_state(State.BOOT)
+            response = self.plugin.test_fdmmonster_openid()
+            assert response["state"] == State.CRASHED
+            # The probe leaves the running connector alone
+            self.assert_state(State.BOOT)
+            # Failed probes aren't cached, a fixed server or secret is tested again
             self.plugin.test_fdmmonster_openid()
-            self.assert_state(State.CRASHED)
+        assert mocked_requests_get.call_count == 2
 
     # This method will be used by the mock to replace requests.get or requests.post
     def mocked_openid_response_maximal(*args, **kwargs):
@@ -137,7 +173,7 @@ class TestPluginConnection(unittest.TestCase):
         return MockResponse(200,
                             json.dumps({"access_token": "test-token", "expires_in": 600}))
 
-    @mock.patch('requests.post', side_effect=mocked_openid_response_maximal)
+    @mock.patch('requests.Session.post', side_effect=mocked_openid_response_maximal)
     def test_fdm_openid_success_maximal(self, mocked_requests_get):
         """Call the FDM Monster OpenID connection test properly with maximum property set"""
 
@@ -145,10 +181,12 @@ class TestPluginConnection(unittest.TestCase):
         m.data = json.dumps({"url": "http://127.0.0.1", "client_id": "asd", "client_secret": "ok"})
         with mock.patch("fdm_connector.request", m):
             self.assert_state(State.BOOT)
-            self.plugin.test_fdmmonster_openid()
-            self.assert_state(State.SUCCESS)
+            response = self.plugin.test_fdmmonster_openid()
+            assert response["state"] == State.SUCCESS
+            self.assert_state(State.BOOT)
+            assert self.plugin._token_manager.get_token() is None
 
-    @mock.patch('requests.post', side_effect=mocked_openid_response_minimal)
+    @mock.patch('requests.Session.post', side_effect=mocked_openid_response_minimal)
     def test_fdm_openid_success_minimal(self, mocked_requests_get):
         """Call the FDM Monster OpenID connection test properly with missing response properties 'scope' and
         'token_type' """
@@ -157,5 +195,7 @@ class TestPluginConnection(unittest.TestCase):
         m.data = json.dumps({"url": "http://127.0.0.1", "client_id": "asd", "client_secret": "ok"})
         with mock.patch("fdm_connector.request", m):
             self.assert_state(State.BOOT)
-            self.plugin.test_fdmmonster_openid()
-            self.assert_state(State.SUCCESS)
+            response = self.plugin.test_fdmmonster_openid()
+            assert response["state"] == State.SUCCESS
+            self.assert_state(State.BOOT)
+            assert self.plugin._token_manager.get_token() is None
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import pytest
+
+from fdm_connector.engine import ConnectorEngine
+
+
+def wait_until(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+class TestConnectorEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = ConnectorEngine(max_workers=4)
+        self.engine.start()
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def test_start_is_idempotent(self):
+        loop = self.engine.loop
+        self.engine.start()
+        assert self.engine.loop is loop
+        assert self.engine.running
+
+    def test_periodic_task_runs_repeatedly(self):
+        calls = []
+        task = self.engine.schedule_periodic("tick", lambda: calls.append(1), 0.01)
+
+        assert wait_until(lambda: len(calls) >= 3)
+        assert task.runs >= 3
+        assert "tick" in self.engine.get_tasks()
+
+    def test_hung_call_does_not_stall_next_tick(self):
+        release = threading.Event()
+        calls = []
+
+        def hanging_tick():
+            calls.append(1)
+            release.wait(5)
+
+        task = self.engine.schedule_periodic("hang", hanging_tick, 0.01, deadline=0.05)
+        try:
+            assert wait_until(lambda: task.timeouts >= 2)
+            assert len(calls) >= 2
+        finally:
+            release.set()
+
+    def test_errors_counted(self):
+        def failing_tick():
+            raise Exception("network down")
+
+        task = self.engine.schedule_periodic("fail", failing_tick, 0.01)
+        assert wait_until(lambda: task.errors >= 2)
+
+    def test_callable_interval(self):
+        delays = []
+
+        def next_delay():
+            delays.append(0.01)
+            return 0.01
+
+        task = self.engine.schedule_periodic("dynamic", lambda: None, next_delay, run_first=False)
+        assert wait_until(lambda: task.runs >= 2)
+        assert len(delays) >= 2
+
+    def test_cancel_periodic_task(self):
+        task = self.engine.schedule_periodic("cancel", lambda: None, 0.01)
+        assert wait_until(lambda: task.runs >= 1)
+        task.cancel()
+        assert wait_until(lambda: task.cancelled)
+
+    def test_submit_blocking_and_coroutine(self):
+        async def coroutine(value):
+            await asyncio.sleep(0)
+            return value * 2
+
+        assert self.engine.submit(lambda: 42).result(1) == 42
+        assert self.engine.submit(coroutine, 21).result(1) == 42
+
+    def test_submit_deadline(self):
+        with pytest.raises(asyncio.TimeoutError):
+            self.engine.submit(time.sleep, 1, deadline=0.01).result(1)
+
+    def test_concurrent_streams_share_one_loop(self):
+        async def stream(delay):
+            await asyncio.sleep(delay)
+            return threading.current_thread().name
+
+        futures = [self.engine.submit(stream, 0.05) for _ in range(20)]
+        start = time.monotonic()
+        names = set(f.result(2) for f in futures)
+        assert names == {"fdm-connector-engine"}
+        assert time.monotonic() - start < 1
+
+    def test_stop(self):
+        task = self.engine.schedule_periodic("stop", lambda: None, 0.01)
+        self.engine.stop()
+
+        assert not self.engine.running
+        assert task.cancelled
+        # Stopping twice is harmless
+        self.engine.stop()
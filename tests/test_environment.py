@@ -0,0 +1,154 @@
+import unittest
+import unittest.mock as mock
+
+from fdm_connector import environment
+from fdm_connector.environment import EnvironmentProbe
+
+cgroup_v1_docker = [
+    "12:memory:/docker/3f1c2a9e0b7d",
+    "11:cpu,cpuacct:/docker/3f1c2a9e0b7d",
+]
+cgroup_v1_kubernetes = [
+    "12:memory:/kubepods/besteffort/pod1234/docker-3f1c2a9e0b7d.scope",
+]
+cgroup_v2_container = ["0::/"]
+mountinfo_v2_docker = [
+    "1271 1190 0:72 / / rw,relatime master:293 - overlay overlay rw",
+    "1284 1271 254:1 /var/lib/docker/containers/3f1c/resolv.conf /etc/resolv.conf rw,relatime - ext4 /dev/vda1 rw",
+]
+mountinfo_v2_podman = [
+    "912 880 0:48 /containers/storage/overlay-containers/abc/userdata/hosts /etc/hosts rw - tmpfs tmpfs rw",
+]
+
+
+def fake_files(files):
+    return lambda path: files.get(path, [])
+
+
+class TestContainerDetection(unittest.TestCase):
+    def detect(self, files, exists=(), env=None):
+        with mock.patch.object(environment, "_read_lines", side_effect=fake_files(files)), \
+                mock.patch("os.path.exists", side_effect=lambda path: path in exists), \
+                mock.patch.dict("os.environ", env or {}, clear=True):
+            return environment._detect_container_runtime()
+
+    def test_bare_metal(self):
+        assert self.detect({"/proc/self/cgroup": ["0::/init.scope"]}) is None
+
+    def test_dockerenv(self):
+        assert self.detect({}, exists=["/.dockerenv"]) == "docker"
+
+    def test_podman_containerenv(self):
+        assert self.detect({}, exists=["/run/.containerenv"]) == "podman"
+
+    def test_kubernetes_env(self):
+        assert self.detect({}, env={"KUBERNETES_SERVICE_HOST": "10.0.0.1"}) == "kubernetes"
+
+    def test_cgroup_v1(self):
+        assert self.detect({"/proc/self/cgroup": cgroup_v1_docker}) == "docker"
+        assert self.detect({"/proc/self/cgroup": cgroup_v1_kubernetes}) == "kubernetes"
+
+    def test_cgroup_v2_mountinfo(self):
+        assert self.detect({"/proc/self/cgroup": cgroup_v2_container,
+                            "/proc/self/mountinfo": mountinfo_v2_docker}) == "docker"
+        assert self.detect({"/proc/self/cgroup": cgroup_v2_container,
+                            "/proc/self/mountinfo": mountinfo_v2_podman}) == "podman"
+
+    def test_bare_metal_running_containers(self):
+        mountinfo_host = [
+            "640 29 0:25 / /run/containerd/io.containerd.runtime.v2.task/moby/3f1c rw - overlay overlay rw",
+            "702 29 0:61 / /var/lib/docker/containers/3f1c/mounts/shm rw,nosuid - tmpfs shm rw,size=65536k",
+        ]
+        assert self.detect({"/proc/self/cgroup": ["0::/user.slice/user-1000.slice/session-2.scope"],
+                            "/proc/self/mountinfo": mountinfo_host}) is None
+        assert self.detect({"/proc/self/cgroup": ["0::/system.slice/octoprint.service"],
+                            "/proc/self/mountinfo": mountinfo_host}) is None
+
+    def test_detection_cached(self):
+        with mock.patch.dict(environment._detected, clear=True), \
+                mock.patch.object(environment, "_detect_container_runtime", return_value="docker") as detect:
+            assert environment.detect_container_runtime() == "docker"
+            assert environment.detect_container_runtime() == "docker"
+            assert detect.call_count == 1
+
+
+class TestDockerDetection(unittest.TestCase):
+    def detect(self, files, exists=()):
+        with mock.patch.object(environment, "_read_lines", side_effect=fake_files(files)), \
+                mock.patch("os.path.exists", side_effect=lambda path: path in exists):
+            return environment._detect_docker()
+
+    def test_docker_markers(self):
+        assert self.detect({}, exists=["/.dockerenv"])
+        assert self.detect({"/proc/self/cgroup": cgroup_v1_docker})
+        assert self.detect({"/proc/self/cgroup": ["12:memory:/system.slice/moby-3f1c2a9e0b7d.scope"]})
+        assert self.detect({"/proc/self/cgroup": cgroup_v2_container, "/proc/self/mountinfo": mountinfo_v2_docker})
+
+    def test_kubernetes_on_docker(self):
+        assert self.detect({"/proc/self/cgroup": cgroup_v1_kubernetes})
+
+    def test_other_runtimes_are_not_docker(self):
+        assert not self.detect({}, exists=["/run/.containerenv"])
+        assert not self.detect({"/proc/self/cgroup": ["12:memory:/lxc/octoprint"]})
+        assert not self.detect({"/proc/self/cgroup": ["12:memory:/system.slice/containerd.service/k8s.io/3f1c"]})
+        assert not self.detect({"/proc/self/cgroup": cgroup_v2_container, "/proc/self/mountinfo": mountinfo_v2_podman})
+
+    def test_bare_metal_running_docker(self):
+        mountinfo_host = [
+            "640 29 0:25 / /run/containerd/io.containerd.runtime.v2.task/moby/3f1c rw - overlay overlay rw",
+        ]
+        assert not self.detect({"/proc/self/cgroup": ["0::/system.slice/octoprint.service"],
+                                "/proc/self/mountinfo": mountinfo_host})
+
+
+class TestEnvironmentProbe(unittest.TestCase):
+    def setUp(self):
+        self.address = ("http://127.0.0.1", "5000")
+        self.signal = 1
+        self.resolves = 0
+        self.probe = EnvironmentProbe(self.resolve_address, lambda: self.signal)
+
+    def resolve_address(self):
+        self.resolves += 1
+        return self.address
+
+    def test_fingerprint_cached(self):
+        fingerprint = self.probe.get()
+        assert fingerprint.host == "http://127.0.0.1"
+        assert fingerprint.port == 5000
+        assert fingerprint.container == (fingerprint.container_runtime is not None)
+        assert fingerprint.docker == environment.is_docker()
+
+        assert self.probe.get() is fingerprint
+        assert self.resolves == 1
+
+    def test_lxc_is_a_container_but_not_docker(self):
+        with mock.patch.object(environment, "detect_container_runtime", return_value="lxc"), \
+                mock.patch.object(environment, "is_docker", return_value=False):
+            fingerprint = self.probe.get()
+        assert fingerprint.container
+        assert fingerprint.container_runtime == "lxc"
+        assert not fingerprint.docker
+
+    def test_change_signal_recomputes(self):
+        self.probe.get()
+        self.address = ("http://127.0.0.1", 5001)
+        self.signal = 2
+
+        assert self.probe.get().port == 5001
+        assert self.resolves == 2
+
+    def test_invalidate(self):
+        self.probe.get()
+        self.probe.invalidate()
+        self.probe.get()
+        assert self.resolves == 2
+
+    def test_failing_signal(self):
+        def broken_signal():
+            raise OSError("config.yaml missing")
+
+        probe = EnvironmentProbe(self.resolve_address, broken_signal)
+        probe.get()
+        probe.get()
+        assert self.resolves == 1
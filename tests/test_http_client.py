@@ -0,0 +1,125 @@
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import unittest.mock as mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import Config
+from fdm_connector.http_client import FdmHttpClient
+from tests.utils import create_fake_at, mock_settings_custom
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"version": "test-version"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b"{}"
+        if self.path.endswith("/oidc/token"):
+            body = json.dumps({"access_token": create_fake_at(), "expires_in": 600}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFdmHttpClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.client = FdmHttpClient()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_connection_is_reused(self):
+        for _ in range(5):
+            response = self.client.get(self.base_url + "/api/version")
+            assert response.json()["version"] == "test-version"
+
+        stats = self.client.stats()
+        assert stats["requests"] == 5
+        assert stats["connections_opened"] == 1
+        assert stats["connections_reused"] == 4
+
+    def test_counters_survive_reconfigure(self):
+        self.client.get(self.base_url)
+        self.client.configure(max_connections_per_host=4)
+        self.client.get(self.base_url)
+
+        stats = self.client.stats()
+        assert stats["requests"] == 2
+        assert stats["connections_opened"] == 2
+        assert stats["max_connections_per_host"] == 4
+
+    @mock.patch('requests.Session.post')
+    def test_default_timeout_applied(self, mocked_post):
+        self.client.configure(connect_timeout=2, read_timeout=7)
+        self.client.post("http://127.0.0.1/api")
+        assert mocked_post.call_args[1]["timeout"] == (2.0, 7.0)
+
+        self.client.post("http://127.0.0.1/api", timeout=1)
+        assert mocked_post.call_args[1]["timeout"] == 1
+
+    def test_configure_ignores_unset_values(self):
+        self.client.configure(None, None, None)
+        assert self.client.timeout == (Config.default_http_connect_timeout, Config.default_http_read_timeout)
+        assert self.client.max_connections_per_host == Config.default_http_max_connections_per_host
+
+    def test_failed_request_counted(self):
+        with self.assertRaises(Exception):
+            self.client.get("http://127.0.0.1:1")
+        assert self.client.stats()["failed_requests"] == 1
+
+
+class TestPluginConnectionReuse(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        port = self.server.server_address[1]
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = lambda accessor: "http://127.0.0.1" if accessor[0] == "fdm_host" \
+            else port if accessor[0] == "fdm_port" else mock_settings_custom(accessor)
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._write_persisted_data = lambda *args: None
+        self.plugin._data_folder = tempfile.mkdtemp()
+        self.plugin._persisted_data_loaded.set()
+
+    def tearDown(self):
+        self.plugin._http_client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.plugin._data_folder)
+
+    def test_token_and_announcement_share_connection(self):
+        self.plugin._check_fdmmonster()
+
+        stats = self.plugin._http_client.stats()
+        assert stats["requests"] == 2
+        assert stats["connections_opened"] == 1
@@ -0,0 +1,176 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import unittest.mock as mock
+
+import pytest
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import State
+from fdm_connector.hub import HubCoordinator, HubFolderError, hub_supported
+from tests.utils import create_fake_at, mocked_host_intercepted, posted_json
+
+pytestmark = pytest.mark.skipif(not hub_supported(), reason="hub mode requires fcntl")
+
+
+class TestHubCoordinator(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.first = HubCoordinator(self.folder, "device-1", member_ttl=60)
+        self.second = HubCoordinator(self.folder, "device-2", member_ttl=60)
+
+    def tearDown(self):
+        self.first.release()
+        self.second.release()
+        shutil.rmtree(self.folder)
+
+    def test_single_hub_elected(self):
+        assert self.first.try_become_hub()
+        assert self.first.try_become_hub()
+        assert not self.second.try_become_hub()
+        assert self.first.is_hub and not self.second.is_hub
+
+    def test_hub_collects_siblings(self):
+        self.first.try_become_hub()
+        self.second.publish({"deviceUuid": "device-2"})
+
+        payloads = self.first.collect({"deviceUuid": "device-1"})
+        assert payloads == [{"deviceUuid": "device-1"}, {"deviceUuid": "device-2"}]
+
+    def test_stale_sibling_dropped(self):
+        self.first.try_become_hub()
+        self.second.publish({"deviceUuid": "device-2"})
+        member_file = os.path.join(self.folder, "members", "device-2.json")
+        stale = time.time() - 120
+        os.utime(member_file, (stale, stale))
+
+        assert self.first.collect({"deviceUuid": "device-1"}) == [{"deviceUuid": "device-1"}]
+        assert not os.path.exists(member_file)
+
+    def test_status_leaves_stale_members(self):
+        self.first.try_become_hub()
+        self.second.publish({"deviceUuid": "device-2"})
+        assert self.first.status()["members"] == 1
+
+        member_file = os.path.join(self.folder, "members", "device-2.json")
+        stale = time.time() - 120
+        os.utime(member_file, (stale, stale))
+        assert self.first.status()["members"] == 0
+        assert os.path.exists(member_file)
+
+    def test_refuses_shared_folder(self):
+        os.chmod(self.folder, 0o777)
+        with pytest.raises(HubFolderError):
+            self.first.try_become_hub()
+        with pytest.raises(HubFolderError):
+            self.second.publish({"deviceUuid": "device-2"})
+        assert not self.first.is_hub
+
+    def test_sibling_takes_over_released_hub(self):
+        self.first.try_become_hub()
+        self.second.publish({"deviceUuid": "device-2"})
+        self.first.release()
+
+        assert self.second.try_become_hub()
+        # The new hub no longer publishes itself as a member
+        assert not os.path.exists(os.path.join(self.folder, "members", "device-2.json"))
+
+
+class TestPluginHubMode(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.plugins = [self.create_plugin(f"device-{index}") for index in range(3)]
+
+    def tearDown(self):
+        for plugin in self.plugins:
+            if plugin._hub is not None:
+                plugin._hub.release()
+        shutil.rmtree(self.folder)
+
+    def create_plugin(self, device_uuid):
+        values = {
+            "fdm_host": mocked_host_intercepted,
+            "fdm_port": 443,
+            "oidc_client_id": "ValidAnnoyer123",
+            "oidc_client_secret": "ValidPawo321",
+            "device_uuid": device_uuid,
+            "hub_mode": True,
+            "hub_folder": self.folder,
+        }
+        plugin = FdmConnectorPlugin()
+        plugin._settings = mock.MagicMock()
+        plugin._settings.get = lambda accessor: values.get(accessor[0], None)
+        plugin._settings.get_int = lambda accessor: 120
+        plugin._settings.global_get = lambda accessor: "127.0.0.1" if accessor[1] == "host" else 5000
+        plugin._logger = mock.MagicMock()
+        plugin._write_persisted_data = lambda *args: None
+        plugin._persisted_data["persistence_uuid"] = f"persistence-{device_uuid}"
+        plugin._data_folder = "test_data/hub"
+        plugin._configure_hub()
+        return plugin
+
+    @staticmethod
+    def mocked_post(calls, batch_status=200):
+        def post(url, **kwargs):
+            calls.append((url, kwargs))
+
+            class MockResponse:
+                status_code = batch_status if url.endswith("announce-batch") else 200
+                text = json.dumps({"access_token": create_fake_at(), "expires_in": 600})
+
+            return MockResponse()
+
+        return post
+
+    def test_one_batched_announcement(self):
+        calls = []
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(calls)):
+            for plugin in self.plugins:
+                plugin._check_fdmmonster()
+            # Siblings published after the hub ticked, they are sent along on the next tick
+            self.plugins[0]._check_fdmmonster()
+
+        assert [plugin._state for plugin in self.plugins] == [State.SLEEP] * 3
+        urls = [url.rsplit("/", 1)[1] for url, _ in calls]
+        assert urls == ["token", "announce", "announce-batch"]
+        batch = posted_json(calls[-1][1])["announcements"]
+        assert [announcement["deviceUuid"] for announcement in batch] == ["device-0", "device-1", "device-2"]
+
+    def test_heartbeat_lists_members(self):
+        calls = []
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(calls)):
+            for plugin in self.plugins:
+                plugin._check_fdmmonster()
+            # Batch with the siblings, then unchanged payloads are only confirmed
+            self.plugins[0]._check_fdmmonster()
+            self.plugins[0]._check_fdmmonster()
+
+        url, kwargs = calls[-1]
+        assert url.endswith("heartbeat")
+        heartbeat = posted_json(kwargs)
+        assert heartbeat["deviceUuid"] == "device-0"
+        assert heartbeat["memberDeviceUuids"] == ["device-1", "device-2"]
+
+    def test_shared_folder_announces_standalone(self):
+        os.chmod(self.folder, 0o777)
+        calls = []
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(calls)):
+            self.plugins[1]._check_fdmmonster()
+
+        assert self.plugins[1]._hub is None
+        assert [url.rsplit("/", 1)[1] for url, _ in calls] == ["token", "announce"]
+
+    def test_batch_unsupported_falls_back(self):
+        calls = []
+        assert self.plugins[0]._hub.try_become_hub()
+        for plugin in self.plugins[1:]:
+            plugin._check_fdmmonster()
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(calls, batch_status=404)):
+            self.plugins[0]._check_fdmmonster()
+
+        urls = [url.rsplit("/", 1)[1] for url, _ in calls]
+        assert urls == ["token", "announce-batch", "announce", "announce", "announce"]
+        assert not self.plugins[0]._batch_announce_supported
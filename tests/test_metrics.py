@@ -0,0 +1,137 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import flask
+import pytest
+import requests
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import State
+from fdm_connector.http_client import FdmHttpClient
+from fdm_connector.metrics import ConnectorMetrics, MetricsRegistry
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        status = 201 if self.path == "/created" else 503
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("op_seconds", "Operation duration", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        text = self.registry.render()
+        assert '# TYPE op_seconds histogram' in text
+        assert 'op_seconds_bucket{le="0.1"} 2\n' in text
+        assert 'op_seconds_bucket{le="1.0"} 3\n' in text
+        assert 'op_seconds_bucket{le="+Inf"} 4\n' in text
+        assert 'op_seconds_sum 3.65\n' in text
+        assert 'op_seconds_count 4\n' in text
+
+    def test_counter_labels_are_escaped(self):
+        counter = self.registry.counter("events_total", "Events", ("name",))
+        counter.inc(('say "hi"\n',))
+        counter.inc(('say "hi"\n',), amount=2)
+
+        assert 'events_total{name="say \\"hi\\"\\n"} 3\n' in self.registry.render()
+
+    def test_unlabelled_counter_starts_at_zero(self):
+        self.registry.counter("bytes_total", "Bytes")
+        self.registry.gauge("last_seen", "Last seen")
+
+        text = self.registry.render()
+        assert "bytes_total 0\n" in text
+        assert "# TYPE last_seen gauge" in text
+        # A gauge without a value has no sample yet
+        assert not any(line.startswith("last_seen ") for line in text.splitlines())
+
+    def test_concurrent_observations_are_counted(self):
+        histogram = self.registry.histogram("op_seconds", "Operation duration")
+
+        def observe():
+            for _ in range(10000):
+                histogram.observe(0.01)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert histogram.count == 40000
+
+
+class TestHttpClientMetrics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StatusHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.metrics = ConnectorMetrics(clock=lambda: 1700000000.0)
+        self.client = FdmHttpClient(metrics=self.metrics)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_responses_and_bytes_are_counted(self):
+        self.client.post(self.base_url + "/created", data=b"12345")
+        self.client.post(self.base_url + "/busy", data=b"123")
+
+        assert self.metrics.http_responses.value((201,)) == 1
+        assert self.metrics.http_responses.value((503,)) == 1
+        assert self.metrics.sent_bytes.value() == 8
+        assert self.metrics.last_success.value == 1700000000.0
+
+    def test_failures_are_counted(self):
+        self.client.connect_timeout = 0.5
+        with pytest.raises(requests.exceptions.ConnectionError):
+            self.client.post("http://127.0.0.1:1/announce", data=b"{}")
+        assert self.metrics.http_failures.value() == 1
+        assert self.metrics.last_success.value is None
+
+
+class TestPluginMetrics(unittest.TestCase):
+    def setUp(self):
+        self.plugin = FdmConnectorPlugin()
+
+    def test_state_transitions_are_counted(self):
+        self.plugin._set_state(State.SUCCESS)
+        self.plugin._set_state(State.SLEEP)
+        self.plugin._set_state(State.SLEEP)
+
+        transitions = self.plugin._metrics.state_transitions
+        assert transitions.value((State.BOOT, State.SUCCESS)) == 1
+        assert transitions.value((State.SUCCESS, State.SLEEP)) == 1
+        assert transitions.value((State.SLEEP, State.SLEEP)) == 0
+
+    def test_metrics_route(self):
+        self.plugin._set_state(State.CRASHED)
+        with flask.Flask(__name__).test_request_context("/metrics"):
+            response = self.plugin.get_metrics()
+
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        text = response.get_data(as_text=True)
+        assert 'fdm_connector_state_transitions_total{from="boot",to="crashed"} 1\n' in text
+        assert "# TYPE fdm_connector_token_request_seconds histogram" in text
+        assert "# TYPE fdm_connector_announce_seconds histogram" in text
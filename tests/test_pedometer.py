@@ -0,0 +1,108 @@
+import time
+import unittest
+
+import pytest
+from octoprint.util.comm import gcode_command_for_cmd
+
+from fdm_connector.pedometer import FilamentPedometer
+
+# Per-line budget on the serial thread, generous to stay stable on slow CI runners
+per_line_budget_us = 5.0
+
+
+class TestFilamentPedometer(unittest.TestCase):
+    def setUp(self):
+        self.pedometer = FilamentPedometer()
+
+    def send(self, *lines):
+        for line in lines:
+            # The gcode argument as OctoPrint's gcode.sent hook receives it, 'T' for every tool change
+            gcode = gcode_command_for_cmd(line) if line else None
+            self.pedometer.on_gcode_sent(None, "sent", line, None, gcode)
+
+    def test_absolute_extrusion(self):
+        self.send("M82", "G1 X10 Y10 E1.5 F1200", "G1 X20 E3.0", "G0 X0 Y0")
+        assert self.pedometer.total() == pytest.approx(3.0)
+
+    def test_relative_extrusion(self):
+        self.send("M83", "G1 X10 E1.5", "G1 X20 E1.5", "G1 E0.25")
+        assert self.pedometer.total() == pytest.approx(3.25)
+
+    def test_absolute_arc_extrusion(self):
+        self.send("M82", "G1 X10 E1.0", "G2 X20 Y10 I5 J0 E3.5", "G3 X10 Y10 R5 E6.0")
+        assert self.pedometer.total() == pytest.approx(6.0)
+
+    def test_relative_arc_extrusion(self):
+        self.send("M83", "G1 X10 E1.0", "G2 X20 Y10 I5 J0 E2.5", "G3 X10 Y10 R5 E2.5")
+        assert self.pedometer.total() == pytest.approx(6.0)
+
+    def test_g91_g90_switch_modes(self):
+        self.send("G91", "G1 E2", "G90", "G92 E0", "G1 E5")
+        assert self.pedometer.total() == pytest.approx(7.0)
+
+    def test_retractions_tracked(self):
+        self.send("M83", "G1 E5", "G1 E-0.8 F2400", "G1 X5", "G1 E0.8")
+        assert self.pedometer.extruded[0] == pytest.approx(5.8)
+        assert self.pedometer.retracted[0] == pytest.approx(0.8)
+        assert self.pedometer.total(0) == pytest.approx(5.0)
+
+    def test_absolute_retraction(self):
+        self.send("M82", "G1 E10", "G1 E9", "G1 E10", "G1 E12")
+        assert self.pedometer.retracted[0] == pytest.approx(1.0)
+        assert self.pedometer.total() == pytest.approx(12.0)
+
+    def test_g92_reset(self):
+        self.send("M82", "G1 E100", "G92 E0", "G1 E5", "G92 E2", "G1 E3")
+        assert self.pedometer.total() == pytest.approx(106.0)
+
+    def test_bare_g92_resets_extruder(self):
+        self.send("G1 E20", "G92", "G1 E1")
+        assert self.pedometer.total() == pytest.approx(21.0)
+
+    def test_g92_without_extruder_keeps_position(self):
+        self.send("G1 E20", "G92 X0 Y0", "G1 E21")
+        assert self.pedometer.total() == pytest.approx(21.0)
+
+    def test_multiple_tools(self):
+        self.send("M83", "T0", "G1 E2", "T1", "G1 E3", "T3", "G1 E4", "T0", "G1 E1", "T12 ; purge", "G1 E0.5")
+        assert self.pedometer.extruded == pytest.approx([3.0, 3.0, 0.0, 4.0] + [0.0] * 8 + [0.5])
+        assert self.pedometer.tool == 12
+        assert self.pedometer.total() == pytest.approx(10.5)
+
+    def test_unparseable_values_ignored(self):
+        self.send("G1 Efoo", "G1 E1.5;comment", "T", "Tx", None)
+        assert self.pedometer.total() == pytest.approx(1.5)
+        assert self.pedometer.tool == 0
+
+    def test_reset(self):
+        self.send("M83", "T1", "G1 E3")
+        self.pedometer.reset()
+        assert self.pedometer.total() == 0
+        assert self.pedometer.tool == 0
+        assert not self.pedometer.relative
+        assert len(self.pedometer.extruded) == 2
+
+    def test_per_line_cost_within_budget(self):
+        """Micro-benchmark of the serial thread fast path with a realistic move/extrude mix"""
+        lines = [
+            ("G1 X102.315 Y98.126 E0.04271", "G1"),
+            ("G1 X103.014 Y98.826 E0.03146", "G1"),
+            ("G0 F9000 X110.5 Y120.25", "G0"),
+            ("G1 F1800 E-0.8", "G1"),
+            ("M105", "M105"),
+            ("G1 F1800 E0.8", "G1"),
+        ] * 5000
+        pedometer = FilamentPedometer()
+        pedometer.on_gcode_sent(None, "sent", "M83", None, "M83")
+        hook = pedometer.on_gcode_sent
+
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            for cmd, gcode in lines:
+                hook(None, "sent", cmd, None, gcode)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        per_line_us = best / len(lines) * 1e6
+        assert per_line_us < per_line_budget_us
@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import Keys
+from fdm_connector.persistence import PersistedDataStore, LoadResult
+
+persistence_uuid = "0b4e8a0e-52c5-4f43-9d9b-1b6f1c1a7d11"
+
+
+class FakeTimer:
+    def __init__(self, delay, callback):
+        self.delay = delay
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TestPersistedDataStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.folder, "backup_excluded_data.json")
+        self.timers = []
+        self.store = PersistedDataStore(flush_delay=5, run_later=self.run_later)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_later(self, delay, callback):
+        timer = FakeTimer(delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    def write_file(self, content):
+        with open(self.filepath, "w") as f:
+            f.write(content)
+
+    def test_missing_file(self):
+        assert self.store.load(self.filepath) == LoadResult.MISSING
+        assert self.store.data == {}
+
+    def test_load_is_cached_until_file_changes(self):
+        self.write_file(json.dumps({Keys.persistence_uuid_key: persistence_uuid}))
+        data = self.store.data
+
+        assert self.store.load(self.filepath) == LoadResult.LOADED
+        assert self.store.load(self.filepath) == LoadResult.CACHED
+        assert self.store.data is data
+        assert data[Keys.persistence_uuid_key] == persistence_uuid
+
+        self.write_file(json.dumps({Keys.persistence_uuid_key: persistence_uuid, "access_token": "abc"}))
+        assert self.store.load(self.filepath) == LoadResult.LOADED
+        assert data["access_token"] == "abc"
+
+    def test_writes_are_debounced(self):
+        self.store.data["access_token"] = "first"
+        self.store.write(self.filepath)
+        self.store.data["access_token"] = "second"
+        self.store.write(self.filepath)
+
+        assert len(self.timers) == 1
+        assert self.timers[0].delay == 5
+        assert not os.path.exists(self.filepath)
+
+        self.timers[0].callback()
+        with open(self.filepath) as f:
+            assert json.load(f)["access_token"] == "second"
+        assert not self.store.dirty
+        assert not os.path.exists(self.filepath + ".tmp")
+        # Our own write does not cause a re-read
+        assert self.store.load(self.filepath) == LoadResult.CACHED
+
+    def test_flush_without_changes(self):
+        assert not self.store.flush()
+
+    def test_flush_cancels_pending_write(self):
+        self.store.data["access_token"] = "abc"
+        self.store.write(self.filepath)
+
+        assert self.store.flush()
+        assert self.timers[0].cancelled
+
+    def test_corrupt_file_keeps_persistence_uuid(self):
+        self.write_file('{"persistence_uuid": "' + persistence_uuid + '", "access_token": "trunc')
+
+        assert self.store.load(self.filepath) == LoadResult.RECOVERED
+        assert self.store.data == {Keys.persistence_uuid_key: persistence_uuid}
+        assert self.store.flush()
+        with open(self.filepath) as f:
+            assert json.load(f)[Keys.persistence_uuid_key] == persistence_uuid
+
+    def test_corrupt_file_prefers_memory(self):
+        self.store.data[Keys.persistence_uuid_key] = persistence_uuid
+        self.write_file("\x00\x00garbage")
+
+        assert self.store.load(self.filepath) == LoadResult.RECOVERED
+        assert self.store.data[Keys.persistence_uuid_key] == persistence_uuid
+
+    def test_corrupt_file_without_uuid(self):
+        self.write_file("[]")
+
+        assert self.store.load(self.filepath) == LoadResult.RECOVERED
+        assert self.store.data == {}
+
+
+class TestPluginPersistedData(unittest.TestCase):
+    def setUp(self):
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = lambda accessor: None
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._data_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.plugin._data_folder)
+
+    def read_file(self):
+        with open(self.plugin.get_excluded_persistence_datapath()) as f:
+            return json.load(f)
+
+    def test_deleted_file_written_again(self):
+        self.plugin._fetch_persisted_data()
+        created = self.read_file()[Keys.persistence_uuid_key]
+        os.remove(self.plugin.get_excluded_persistence_datapath())
+
+        self.plugin._fetch_persisted_data()
+        assert self.read_file()[Keys.persistence_uuid_key] == created
+        assert self.plugin._persisted_data[Keys.persistence_uuid_key] == created
+
+    def test_announcement_reads_under_load_lock(self):
+        locked = []
+        self.plugin._fetch_persisted_data = lambda: locked.append(self.plugin._load_lock.locked())
+        self.plugin._persisted_data[Keys.persistence_uuid_key] = persistence_uuid
+
+        assert self.plugin._build_announcement()["persistenceUuid"] == persistence_uuid
+        assert locked == [True]
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from concurrent.futures import Future, TimeoutError
+
+import pytest
+
+from fdm_connector.probe import ProbeCache, probe_key
+
+
+class TestProbeCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = ProbeCache(ttl=10, clock=lambda: self.now)
+        self.started = []
+
+    def start_probe(self):
+        future = Future()
+        self.started.append(future)
+        return future
+
+    def test_concurrent_probes_share_one_call(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get("key", self.start_probe, 5)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while self.cache.status()["misses"] + self.cache.status()["coalesced"] < 8:
+            pass
+        self.started[0].set_result({"version": "1"})
+        for thread in threads:
+            thread.join()
+
+        assert len(self.started) == 1
+        assert results == [{"version": "1"}] * 8
+
+    def test_result_cached_for_ttl(self):
+        future = Future()
+        future.set_result("ok")
+        assert self.cache.get("key", lambda: future, 1) == "ok"
+        self.now = 9.0
+        assert self.cache.get("key", self.start_probe, 1) == "ok"
+        assert self.started == []
+
+        self.now = 10.0
+        with pytest.raises(TimeoutError):
+            self.cache.get("key", self.start_probe, 0.01)
+        assert len(self.started) == 1
+
+    def test_failures_are_not_cached(self):
+        failed = Future()
+        failed.set_exception(ValueError("unreachable"))
+        with pytest.raises(ValueError):
+            self.cache.get("key", lambda: failed, 1)
+        assert self.cache.status()["cached"] == 0
+
+    def test_rejected_results_are_not_cached(self):
+        cache = ProbeCache(ttl=10, clock=lambda: self.now, cacheable=lambda result: result["state"] == "success")
+        for state in ("crashed", "success"):
+            future = Future()
+            future.set_result({"state": state})
+            assert cache.get("key", lambda: future, 1) == {"state": state}
+        assert cache.get("key", self.start_probe, 1) == {"state": "success"}
+        assert self.started == []
+        assert cache.status()["misses"] == 2
+
+    def test_key_hides_credentials(self):
+        key = probe_key("openid", "http://127.0.0.1", "client", "secret")
+        assert "secret" not in key
+        assert key != probe_key("openid", "http://127.0.0.1", "client", "other-secret")
@@ -0,0 +1,70 @@
+import unittest
+from email.utils import formatdate
+
+from fdm_connector.constants import State
+from fdm_connector.scheduler import BackoffScheduler, parse_retry_after
+
+
+class TestBackoffScheduler(unittest.TestCase):
+    def setUp(self):
+        self.state = State.BOOT
+        self.random_value = 1.0
+        self.now = 1000.0
+        self.scheduler = BackoffScheduler(lambda: self.state, interval=120, base_delay=5, max_delay=600,
+                                          startup_splay=30, rand=lambda: self.random_value, clock=lambda: self.now)
+
+    def test_startup_splay(self):
+        self.random_value = 0.5
+        assert self.scheduler.next_delay() == 15
+        assert self.scheduler.status()["next_attempt_at"] == 1015
+
+    def test_regular_interval_on_success(self):
+        self.scheduler.next_delay()
+        for state in (State.SUCCESS, State.SLEEP):
+            self.state = state
+            assert self.scheduler.next_delay() == 120
+
+    def test_exponential_backoff_capped(self):
+        self.scheduler.next_delay()
+        self.state = State.RETRY
+        delays = [self.scheduler.next_delay() for _ in range(10)]
+
+        assert delays[:4] == [5, 10, 20, 40]
+        assert max(delays) == 600
+        assert self.scheduler.status()["failed_attempts"] == 10
+
+    def test_full_jitter(self):
+        self.scheduler.next_delay()
+        self.state = State.CRASHED
+        self.random_value = 0.5
+        self.scheduler.next_delay()
+        assert self.scheduler.next_delay() == 5
+
+        # Never a hot loop
+        self.random_value = 0.0
+        assert self.scheduler.next_delay() == 1
+
+    def test_success_resets_backoff(self):
+        self.scheduler.next_delay()
+        self.state = State.CRASHED
+        self.scheduler.next_delay()
+        self.scheduler.next_delay()
+        self.state = State.SLEEP
+        self.scheduler.next_delay()
+        self.state = State.CRASHED
+        assert self.scheduler.next_delay() == 5
+
+    def test_retry_after_is_lower_bound(self):
+        self.scheduler.next_delay()
+        self.state = State.RETRY
+        self.scheduler.record_retry_after("90")
+        assert self.scheduler.next_delay() == 90
+        # Only applied once
+        assert self.scheduler.next_delay() == 10
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("120") == 120
+        assert parse_retry_after("not a date") is None
+        assert parse_retry_after(formatdate(1060, usegmt=True), now=1000) == 60
+        assert parse_retry_after(formatdate(900, usegmt=True), now=1000) == 0
@@ -0,0 +1,97 @@
+import unittest
+import unittest.mock as mock
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import Keys
+from fdm_connector.settings import SettingsSnapshot, normalize_fdm_host
+from tests.utils import mock_settings_custom, mock_settings_global_get, mocked_host_intercepted
+
+
+def settings_with(**values):
+    settings = mock.MagicMock()
+    settings.get = lambda accessor: values.get(accessor[0])
+    settings.get_int = lambda accessor: values.get(accessor[0])
+    settings.global_get = mock_settings_global_get
+    settings.global_get_int = lambda accessor: None
+    return settings
+
+
+class TestNormalizeFdmHost(unittest.TestCase):
+    def test_scheme_and_slashes(self):
+        assert normalize_fdm_host("https://fdm.local") == ("https://fdm.local", None)
+        assert normalize_fdm_host("https://fdm.local/") == ("https://fdm.local", None)
+        assert normalize_fdm_host(" HTTP://fdm.local// ") == ("http://fdm.local", None)
+        assert normalize_fdm_host("fdm.local") == ("http://fdm.local", None)
+
+    def test_port_and_path(self):
+        assert normalize_fdm_host("http://192.168.1.5:4000") == ("http://192.168.1.5", 4000)
+        assert normalize_fdm_host("http://[::1]:4000") == ("http://[::1]", 4000)
+        assert normalize_fdm_host("https://proxy.local/fdm/") == ("https://proxy.local/fdm", None)
+
+    def test_unusable_hosts(self):
+        assert normalize_fdm_host(None) == (None, None)
+        assert normalize_fdm_host("  ") == (None, None)
+        assert normalize_fdm_host("ftp://fdm.local") == (None, None)
+        assert normalize_fdm_host("http://fdm.local:99999") == (None, None)
+
+
+class TestSettingsSnapshot(unittest.TestCase):
+    def test_base_url(self):
+        snapshot = SettingsSnapshot.read(settings_with(fdm_host="https://fdm.local/", fdm_port="4000"))
+        assert snapshot.fdm_base_url == "https://fdm.local:4000"
+        assert snapshot.fdm_port == 4000
+        assert snapshot.fdm_host_valid
+
+    def test_base_url_keeps_path_prefix(self):
+        snapshot = SettingsSnapshot.read(settings_with(fdm_host="https://proxy.local/fdm", fdm_port=443))
+        assert snapshot.fdm_base_url == "https://proxy.local:443/fdm/"
+
+    def test_embedded_port_without_fdm_port(self):
+        snapshot = SettingsSnapshot.read(settings_with(fdm_host="fdm.local:4000"))
+        assert snapshot.fdm_base_url == "http://fdm.local:4000"
+
+    def test_invalid_host(self):
+        snapshot = SettingsSnapshot.read(settings_with(fdm_host="ftp://fdm.local", fdm_port=4000))
+        assert snapshot.fdm_base_url is None
+        assert not snapshot.fdm_host_valid
+
+    def test_immutable(self):
+        snapshot = SettingsSnapshot.read(settings_with(fdm_host="fdm.local", fdm_port=4000))
+        with self.assertRaises(AttributeError):
+            snapshot.fdm_port = 1
+
+
+class TestPluginSettingsSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.settings = mock.MagicMock()
+        self.settings.get = mock.MagicMock(side_effect=mock_settings_custom)
+        self.settings.get_int = mock_settings_custom
+        self.settings.global_get = mock_settings_global_get
+        self.settings.global_get_int = lambda accessor: None
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = self.settings
+        self.plugin._logger = mock.MagicMock()
+
+    def test_snapshot_read_once(self):
+        assert self.plugin._get_settings().fdm_base_url == f"{mocked_host_intercepted}:443"
+        calls = self.settings.get.call_count
+        self.plugin._get_settings()
+        self.plugin.get_template_vars()
+        assert self.settings.get.call_count == calls
+
+    def test_snapshot_replaced_on_save(self):
+        before = self.plugin._get_settings()
+        with mock.patch("octoprint.plugin.SettingsPlugin.on_settings_save"):
+            self.settings.get.side_effect = lambda accessor: 4000 if accessor[0] == "fdm_port" \
+                else mock_settings_custom(accessor)
+            self.plugin.on_settings_save({})
+        after = self.plugin._get_settings()
+        assert after is not before
+        assert after.fdm_base_url == f"{mocked_host_intercepted}:4000"
+        assert before.fdm_port == 443
+
+    def test_device_uuid_not_saved_from_ticks(self):
+        device_uuid = self.plugin._get_device_uuid()
+        assert self.plugin._get_device_uuid() == device_uuid
+        self.settings.set.assert_called_once_with([Keys.device_uuid_key], device_uuid)
+        self.settings.save.assert_not_called()
@@ -0,0 +1,203 @@
+import threading
+import unittest
+import unittest.mock as mock
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import flask
+import requests
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.snapshot import SnapshotCache
+from tests.utils import create_fake_at, mock_settings_custom
+
+jpeg = b"\xff\xd8\xff\xe0 first frame \xff\xd9"
+
+
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.frames = [jpeg]
+        self.captures = 0
+        self.cache = SnapshotCache(self.capture, min_interval=1.0, clock=lambda: self.now)
+
+    def capture(self):
+        self.captures += 1
+        frame = self.frames[min(self.captures, len(self.frames)) - 1]
+        if isinstance(frame, Exception):
+            raise frame
+        return frame, "image/jpeg"
+
+    def test_captured_once_per_interval(self):
+        frame = self.cache.get()
+        assert frame.data == jpeg
+        assert self.cache.get() is frame
+        self.now += 0.5
+        self.cache.get()
+        assert self.captures == 1
+
+        self.now += 1
+        self.cache.get()
+        assert self.captures == 2
+
+    def test_unchanged_content_keeps_etag(self):
+        self.frames = [jpeg, jpeg, b"\xff\xd8 second frame \xff\xd9"]
+        first = self.cache.get()
+        self.now += 2
+        assert self.cache.get() is first
+        self.now += 2
+        changed = self.cache.get()
+        assert changed.etag != first.etag
+        assert self.cache.status()["unchanged"] == 1
+
+    def test_failed_capture_serves_previous_frame(self):
+        self.frames = [jpeg, requests.exceptions.ConnectionError("webcam offline")]
+        first = self.cache.get()
+        self.now += 2
+        assert self.cache.get() is first
+        self.now += 0.5
+        assert self.cache.get() is first
+        assert self.captures == 2
+        assert self.cache.status()["stale"] == 2
+
+    def test_failed_capture_without_frame_raises(self):
+        self.frames = [requests.exceptions.ConnectionError("webcam offline")]
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.cache.get()
+        # The webcam isn't asked again within the interval
+        self.now += 0.5
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.cache.get()
+        assert self.captures == 1
+
+        self.frames = [jpeg]
+        self.captures = 0
+        self.now += 1
+        assert self.cache.get().data == jpeg
+
+    def test_slow_capture_times_out(self):
+        release = threading.Event()
+
+        def stuck_capture():
+            release.wait(5)
+            return jpeg, "image/jpeg"
+
+        cache = SnapshotCache(stuck_capture, min_interval=1.0, clock=lambda: self.now)
+        with self.assertRaises(FutureTimeoutError):
+            cache.get(0.05)
+        release.set()
+        assert cache.get(5).data == jpeg
+        assert cache.status()["captures"] == 1
+
+    def test_concurrent_viewers_share_one_capture(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_capture():
+            self.captures += 1
+            started.set()
+            release.wait(5)
+            return jpeg, "image/jpeg"
+
+        cache = SnapshotCache(slow_capture, min_interval=1.0, clock=lambda: self.now)
+        results = []
+        viewers = [threading.Thread(target=lambda: results.append(cache.get(5))) for _ in range(8)]
+        viewers[0].start()
+        assert started.wait(5)
+        for viewer in viewers[1:]:
+            viewer.start()
+        while cache.status()["coalesced"] < 7:
+            release.wait(0.01)
+        release.set()
+        for viewer in viewers:
+            viewer.join(5)
+
+        assert self.captures == 1
+        assert len(results) == 8 and all(frame is results[0] for frame in results)
+
+
+class TestPluginSnapshotRoute(unittest.TestCase):
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = lambda accessor: "http://127.0.0.1:8080/?action=snapshot" \
+            if accessor[0] == "snapshot_url" else mock_settings_custom(accessor)
+        self.plugin._logger = mock.MagicMock()
+        self.webcam = mock.MagicMock(return_value=mock.MagicMock(status_code=200, content=jpeg,
+                                                                 headers={"Content-Type": "image/jpeg"}))
+
+    def get(self, headers=None):
+        with mock.patch("requests.Session.get", self.webcam), \
+                self.app.test_request_context("/snapshot", headers=headers or {}):
+            return self.plugin.get_snapshot()
+
+    def test_snapshot_with_etag(self):
+        response = self.get()
+        assert response.status_code == 200
+        assert response.get_data() == jpeg
+        assert response.content_type == "image/jpeg"
+        assert response.get_etag()[0] == self.plugin._snapshots.status()["etag"]
+
+        revalidated = self.get({"If-None-Match": response.headers["ETag"]})
+        assert revalidated.status_code == 304
+        assert self.webcam.call_count == 1
+
+    def test_webcam_unreachable(self):
+        self.webcam.side_effect = requests.exceptions.ConnectionError("refused")
+        body, status = self.get()
+        assert status == 502
+
+    def test_no_webcam_configured(self):
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._settings.global_get = lambda accessor: None
+        with mock.patch("octoprint.webcams.get_snapshot_webcam", return_value=None):
+            body, status = self.get()
+        assert status == 404
+
+    def test_webcam_provider(self):
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._settings.global_get = lambda accessor: None
+        webcam = mock.MagicMock()
+        webcam.config.name = "classic"
+        webcam.providerPlugin.take_webcam_snapshot.return_value = iter([jpeg[:8], jpeg[8:]])
+        with mock.patch("octoprint.webcams.get_snapshot_webcam", return_value=webcam):
+            response = self.get()
+
+        assert response.status_code == 200
+        assert response.get_data() == jpeg
+        assert response.content_type == "image/jpeg"
+        webcam.providerPlugin.take_webcam_snapshot.assert_called_once_with("classic")
+        assert self.webcam.call_count == 0
+
+    def test_push_only_changed_frames(self):
+        self.plugin._token_manager.update({"access_token": create_fake_at(), "expires_in": 600})
+        self.plugin._persisted_data_loaded.set()
+        post = mock.MagicMock(return_value=mock.MagicMock(status_code=200))
+        with mock.patch("requests.Session.get", self.webcam), mock.patch("requests.Session.post", post):
+            self.plugin._push_snapshot()
+            self.plugin._snapshots.min_interval = 0
+            self.plugin._push_snapshot()
+
+        assert self.webcam.call_count == 2
+        assert post.call_count == 1
+        assert post.call_args[0][0].endswith("api/plugins/octoprint/snapshot")
+        assert post.call_args[1]["data"] == jpeg
+        assert post.call_args[1]["headers"]["Content-Type"] == "image/jpeg"
+
+    def test_push_reports_webcam_down_once(self):
+        self.plugin._token_manager.update({"access_token": create_fake_at(), "expires_in": 600})
+        self.plugin._persisted_data_loaded.set()
+        self.webcam.side_effect = requests.exceptions.ConnectionError("webcam offline")
+        post = mock.MagicMock(return_value=mock.MagicMock(status_code=200))
+        with mock.patch("requests.Session.get", self.webcam), mock.patch("requests.Session.post", post):
+            for _ in range(3):
+                self.plugin._push_snapshot()
+                self.plugin._snapshots.min_interval = 0
+            assert self.plugin._logger.warning.call_count == 1
+            assert self.plugin._logger.debug.call_count == 2
+
+            self.webcam.side_effect = None
+            self.plugin._push_snapshot()
+
+        assert self.webcam.call_count == 4
+        assert post.call_count == 1
+        assert not self.plugin._snapshot_capture_failing
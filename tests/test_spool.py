@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import requests
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import State
+from fdm_connector.spool import OfflineSpool
+from tests.utils import create_fake_at, mock_settings_custom, mock_settings_global_get, posted_json
+
+
+class TestOfflineSpool(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.now = 100.0
+        self.spool = OfflineSpool(self.folder, segment_size=256, max_bytes=4096, sync_interval=5,
+                                  clock=lambda: self.now)
+        self.spool.open()
+        self.uploads = []
+        self.accept = True
+
+    def tearDown(self):
+        self.spool.close()
+        shutil.rmtree(self.folder)
+
+    def upload(self, records):
+        self.uploads.append([record["payload"] for record in records])
+        return self.accept
+
+    def segment_files(self):
+        return sorted(entry for entry in os.listdir(self.folder) if entry.endswith(".seg"))
+
+    def test_replay_in_order(self):
+        for index in range(5):
+            self.spool.append("telemetry", index)
+
+        assert self.spool.replay(self.upload, batch_size=2) == 5
+        assert self.uploads == [[0, 1], [2, 3], [4]]
+        assert self.segment_files() == []
+        assert not self.spool.has_backlog()
+
+    def test_segments_rotate(self):
+        for index in range(20):
+            self.spool.append("telemetry", "x" * 40)
+
+        assert len(self.segment_files()) > 1
+        assert self.spool.replay(self.upload, batch_size=100) == 20
+
+    def test_rotation_leaves_fsync_to_sync(self):
+        with mock.patch("os.fsync") as fsync:
+            for index in range(20):
+                self.spool.append("telemetry", "x" * 40)
+            assert len(self.segment_files()) > 1
+            assert fsync.call_count == 0
+
+            self.spool.sync()
+        assert fsync.call_count == len(self.segment_files())
+
+    def test_replay_skips_segment_dropped_meanwhile(self):
+        for index in range(20):
+            self.spool.append("telemetry", index)
+        segments = self.segment_files()
+
+        def upload(records):
+            if len(self.uploads) == 0:
+                # An append rotating on another thread hit the size cap
+                os.remove(os.path.join(self.folder, segments[1]))
+            return self.upload(records)
+
+        assert self.spool.replay(upload, batch_size=100) > 0
+        replayed = [payload for batch in self.uploads for payload in batch]
+        assert replayed[0] == 0 and replayed[-1] == 19
+        assert len(replayed) < 20
+        assert not self.spool.has_backlog()
+
+    def test_size_cap_drops_oldest_segments(self):
+        self.spool.max_bytes = 600
+        for index in range(40):
+            self.spool.append("telemetry", index)
+        self.spool.sync()
+
+        status = self.spool.status()
+        assert status["dropped_segments"] > 0
+        assert status["bytes"] <= 600 + self.spool.segment_size
+        self.spool.replay(self.upload, batch_size=100)
+        replayed = [payload for batch in self.uploads for payload in batch]
+        assert replayed == list(range(40 - len(replayed), 40))
+
+    def test_rejected_batch_resumes_from_cursor(self):
+        for index in range(4):
+            self.spool.append("telemetry", index)
+        self.accept = False
+        assert self.spool.replay(self.upload, batch_size=2) == 0
+
+        # A restarted connector picks up at the cursor
+        self.spool.close()
+        self.spool = OfflineSpool(self.folder, segment_size=256, max_bytes=4096)
+        self.spool.open()
+        self.accept = True
+        self.uploads = []
+        assert self.spool.replay(self.upload, batch_size=2) == 4
+        assert self.uploads == [[0, 1], [2, 3]]
+
+    def test_cursor_skips_accepted_batches(self):
+        for index in range(4):
+            self.spool.append("telemetry", index)
+        results = iter([True, False])
+        assert self.spool.replay(lambda records: next(results), batch_size=2) == 2
+
+        assert self.spool.replay(self.upload, batch_size=2) == 2
+        assert self.uploads == [[2, 3]]
+
+    def test_corrupt_tail_is_discarded(self):
+        for index in range(3):
+            self.spool.append("telemetry", index)
+        self.spool.close()
+        path = os.path.join(self.folder, self.segment_files()[0])
+        with open(path, "r+b") as f:
+            f.seek(-2, os.SEEK_END)
+            f.write(b"??")
+
+        assert self.spool.replay(self.upload, batch_size=10) == 2
+        assert self.uploads == [[0, 1]]
+        assert self.spool.status()["corrupt"] == 1
+
+    def test_sync_is_grouped(self):
+        self.spool.append("telemetry", 1)
+        assert not self.spool.needs_sync
+        self.now = 106.0
+        assert self.spool.needs_sync
+
+        with mock.patch("os.fsync") as fsync:
+            self.spool.sync()
+        assert fsync.call_count == 1
+        assert not self.spool.needs_sync
+
+
+class TestPluginSpool(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._settings.global_get = mock_settings_global_get
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._data_folder = self.folder
+        self.plugin._write_persisted_data = lambda *args: None
+
+    def tearDown(self):
+        if self.plugin._spool is not None:
+            self.plugin._spool.close()
+        shutil.rmtree(self.folder)
+
+    def test_unreachable_announcement_is_spooled(self):
+        with mock.patch('requests.Session.post', side_effect=requests.exceptions.ConnectionError()):
+            self.plugin._query_announcement("http://127.0.0.1:4000", create_fake_at())
+
+        assert self.plugin._state == State.RETRY
+        assert self.plugin._spool.status()["appended"] == 1
+
+    def test_replayed_announcement_requests_resync(self):
+        self.plugin._get_spool().append("announce", [{"deviceUuid": "device"}])
+        self.plugin._announcements.acknowledge("hash")
+
+        assert self.plugin._spool.replay(self.plugin._upload_spooled) == 1
+        assert self.plugin._announcements.next_mode("hash") == "full"
+
+    def test_failed_telemetry_replayed_in_bulk(self):
+        self.plugin._token_manager.update({"access_token": create_fake_at(), "expires_in": 600})
+        self.plugin._get_telemetry().push("filament", 0, 1.0)
+        with mock.patch('requests.Session.post', side_effect=requests.exceptions.ConnectionError()):
+            self.plugin._get_telemetry().flush(force=True)
+        self.plugin._get_telemetry().push("filament", 0, 2.0)
+        with mock.patch('requests.Session.post', side_effect=requests.exceptions.ConnectionError()):
+            self.plugin._get_telemetry().flush(force=True)
+
+        post = mock.MagicMock(return_value=mock.MagicMock(status_code=200))
+        with mock.patch('requests.Session.post', post):
+            assert self.plugin._spool.replay(self.plugin._upload_spooled) == 2
+        assert post.call_count == 1
+        assert [sample["value"] for sample in posted_json(post.call_args[1])["samples"]] == [1.0, 2.0]
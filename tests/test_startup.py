@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Import of the plugin module plus initialize(), on top of what OctoPrint loaded before any plugin
+startup_budget_secs = 0.25
+
+# Subsystems which are only loaded when enabled or first used
+lazy_modules = ("fdm_connector.tunnel", "fdm_connector.telemetry", "fdm_connector.hub", "fdm_connector.spool",
+                "fdm_connector.probe", "fdm_connector.snapshot", "octoprint.filemanager")
+
+_startup_script = """
+import json, logging, sys, time
+# Already loaded by OctoPrint's server (tornado brings asyncio) when the plugins are loaded
+import asyncio, flask, octoprint.plugin, requests
+
+started = time.perf_counter()
+import fdm_connector
+
+plugin = fdm_connector.FdmConnectorPlugin()
+plugin._data_folder = sys.argv[1]
+plugin._logger = logging.getLogger("test")
+plugin.initialize()
+elapsed = time.perf_counter() - started
+
+plugin._persisted_data_loaded.wait(5)
+print(json.dumps(dict(seconds=elapsed, modules=sorted(sys.modules))))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def run_startup(self):
+        with tempfile.TemporaryDirectory() as folder:
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            output = subprocess.check_output([sys.executable, "-c", _startup_script, folder], cwd=root)
+        return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    def test_startup_within_budget(self):
+        # Best of three, the first run may compile the modules
+        seconds = min(self.run_startup()["seconds"] for _ in range(3))
+        assert seconds < startup_budget_secs, f"import and initialize took {seconds * 1000:.0f} ms"
+
+    def test_optional_subsystems_not_loaded(self):
+        modules = self.run_startup()["modules"]
+        assert [module for module in lazy_modules if module in modules] == []
@@ -0,0 +1,144 @@
+import json
+import time
+import unittest
+import unittest.mock as mock
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.status import StatusPusher, fields_for_event
+from tests.utils import create_fake_at, mock_settings_custom, posted_json
+
+
+class TestStatusEvents(unittest.TestCase):
+    def test_fields_for_event(self):
+        assert fields_for_event("PrinterStateChanged", {"state_id": "PRINTING", "state_string": "Printing"}) == \
+            {"state": "PRINTING", "stateText": "Printing"}
+        assert fields_for_event("PrintDone", {"time": 12.5}) == {"jobResult": "done", "jobTime": 12.5}
+        assert fields_for_event("Disconnected", None) == {"connected": False}
+        assert fields_for_event("ZChange", {"new": 1.0}) is None
+
+
+class TestStatusPusher(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.accept = True
+        self.pusher = StatusPusher(self.send)
+
+    def send(self, fields):
+        self.sent.append(fields)
+        return self.accept
+
+    def test_burst_coalesced_into_one_push(self):
+        assert self.pusher.update({"state": "OPERATIONAL", "connected": True})
+        assert not self.pusher.update({"state": "PRINTING"})
+        assert not self.pusher.update({"jobResult": "printing"})
+
+        assert self.pusher.flush() is None
+        assert self.sent == [{"state": "PRINTING", "connected": True, "jobResult": "printing"}]
+
+    def test_only_changed_fields_pushed(self):
+        self.pusher.update({"state": "PRINTING", "connected": True})
+        self.pusher.flush()
+
+        assert self.pusher.update({"state": "PAUSED", "connected": True})
+        self.pusher.flush()
+        assert self.sent[-1] == {"state": "PAUSED"}
+
+    def test_change_reverted_within_window_not_pushed(self):
+        self.pusher.update({"state": "PRINTING"})
+        self.pusher.flush()
+
+        assert self.pusher.update({"state": "PAUSED"})
+        self.pusher.update({"state": "PRINTING"})
+        assert self.pusher.flush() is None
+        assert len(self.sent) == 1
+        # Nothing changed, no window is opened
+        assert not self.pusher.update({"state": "PRINTING"})
+
+    def test_failed_push_retried(self):
+        self.accept = False
+        self.pusher.update({"state": "ERROR"})
+        assert self.pusher.flush() == self.pusher.retry_delay
+        # The window stays open for the retry
+        assert not self.pusher.update({"error": "thermal runaway"})
+
+        self.accept = True
+        assert self.pusher.flush() is None
+        assert self.sent[-1] == {"state": "ERROR", "error": "thermal runaway"}
+        assert self.pusher.status()["failed_pushes"] == 1
+
+    def test_resync_pushes_everything(self):
+        self.pusher.update({"state": "PRINTING", "connected": True})
+        self.pusher.flush()
+        self.pusher.resync()
+        self.pusher.flush()
+        assert self.sent[-1] == {"state": "PRINTING", "connected": True}
+
+    def test_disabled(self):
+        self.pusher.disable()
+        assert not self.pusher.update({"state": "PRINTING"})
+        assert self.pusher.flush() is None
+        assert self.sent == []
+
+
+class TestPluginStatusPush(unittest.TestCase):
+    def setUp(self):
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._data_folder = "test_data/status"
+        self.plugin._write_persisted_data = lambda *args: None
+        self.plugin._token_manager.update({"access_token": create_fake_at(), "expires_in": 600})
+
+    def tearDown(self):
+        self.plugin._engine.stop()
+
+    @staticmethod
+    def mocked_post(status_code, calls):
+        def post(url, **kwargs):
+            calls.append((url, posted_json(kwargs)))
+            return mock.MagicMock(status_code=status_code, text=json.dumps({}))
+        return post
+
+    def test_events_pushed_once_per_window(self):
+        self.plugin._status.debounce = 0.05
+        self.plugin._engine.start()
+        calls = []
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(200, calls)):
+            self.plugin.on_event("Connected", {"port": "/dev/ttyACM0"})
+            self.plugin.on_event("PrinterStateChanged", {"state_id": "OPERATIONAL", "state_string": "Operational"})
+            self.plugin.on_event("PrinterStateChanged", {"state_id": "PRINTING", "state_string": "Printing"})
+            self.plugin.on_event("PrintStarted", {"name": "benchy.gcode", "origin": "local"})
+            deadline = time.monotonic() + 5
+            while not calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.1)
+
+        assert len(calls) == 1
+        url, payload = calls[0]
+        assert url.endswith("api/plugins/octoprint/status")
+        assert payload["status"]["state"] == "PRINTING"
+        assert payload["status"]["jobName"] == "benchy.gcode"
+        assert payload["status"]["connected"] is True
+
+    def test_unsupported_server_disables_push(self):
+        self.plugin._status.update({"state": "PRINTING"})
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(404, [])):
+            assert self.plugin._status.flush() is None
+        assert not self.plugin._status.status()["enabled"]
+
+    def test_conflict_resends_whole_status(self):
+        calls = []
+        self.plugin._status.update({"state": "PRINTING", "connected": True})
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(200, calls)):
+            self.plugin._status.flush()
+        self.plugin._status.update({"state": "PAUSED"})
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(409, calls)):
+            assert self.plugin._status.flush() == self.plugin._status.retry_delay
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post(200, calls)):
+            self.plugin._status.flush()
+        assert calls[-1][1]["status"] == {"state": "PAUSED", "connected": True}
+
+    def test_ignored_events(self):
+        self.plugin.on_event("ZChange", {"new": 0.2})
+        assert self.plugin._status.status()["events"] == 0
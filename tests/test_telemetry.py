@@ -0,0 +1,167 @@
+import unittest
+import unittest.mock as mock
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.telemetry import TelemetryBuffer, TelemetryUploader
+from tests.utils import create_fake_at, mock_settings_custom, posted_json
+
+
+class TestTelemetryBuffer(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.buffer = TelemetryBuffer(capacity=4, clock=lambda: self.now)
+
+    def test_push_and_drain_in_order(self):
+        for index in range(3):
+            self.buffer.push("temperature", "tool0", 200 + index)
+        assert len(self.buffer) == 3
+
+        samples = self.buffer.drain(2)
+        assert [sample["value"] for sample in samples] == [200, 201]
+        assert samples[0] == dict(t=100.0, kind="temperature", key="tool0", value=200)
+        assert len(self.buffer) == 1
+        assert self.buffer.drain(10)[0]["value"] == 202
+        assert self.buffer.drain(10) == []
+
+    def test_overflow_coalesces_same_key(self):
+        for key in ("tool0", "bed", "tool0", "bed"):
+            self.buffer.push("temperature", key, 1)
+        self.now = 101.0
+        self.buffer.push("temperature", "bed", 2)
+
+        samples = self.buffer.drain(10)
+        assert len(samples) == 4
+        assert samples[3] == dict(t=101.0, kind="temperature", key="bed", value=2)
+        assert self.buffer.coalesced == 1
+        assert self.buffer.dropped == 0
+
+    def test_overflow_drops_oldest_without_match(self):
+        for index in range(4):
+            self.buffer.push("filament", index, index)
+        self.buffer.push("filament", 9, 9)
+
+        assert [sample["key"] for sample in self.buffer.drain(10)] == [1, 2, 3, 9]
+        assert self.buffer.dropped == 1
+
+    def test_oldest_timestamp(self):
+        assert self.buffer.oldest_timestamp() is None
+        self.buffer.push("filament", 0, 1)
+        self.now = 150.0
+        self.buffer.push("filament", 0, 2)
+        assert self.buffer.oldest_timestamp() == 100.0
+
+    def test_wraps_around(self):
+        for round_index in range(5):
+            self.buffer.push("filament", 0, round_index)
+            self.buffer.push("filament", 1, round_index)
+            assert [sample["value"] for sample in self.buffer.drain(10)] == [round_index, round_index]
+
+
+class TestTelemetryUploader(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.batches = []
+        self.accept = True
+        self.uploader = TelemetryUploader(TelemetryBuffer(capacity=16, clock=lambda: self.now), self.send_batch,
+                                          batch_size=3, max_age=10, clock=lambda: self.now)
+
+    def send_batch(self, batch):
+        self.batches.append(batch)
+        return self.accept
+
+    def test_flush_on_size(self):
+        self.uploader.push("filament", 0, 1)
+        self.uploader.push("filament", 0, 2)
+        assert not self.uploader.should_flush()
+        self.uploader.push("filament", 0, 3)
+        assert self.uploader.should_flush()
+
+        assert self.uploader.flush() == 3
+        assert len(self.batches) == 1
+        assert self.uploader.status()["queue_depth"] == 0
+
+    def test_flush_on_age(self):
+        self.uploader.push("filament", 0, 1)
+        self.now += 9
+        assert not self.uploader.should_flush()
+        self.now += 1
+        assert self.uploader.should_flush()
+        assert self.uploader.flush() == 1
+
+    def test_flush_sends_multiple_batches(self):
+        for index in range(7):
+            self.uploader.push("filament", index, index)
+        assert self.uploader.flush(force=True) == 7
+        assert [len(batch) for batch in self.batches] == [3, 3, 1]
+
+    def test_rejected_batch_requeued(self):
+        for index in range(3):
+            self.uploader.push("filament", index, index)
+        self.accept = False
+
+        assert self.uploader.flush() == 0
+        status = self.uploader.status()
+        assert status["queue_depth"] == 3
+        assert status["failed_batches"] == 1
+
+    def test_rejected_batch_spilled(self):
+        spilled = []
+        self.uploader.spill = spilled.append
+        for index in range(3):
+            self.uploader.push("filament", index, index)
+        self.accept = False
+
+        assert self.uploader.flush() == 0
+        assert [sample["key"] for sample in spilled[0]] == [0, 1, 2]
+        assert self.uploader.status()["queue_depth"] == 0
+        assert self.uploader.status()["spilled_samples"] == 3
+
+    def test_disable(self):
+        self.uploader.push("filament", 0, 1)
+        self.uploader.disable()
+        self.uploader.push("filament", 0, 2)
+        assert not self.uploader.should_flush()
+        assert self.uploader.status()["queue_depth"] == 0
+
+
+class TestPluginTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._data_folder = "test_data/telemetry"
+        self.plugin._write_persisted_data = lambda *args: None
+        self.plugin._token_manager.update({"access_token": create_fake_at(), "expires_in": 600})
+
+    @staticmethod
+    def mocked_response(status_code):
+        class MockResponse:
+            def __init__(self):
+                self.status_code = status_code
+                self.text = "{}"
+
+        return mock.MagicMock(side_effect=lambda *args, **kwargs: MockResponse())
+
+    def test_batch_uses_bearer_token(self):
+        post = self.mocked_response(200)
+        with mock.patch('requests.Session.post', post):
+            assert self.plugin._send_telemetry_batch([{"kind": "filament", "key": 0, "value": 1.0, "t": 1}])
+
+        url = post.call_args[0][0]
+        assert url.endswith("api/plugins/octoprint/telemetry")
+        assert post.call_args[1]["headers"]["Authorization"].startswith("Bearer ")
+        assert posted_json(post.call_args[1])["samples"][0]["value"] == 1.0
+
+    def test_unsupported_server_disables_telemetry(self):
+        with mock.patch('requests.Session.post', self.mocked_response(404)):
+            assert self.plugin._send_telemetry_batch([])
+        assert not self.plugin._get_telemetry().enabled
+
+    def test_filament_collected_on_change(self):
+        self.plugin._pedometer.on_gcode_sent(None, "sent", "G1 E5", None, "G1")
+        self.plugin._collect_filament_telemetry()
+        self.plugin._collect_filament_telemetry()
+
+        samples = self.plugin._get_telemetry().buffer.drain(10)
+        assert [(sample["kind"], sample["key"], sample["value"]) for sample in samples] == [("filament", 0, 5.0)]
@@ -0,0 +1,99 @@
+import unittest
+import unittest.mock as mock
+from array import array
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.temperatures import HeaterSeries, TemperatureCapture, downsample
+from tests.utils import mock_settings_custom
+
+
+class TestHeaterSeries(unittest.TestCase):
+    def test_overflow_drops_oldest(self):
+        series = HeaterSeries(capacity=4)
+        for second in range(6):
+            series.append(float(second), 200.0 + second, 210.0)
+
+        assert len(series) == 4
+        assert series.dropped == 2
+        assert series.oldest_timestamp() == 2.0
+        assert series.nbytes() == 3 * 4 * 8
+
+    def test_take_before_across_wrap(self):
+        series = HeaterSeries(capacity=4)
+        for second in range(6):
+            series.append(float(second), 200.0 + second, None)
+
+        times, actual, target = series.take_before(4.0)
+        assert list(times) == [2.0, 3.0]
+        assert list(actual) == [202.0, 203.0]
+        assert len(series) == 2
+        assert list(series.take_before(10.0)[0]) == [4.0, 5.0]
+        assert len(series) == 0
+
+
+class TestDownsample(unittest.TestCase):
+    def test_min_max_last_per_bucket(self):
+        times = array("d", [0.0, 1.0, 2.0, 10.0, 11.0, 25.0])
+        actual = array("d", [20.0, 80.0, 60.0, 190.0, 185.0, 210.0])
+        target = array("d", [float("nan"), 210.0, 210.0, 210.0, 210.0, 210.0])
+
+        assert downsample(times, actual, target, 10) == [
+            (2.0, 20.0, 80.0, 60.0, 210.0),
+            (11.0, 185.0, 190.0, 185.0, 210.0),
+            (25.0, 210.0, 210.0, 210.0, 210.0),
+        ]
+
+    def test_missing_target(self):
+        assert downsample(array("d", [1.0]), array("d", [21.5]), array("d", [float("nan")]), 10) == \
+            [(1.0, 21.5, 21.5, 21.5, None)]
+
+
+class TestTemperatureCapture(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.capture = TemperatureCapture(capacity=16, bucket_secs=10, max_heaters=2, clock=lambda: self.now)
+
+    def report(self, **heaters):
+        parsed = {heater: values for heater, values in heaters.items()}
+        assert self.capture.on_temperatures_received(None, parsed) is parsed
+        self.now += 1
+
+    def test_collects_complete_buckets_only(self):
+        for value in (200.0, 215.0, 205.0):
+            self.report(T0=(value, 210.0), B=(60.0, None))
+        assert self.capture.collect() == []
+
+        self.now = 1012.0
+        self.report(T0=(210.0, 210.0))
+        buckets = dict(self.capture.collect())
+        assert buckets["T0"] == (1002.0, 200.0, 215.0, 205.0, 210.0)
+        assert buckets["B"] == (1002.0, 60.0, 60.0, 60.0, None)
+        assert self.capture.status()["heaters"] == {"T0": 1, "B": 0}
+
+    def test_heaters_bounded(self):
+        self.report(T0=(200.0, 210.0), T1=(30.0, 0.0), B=(60.0, 60.0), C=(None, None))
+        status = self.capture.status()
+        assert sorted(status["heaters"]) == ["T0", "T1"]
+        assert status["ignored_heaters"] == 1
+        assert status["bytes"] == 2 * 3 * 16 * 8
+
+    def test_disabled(self):
+        self.capture.enabled = False
+        self.report(T0=(200.0, 210.0))
+        assert self.capture.status()["reports"] == 0
+
+
+class TestPluginTemperatures(unittest.TestCase):
+    def test_buckets_queued_as_telemetry(self):
+        plugin = FdmConnectorPlugin()
+        plugin._settings = mock.MagicMock()
+        plugin._settings.get = mock_settings_custom
+        now = [100.0]
+        plugin._temperatures = TemperatureCapture(bucket_secs=10, clock=lambda: now[0])
+        plugin._temperatures.on_temperatures_received(None, {"T0": (200.0, 210.0)})
+        plugin._temperatures.on_temperatures_received(None, {"T0": (204.0, 210.0)})
+
+        now[0] = 111.0
+        plugin._collect_temperature_telemetry()
+        samples = plugin._get_telemetry().buffer.drain(10)
+        assert samples == [dict(t=100.0, kind="temperature", key="T0", value=[200.0, 204.0, 204.0, 210.0])]
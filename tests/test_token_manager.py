@@ -0,0 +1,239 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock as mock
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import State
+from fdm_connector.token_manager import TokenManager
+from tests.utils import create_fake_at, mock_settings_custom
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenManager(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.fetches = 0
+        self.background_jobs = []
+        self.manager = TokenManager(self.fetch_token, refresh_margin=60, clock=self.clock,
+                                    wall_clock=lambda: 5000.0, run_in_background=self.background_jobs.append)
+
+    def fetch_token(self):
+        self.fetches += 1
+        self.manager.update({"access_token": create_fake_at(), "expires_in": 600})
+        return True
+
+    def test_no_token(self):
+        assert self.manager.get_token() is None
+        assert self.manager.seconds_until_expiry() is None
+
+    def test_token_valid_until_expiry(self):
+        token = create_fake_at()
+        assert self.manager.update({"access_token": token, "expires_in": 600})
+        assert self.manager.get_token() == token
+
+        self.clock.now += 600
+        assert self.manager.get_token() is None
+
+    def test_unchanged_token_reported(self):
+        token = create_fake_at()
+        assert self.manager.update({"access_token": token, "expires_in": 600})
+        assert not self.manager.update({"access_token": token, "expires_in": 600})
+
+    def test_background_refresh_ahead_of_expiry(self):
+        token = create_fake_at()
+        self.manager.update({"access_token": token, "expires_in": 600})
+
+        self.clock.now += 500
+        assert self.manager.get_token() == token
+        assert len(self.background_jobs) == 0
+
+        self.clock.now += 50
+        # Still served from memory while the refresh is scheduled, only once
+        assert self.manager.get_token() == token
+        assert self.manager.get_token() == token
+        assert len(self.background_jobs) == 1
+        assert self.fetches == 0
+
+        self.background_jobs[0]()
+        assert self.fetches == 1
+        assert not self.manager.refreshing
+        assert self.manager.get_token() != token
+
+    def test_failed_background_refresh_backs_off(self):
+        token = create_fake_at()
+        self.manager.update({"access_token": token, "expires_in": 600})
+        attempts = []
+        started = self.clock.now
+        self.manager._fetch_token = lambda: attempts.append(self.clock.now - started) and False
+
+        self.clock.now += 550
+        for _ in range(30):
+            # Token endpoint down, callers keep getting the valid token
+            assert self.manager.get_token() == token
+            while self.background_jobs:
+                self.background_jobs.pop()()
+            self.clock.now += 1
+
+        # Retried after 5, 10 and 20 seconds instead of on every call
+        assert attempts == [550, 555, 565]
+        assert self.manager.get_token() == token
+
+    def test_load_persisted_token(self):
+        token = create_fake_at()
+        assert self.manager.load({"access_token": token, "expires_in": 600, "requested_at": 4900})
+        assert self.manager.get_token() == token
+        assert self.manager.seconds_until_expiry() == 500
+
+    def test_load_expired_persisted_token(self):
+        assert not self.manager.load({"access_token": create_fake_at(), "expires_in": 600, "requested_at": 4000})
+        assert not self.manager.load({})
+        assert self.manager.get_token() is None
+
+    def test_invalid_lifetime_not_reused(self):
+        self.manager.update({"access_token": create_fake_at(), "expires_in": "invalid"})
+        assert self.manager.get_token() is None
+
+    def test_invalidate(self):
+        self.manager.update({"access_token": create_fake_at(), "expires_in": 600})
+        self.manager.invalidate()
+        assert self.manager.get_token() is None
+
+
+class TestTokenManagerConcurrency(unittest.TestCase):
+    threads = 32
+
+    def setUp(self):
+        self.fetches = 0
+        self.fetch_started = threading.Event()
+        self.release_fetch = threading.Event()
+        self.manager = TokenManager(self.slow_fetch, refresh_margin=60)
+
+    def slow_fetch(self):
+        self.fetches += 1
+        self.fetch_started.set()
+        self.release_fetch.wait(5)
+        self.manager.update({"access_token": create_fake_at(), "expires_in": 600})
+        return True
+
+    def run_threads(self, target):
+        results = []
+        barrier = threading.Barrier(self.threads)
+
+        def worker():
+            barrier.wait()
+            results.append(target())
+
+        threads = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        self.fetch_started.wait(5)
+        # Let the other threads pile up behind the fetch in flight
+        while self.manager.shared_fetches < self.threads - 1 and self.fetches == 1:
+            time.sleep(0.001)
+        self.release_fetch.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_single_fetch_in_flight(self):
+        results = self.run_threads(self.manager.refresh)
+
+        assert self.fetches == 1
+        assert results == [True] * self.threads
+
+    def test_callers_share_the_fetched_token(self):
+        results = self.run_threads(self.manager.get_or_refresh)
+
+        assert self.fetches == 1
+        assert len(set(results)) == 1
+        assert results[0] is not None
+
+    def test_failed_fetch_is_shared(self):
+        def failing_fetch():
+            self.fetches += 1
+            self.fetch_started.set()
+            self.release_fetch.wait(5)
+            raise ConnectionError("unreachable")
+
+        self.manager._fetch_token = failing_fetch
+
+        def refresh():
+            try:
+                return self.manager.refresh()
+            except ConnectionError:
+                return "raised"
+
+        results = self.run_threads(refresh)
+        assert self.fetches == 1
+        assert sorted(results, key=str) == sorted(["raised"] + [False] * (self.threads - 1), key=str)
+        assert not self.manager.refreshing
+
+
+class TestPluginTokenConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._data_folder = self.folder
+        self.posts = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def mocked_token_post(self, *args, **kwargs):
+        self.posts += 1
+        time.sleep(0.05)
+        response = mock.MagicMock(status_code=200)
+        response.text = json.dumps({"access_token": create_fake_at(), "expires_in": 600})
+        return response
+
+    def test_stress_token_and_state(self):
+        errors = []
+        barrier = threading.Barrier(24)
+
+        def announce_worker():
+            barrier.wait()
+            try:
+                for _ in range(20):
+                    assert self.plugin._token_manager.get_or_refresh() is not None
+                    self.plugin._set_state(State.SLEEP)
+            except Exception as e:
+                errors.append(e)
+
+        def flush_worker():
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    self.plugin._persistence.write(self.plugin.get_excluded_persistence_datapath())
+                    self.plugin._persistence.flush()
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch('requests.Session.post', side_effect=self.mocked_token_post):
+            threads = [threading.Thread(target=announce_worker) for _ in range(16)]
+            threads += [threading.Thread(target=flush_worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        assert errors == []
+        assert self.posts == 1
+        assert self.plugin._state == State.SLEEP
+        self.plugin._persistence.flush()
+        with open(self.plugin.get_excluded_persistence_datapath()) as f:
+            persisted = json.loads(f.read())
+        assert persisted["access_token"] == self.plugin._token_manager.get_token()
@@ -0,0 +1,212 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+import unittest.mock as mock
+
+import flask
+import pytest
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.constants import Config
+from fdm_connector.transfer import TransferError, UploadTransfers
+
+_zero_block = memoryview(bytes(64 * 1024))
+
+
+class GeneratedStream(io.RawIOBase):
+    """Request body of ``size`` bytes which is never held in memory"""
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.remaining, len(_zero_block))
+        buffer[:count] = _zero_block[:count]
+        self.remaining -= count
+        return count
+
+
+class TestUploadTransfers(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.transfers = UploadTransfers(os.path.join(self.folder, "uploads"), chunk_size=1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_chunks_are_appended(self):
+        self.transfers.begin("upload-1", "part.gcode", 10)
+        assert self.transfers.append("upload-1", 0, io.BytesIO(b"G1 X1"), 5) == 5
+        assert self.transfers.append("upload-1", 5, io.BytesIO(b"\nM84\n")) == 10
+
+        assert self.transfers.is_complete("upload-1")
+        with open(self.transfers.finish("upload-1"), "rb") as f:
+            assert f.read() == b"G1 X1\nM84\n"
+
+    def test_begin_requires_name_and_size(self):
+        with pytest.raises(TransferError):
+            self.transfers.begin("upload-1", None, 10)
+        with pytest.raises(TransferError):
+            self.transfers.begin("upload-1", "part.gcode", None)
+        with pytest.raises(TransferError):
+            self.transfers.begin("../escape", "part.gcode", 10)
+
+    def test_resume_at_wrong_offset(self):
+        self.transfers.begin("upload-1", "part.gcode", 10)
+        self.transfers.append("upload-1", 0, io.BytesIO(b"G1 X1"))
+
+        with pytest.raises(TransferError) as e:
+            self.transfers.append("upload-1", 0, io.BytesIO(b"G1 X1"))
+        assert e.value.status == 409
+        assert e.value.offset == 5
+
+    def test_resumed_upload_keeps_its_file(self):
+        self.transfers.begin("upload-1", "part.gcode", 10)
+        assert self.transfers.begin("upload-1", None, None)["filename"] == "part.gcode"
+        with pytest.raises(TransferError) as e:
+            self.transfers.begin("upload-1", "other.gcode", 10)
+        assert e.value.status == 409
+
+    def test_chunk_beyond_size(self):
+        self.transfers.begin("upload-1", "part.gcode", 4)
+        with pytest.raises(TransferError) as e:
+            self.transfers.append("upload-1", 0, io.BytesIO(b"G1 X1"), 5)
+        assert e.value.status == 416
+        with pytest.raises(TransferError):
+            self.transfers.append("upload-1", 0, io.BytesIO(b"G1 X1"))
+        assert self.transfers.offset("upload-1") == 0
+
+    def test_file_is_copied_by_the_kernel(self):
+        source_path = os.path.join(self.folder, "chunk")
+        with open(source_path, "wb") as f:
+            f.write(b"x" * 5000)
+        self.transfers.begin("upload-1", "part.gcode", 10000)
+        self.transfers.append("upload-1", 0, io.BytesIO(b"y" * 5000))
+
+        with mock.patch.object(self.transfers, "_copy_buffered") as copy_buffered:
+            assert self.transfers.append_file("upload-1", 5000, source_path) == 10000
+        copy_buffered.assert_not_called()
+        with open(self.transfers.finish("upload-1"), "rb") as f:
+            assert f.read() == b"y" * 5000 + b"x" * 5000
+
+    def test_whole_file_is_taken_over(self):
+        source_path = os.path.join(self.folder, "octoprint-file-upload.tmp")
+        with open(source_path, "wb") as f:
+            f.write(b"G28\n")
+        self.transfers.begin("upload-1", "part.gcode", 4)
+
+        assert self.transfers.append_file("upload-1", 0, source_path) == 4
+        assert not os.path.exists(source_path)
+        assert self.transfers.is_complete("upload-1")
+
+    def test_memory_is_bounded(self):
+        size = 64 * 1024 * 1024
+        self.transfers.chunk_size = 256 * 1024
+        self.transfers.begin("upload-1", "large.gcode", size)
+
+        tracemalloc.start()
+        try:
+            assert self.transfers.append("upload-1", 0, GeneratedStream(size), size) == size
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak < 2 * self.transfers.chunk_size
+
+    def test_stale_uploads_are_purged(self):
+        self.transfers.begin("upload-1", "part.gcode", 10)
+        self.transfers.begin("upload-2", "part.gcode", 10)
+        old = time.time() - 2 * self.transfers.max_age
+        os.utime(os.path.join(self.transfers.folder, "upload-1.part"), (old, old))
+
+        assert self.transfers.purge_stale() == 1
+        assert self.transfers.status("upload-1") is None
+        assert self.transfers.status("upload-2") is not None
+
+
+class TestPluginUpload(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.app = flask.Flask(__name__)
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.global_get = lambda path: "path" if path[-1] == "pathSuffix" else None
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._data_folder = self.folder
+        self.plugin._file_manager = mock.MagicMock()
+        self.plugin._file_manager.sanitize_name = lambda destination, name: name
+        self.plugin._file_manager.add_file.side_effect = self.add_file
+        self.added = {}
+        valid_file_type = mock.patch("octoprint.filemanager.valid_file_type",
+                                     lambda filename, type=None: filename.endswith(".gcode"))
+        valid_file_type.start()
+        self.addCleanup(valid_file_type.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def add_file(self, destination, path, file_object, allow_overwrite=False):
+        target = os.path.join(self.folder, "added")
+        file_object.save(target)
+        with open(target, "rb") as f:
+            self.added[path] = f.read()
+        return path
+
+    def post(self, upload_id, body, query="", headers=None):
+        with self.app.test_request_context(f"/files/upload/{upload_id}?{query}", method="POST", data=body,
+                                           headers=headers or {}):
+            result = self.plugin.upload_file_chunk(upload_id)
+        return result if isinstance(result, tuple) else (result, 200)
+
+    def test_resumable_upload(self):
+        response, status = self.post("abc", b"G28\n", "filename=cube.gcode&size=8")
+        assert status == 200
+        assert response["offset"] == 4
+        assert not response["complete"]
+
+        # Connection dropped, the client asks where to continue
+        with self.app.test_request_context("/files/upload/abc"):
+            assert self.plugin.get_upload_status("abc")["offset"] == 4
+
+        response, status = self.post("abc", b"M84\n", headers={"Content-Range": "bytes 4-7/8"})
+        assert status == 200
+        assert response["complete"]
+        assert self.added == {"cube.gcode": b"G28\nM84\n"}
+        with self.app.test_request_context("/files/upload/abc"):
+            assert self.plugin.get_upload_status("abc")[1] == 404
+
+    def test_wrong_offset_reports_current_offset(self):
+        self.post("abc", b"G28\n", "filename=cube.gcode&size=8")
+        response, status = self.post("abc", b"M84\n", headers={"Content-Range": "bytes 0-3/8"})
+        assert status == 409
+        assert response["offset"] == 4
+
+    def test_multipart_spooled_by_octoprint(self):
+        spooled = os.path.join(self.folder, "octoprint-file-upload-1.tmp")
+        with open(spooled, "wb") as f:
+            f.write(b"G28\n")
+        response, status = self.post("abc", {"file.path": spooled, "filename": "cube.gcode", "size": "4"})
+        assert status == 200
+        assert response["complete"]
+        assert self.added == {"cube.gcode": b"G28\n"}
+
+    def test_request_size_capped(self):
+        # OctoPrint holds raw bodies in memory, only chunks up to the cap are let through to the route
+        assert self.plugin.increase_upload_bodysize_hook([]) == \
+            [("POST", r"/files/upload/.*", Config.transfer_max_request_bytes)]
+
+        body = bytes(Config.transfer_max_request_bytes + 1)
+        response, status = self.post("abc", body, f"filename=cube.gcode&size={len(body)}")
+        assert status == 413
+        with self.app.test_request_context("/files/upload/abc"):
+            assert self.plugin.get_upload_status("abc")[1] == 404
+
+    def test_rejects_non_gcode(self):
+        _, status = self.post("abc", b"#!/bin/sh", "filename=run.sh&size=9")
+        assert status == 415
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import struct
+import threading
+import unittest
+import unittest.mock as mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.tunnel import FrameType, TunnelClient, TunnelProtocolError, encode_frame, read_frame
+from tests.utils import mock_settings_get
+
+tunnel_route = "api/plugins/octoprint/tunnel"
+
+
+class LocalOctoPrintHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        size = int(self.path.rpartition("size=")[2]) if "size=" in self.path else 0
+        body = json.dumps({"path": self.path}).encode("utf-8") if not size else b"x" * size
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        received = self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"received": len(received)}).encode("utf-8")
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer:
+    """FDM Monster side of the tunnel: accepts the upgrade and exposes the frame stream to the test"""
+
+    def __init__(self, accept=True):
+        self.accept = accept
+        self.connected = asyncio.Event()
+        self.authorization = None
+        self.reader = None
+        self.writer = None
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        self.authorization = [line for line in head.split("\r\n") if line.startswith("Authorization")][0]
+        if not self.accept:
+            writer.write(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: fdm-tunnel/1\r\nConnection: Upgrade\r\n\r\n")
+        await writer.drain()
+        self.reader, self.writer = reader, writer
+        self.connected.set()
+
+    def send(self, frame_type, stream_id, payload=b""):
+        self.writer.write(encode_frame(frame_type, stream_id, payload))
+
+    def open(self, stream_id, method, path, headers=None):
+        request = {"method": method, "path": path, "headers": headers or [], "end": method == "GET"}
+        self.send(FrameType.OPEN, stream_id, json.dumps(request).encode("utf-8"))
+
+    async def receive(self, timeout=5):
+        return await asyncio.wait_for(read_frame(self.reader), timeout)
+
+    async def collect_responses(self, count, grant=True):
+        """Read frames until ``count`` streams ended, granting window for all received data"""
+        responses = {}
+        ended = 0
+        while ended < count:
+            frame_type, stream_id, payload = await self.receive()
+            response = responses.setdefault(stream_id, {"status": None, "body": b""})
+            if frame_type == FrameType.RESPONSE:
+                response["status"] = json.loads(payload.decode("utf-8"))["status"]
+            elif frame_type == FrameType.DATA:
+                response["body"] += payload
+                if grant:
+                    self.send(FrameType.WINDOW_UPDATE, stream_id, struct.pack(">I", len(payload)))
+            elif frame_type in (FrameType.END, FrameType.RESET):
+                response["reset"] = frame_type == FrameType.RESET
+                ended += 1
+        return responses
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.server.close()
+
+
+class TestTunnelClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.local = ThreadingHTTPServer(("127.0.0.1", 0), LocalOctoPrintHandler)
+        cls.local_thread = threading.Thread(target=cls.local.serve_forever, daemon=True)
+        cls.local_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.local.shutdown()
+        cls.local.server_close()
+
+    def run_tunnel(self, scenario, accept=True, **kwargs):
+        async def main():
+            server = StandInServer(accept)
+            port = await server.start()
+            client = TunnelClient("127.0.0.1", port, tunnel_route, "127.0.0.1", self.local.server_address[1],
+                                  lambda: "token", **kwargs)
+            task = asyncio.ensure_future(client.run_once())
+            try:
+                await asyncio.wait_for(server.connected.wait(), 5)
+                return await scenario(server, client)
+            finally:
+                server.close()
+                await asyncio.wait_for(asyncio.gather(task, return_exceptions=True), 5)
+
+        return asyncio.run(main())
+
+    def test_concurrent_streams_share_one_connection(self):
+        async def scenario(server, client):
+            for stream_id in range(1, 9):
+                server.open(stream_id, "GET", f"/api/job?stream={stream_id}")
+            responses = await server.collect_responses(8)
+            assert client.status()["connects"] == 1
+            assert client.status()["streams_total"] == 8
+            return responses
+
+        responses = self.run_tunnel(scenario)
+        for stream_id in range(1, 9):
+            assert responses[stream_id]["status"] == 200
+            assert json.loads(responses[stream_id]["body"])["path"] == f"/api/job?stream={stream_id}"
+
+    def test_request_body_is_proxied_within_window(self):
+        body = b"g" * 10000
+
+        async def scenario(server, client):
+            server.open(1, "POST", "/api/files/local", [["Content-Length", str(len(body))]])
+            window = 4096
+            sent = 0
+            while sent < len(body):
+                chunk = body[sent:sent + window]
+                server.send(FrameType.DATA, 1, chunk)
+                sent += len(chunk)
+                window -= len(chunk)
+                while window <= 0:
+                    frame_type, stream_id, payload = await server.receive()
+                    assert frame_type == FrameType.WINDOW_UPDATE
+                    window += struct.unpack(">I", payload)[0]
+            server.send(FrameType.END, 1)
+            return await server.collect_responses(1)
+
+        responses = self.run_tunnel(scenario, window=4096)
+        assert responses[1]["status"] == 201
+        assert json.loads(responses[1]["body"])["received"] == len(body)
+
+    def test_response_waits_for_window(self):
+        async def scenario(server, client):
+            server.open(1, "GET", "/webcam/?size=20000")
+            received = 0
+            while received < 4096:
+                frame_type, _, payload = await server.receive()
+                if frame_type == FrameType.DATA:
+                    received += len(payload)
+            # Window exhausted, the connector has to wait for a grant
+            with self.assertRaises(asyncio.TimeoutError):
+                await server.receive(timeout=0.2)
+            server.send(FrameType.WINDOW_UPDATE, 1, struct.pack(">I", received))
+            responses = await server.collect_responses(1)
+            return received + len(responses[1]["body"])
+
+        assert self.run_tunnel(scenario, window=4096, max_frame=1024) == 20000
+
+    def test_window_violation_resets_stream(self):
+        async def scenario(server, client):
+            server.open(1, "POST", "/api/files/local", [["Content-Length", "8192"]])
+            server.send(FrameType.DATA, 1, b"x" * 1024)
+            server.send(FrameType.DATA, 1, b"x" * 1024)
+            while True:
+                frame_type, stream_id, _ = await server.receive()
+                if frame_type == FrameType.RESET:
+                    return stream_id, client.status()
+
+        stream_id, status = self.run_tunnel(scenario, window=1024)
+        assert stream_id == 1
+        assert status["active_streams"] == 0
+        assert status["streams_reset"] == 1
+
+    def test_stream_limit(self):
+        async def scenario(server, client):
+            server.open(1, "POST", "/api/files/local", [["Content-Length", "10"]])
+            server.open(2, "GET", "/api/version")
+            frame_type, stream_id, _ = await server.receive()
+            return frame_type, stream_id
+
+        assert self.run_tunnel(scenario, max_streams=1) == (FrameType.RESET, 2)
+
+    def test_ping(self):
+        async def scenario(server, client):
+            server.send(FrameType.PING, 0, b"12345678")
+            return await server.receive(), server.authorization
+
+        frame, authorization = self.run_tunnel(scenario)
+        assert frame == (FrameType.PONG, 0, b"12345678")
+        assert authorization == "Authorization: Bearer token"
+
+    def test_refused_upgrade(self):
+        async def main():
+            server = StandInServer(accept=False)
+            port = await server.start()
+            client = TunnelClient("127.0.0.1", port, tunnel_route, "127.0.0.1", 1, lambda: "token")
+            try:
+                await client.run_once()
+            finally:
+                server.close()
+
+        with self.assertRaises(TunnelProtocolError):
+            asyncio.run(main())
+
+
+class TestPluginTunnel(unittest.TestCase):
+    def test_disabled_by_default(self):
+        plugin = FdmConnectorPlugin()
+        plugin._settings = mock.MagicMock()
+        plugin._settings.get = mock_settings_get
+        assert plugin.get_settings_defaults()["tunnel_enabled"] is False
+
+        plugin._configure_tunnel()
+        assert plugin._tunnel is None
+        assert plugin.get_connector_state()["tunnel"] is None
+
+    def test_settings_change_replaces_tunnel(self):
+        values = {"tunnel_enabled": True, "fdm_host": "http://fdm.local", "fdm_port": 4000}
+        plugin = FdmConnectorPlugin()
+        plugin._settings = mock.MagicMock()
+        plugin._settings.get = lambda accessor: values.get(accessor[0])
+        plugin._settings.global_get = lambda accessor: 5000 if accessor == ["server", "port"] else None
+        plugin._logger = mock.MagicMock()
+
+        async def idle(tunnel):
+            await asyncio.sleep(3600)
+
+        plugin._engine.start()
+        try:
+            with mock.patch.object(TunnelClient, "run_forever", idle):
+                plugin._configure_tunnel()
+                first, first_future = plugin._tunnel, plugin._tunnel_future
+                plugin._reload_settings()
+                plugin._configure_tunnel()
+                assert plugin._tunnel is first
+
+                values["fdm_host"] = "https://fdm.example.com"
+                plugin._reload_settings()
+                plugin._configure_tunnel()
+                assert plugin._tunnel is not first
+                assert (plugin._tunnel.host, plugin._tunnel.port, plugin._tunnel.use_ssl) == \
+                    ("fdm.example.com", 4000, True)
+                assert first_future.cancelled()
+                assert (plugin._tunnel.local_host, plugin._tunnel.local_port) == ("127.0.0.1", 5000)
+
+                values["tunnel_enabled"] = False
+                plugin._reload_settings()
+                plugin._configure_tunnel()
+                assert plugin._tunnel is None
+        finally:
+            plugin._engine.stop()
@@ -0,0 +1,134 @@
+import gzip
+import json
+import unittest
+import unittest.mock as mock
+import zlib
+
+from fdm_connector import FdmConnectorPlugin
+from fdm_connector.wire import WireEncoder, WireEncoding, pack_compact, unpack_compact
+from tests.utils import create_fake_at, mock_settings_custom
+
+
+def samples(count):
+    return {"deviceUuid": "device", "samples": [dict(t=1700000000.5 + index, kind="filament", key=index % 2,
+                                                     value=index * 0.25) for index in range(count)]}
+
+
+class TestCompactEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        payload = {"deviceUuid": "device", "port": 5000, "docker": False, "extra": None,
+                   "values": [0, -1, -33, 127, 128, 70000, -70000, 2 ** 40, -2 ** 40, 1.5, True, "é" * 40, "x" * 300],
+                   "nested": {str(index): index for index in range(20)}}
+        assert unpack_compact(pack_compact(payload)) == payload
+
+    def test_known_fields_are_indexed(self):
+        body = pack_compact({"deviceUuid": "a"})
+        # fixmap of one entry, field 0, fixstr of one byte
+        assert body == b"\x81\x00\xa1a"
+
+    def test_smaller_than_json(self):
+        payload = samples(200)
+        assert len(pack_compact(payload)) < 0.6 * len(json.dumps(payload, separators=(",", ":")))
+
+    def test_trailing_bytes_rejected(self):
+        with self.assertRaises(ValueError):
+            unpack_compact(pack_compact({}) + b"\x00")
+
+
+class TestWireEncoder(unittest.TestCase):
+    def setUp(self):
+        self.encoder = WireEncoder(min_bytes=256)
+        self.negotiations = 0
+
+    def negotiate(self, encodings):
+        def query():
+            self.negotiations += 1
+            return encodings
+        return query
+
+    def test_small_bodies_stay_plain_without_negotiating(self):
+        body, headers = self.encoder.encode({"deviceUuid": "device"}, negotiate=self.negotiate(["gzip"]))
+        assert json.loads(body) == {"deviceUuid": "device"}
+        assert headers == {"Content-Type": "application/json"}
+        assert self.negotiations == 0
+        assert self.encoder.encoding is None
+
+    def test_negotiates_once(self):
+        negotiate = self.negotiate(["compact/1"])
+        body, headers = self.encoder.encode(samples(20), negotiate=negotiate)
+        self.encoder.encode(samples(20), negotiate=negotiate)
+        assert self.negotiations == 1
+        assert headers["Content-Type"].startswith("application/msgpack")
+        assert unpack_compact(body) == samples(20)
+
+    def test_gzip_and_deflate(self):
+        body, headers = self.encoder.encode(samples(20), negotiate=self.negotiate(["compact/1", "deflate", "gzip"]))
+        assert headers["Content-Encoding"] == "gzip"
+        assert json.loads(gzip.decompress(body)) == samples(20)
+        # Small bodies are not worth compressing
+        assert "Content-Encoding" not in self.encoder.encode({"deviceUuid": "device"})[1]
+
+        encoder = WireEncoder(preferred=WireEncoding.DEFLATE, min_bytes=256)
+        body, headers = encoder.encode(samples(20), negotiate=self.negotiate(["gzip", "deflate", "compact/1"]))
+        assert headers["Content-Encoding"] == "deflate"
+        assert json.loads(zlib.decompress(body)) == samples(20)
+
+    def test_unsupported_server_gets_json(self):
+        body, headers = self.encoder.encode(samples(20), negotiate=self.negotiate([]))
+        assert "Content-Encoding" not in headers
+        assert self.encoder.encoding == WireEncoding.JSON
+
+    def test_unreachable_server_negotiates_again(self):
+        self.encoder.encode(samples(20), negotiate=self.negotiate(None))
+        assert self.encoder.encoding is None
+        self.encoder.encode(samples(20), negotiate=self.negotiate(["gzip"]))
+        assert self.negotiations == 2
+        assert self.encoder.encoding == WireEncoding.GZIP
+
+    def test_json_setting_never_negotiates(self):
+        self.encoder.reset(WireEncoding.JSON)
+        self.encoder.encode(samples(20), negotiate=self.negotiate(["compact/1"]))
+        assert self.negotiations == 0
+
+
+class TestPluginWireEncoding(unittest.TestCase):
+    def setUp(self):
+        self.plugin = FdmConnectorPlugin()
+        self.plugin._settings = mock.MagicMock()
+        self.plugin._settings.get = mock_settings_custom
+        self.plugin._logger = mock.MagicMock()
+        self.plugin._wire.min_bytes = 256
+        self.posts = []
+
+    @staticmethod
+    def response(status_code, data=None):
+        return mock.MagicMock(status_code=status_code, text=json.dumps(data or {}))
+
+    def mocked_post(self, status_codes):
+        def post(url, **kwargs):
+            self.posts.append(kwargs)
+            return self.response(status_codes.pop(0))
+        return post
+
+    def test_version_handshake(self):
+        get = mock.MagicMock(return_value=self.response(200, {"version": "1.9", "wireEncodings": ["gzip"]}))
+        with mock.patch('requests.Session.get', get), \
+                mock.patch('requests.Session.post', side_effect=self.mocked_post([200])):
+            self.plugin._post_payload("https://fdm/api", {"Authorization": "Bearer " + create_fake_at()}, samples(20),
+                                      "telemetry")
+
+        assert get.call_args[0][0].endswith("/api/version")
+        assert self.posts[0]["headers"]["Content-Encoding"] == "gzip"
+        assert self.posts[0]["headers"]["Authorization"].startswith("Bearer ")
+        assert self.plugin._wire.status()["encoding"] == "gzip"
+
+    def test_rejected_encoding_falls_back_to_json(self):
+        self.plugin._wire.reset()
+        self.plugin._wire.encode(samples(20), negotiate=lambda: ["compact/1"])
+        with mock.patch('requests.Session.post', side_effect=self.mocked_post([415, 200])):
+            response = self.plugin._post_payload("https://fdm/api", {}, samples(20), "telemetry")
+
+        assert response.status_code == 200
+        assert self.posts[1]["headers"]["Content-Type"] == "application/json"
+        assert json.loads(self.posts[1]["data"]) == samples(20)
+        assert self.plugin._wire.encoding == WireEncoding.JSON
@@ -1,3 +1,4 @@
+import json
 from random import choice
 from string import ascii_uppercase
 
@@ -43,5 +44,10 @@ def mock_settings_get_int(accessor):
     return None
 
 
+def posted_json(call_kwargs):
+    """Payload of a mocked Session.post call, sent as a plain JSON body"""
+    return json.loads(call_kwargs["data"])
+
+
 def create_fake_at():
     return ''.join(choice(ascii_uppercase) for i in range(Config.access_token_length))